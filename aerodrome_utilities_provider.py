@@ -34,6 +34,8 @@ from qgis.core import QgsProcessingProvider
 from .taxiway_widen_algorithm import TaxiwayWidenerAlgorithm
 from .polygon_to_singlepart_algorithm import PolygonToSinglePartLinesAlgorithm
 from .fetch_osm_data_algorithm import FetchOSMDataAlgorithm
+from .batch_fetch_osm_data_algorithm import BatchFetchOSMDataAlgorithm
+from .prefetch_osm_data_algorithm import PrefetchOSMDataAlgorithm
 from .geojson_to_topsky_groundradar import GeojsonToTopskyGroundradar
 from .split_taxiway_algorithm import SplitTaxiwayAlgorithm
 from .colorize_algorithm import ColorizeAlgorithm
@@ -61,6 +63,8 @@ class AerodromeUtilitiesProvider(QgsProcessingProvider):
         self.addAlgorithm(TaxiwayWidenerAlgorithm())
         self.addAlgorithm(PolygonToSinglePartLinesAlgorithm())
         self.addAlgorithm(FetchOSMDataAlgorithm())
+        self.addAlgorithm(BatchFetchOSMDataAlgorithm())
+        self.addAlgorithm(PrefetchOSMDataAlgorithm())
         self.addAlgorithm(GeojsonToTopskyGroundradar())
         self.addAlgorithm(SplitTaxiwayAlgorithm())
         self.addAlgorithm(ColorizeAlgorithm())
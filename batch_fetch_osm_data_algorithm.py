@@ -0,0 +1,231 @@
+# -*- coding: utf-8 -*-
+
+"""
+/***************************************************************************
+ AerodromeUtilities
+                                 A QGIS plugin
+ Fetches OSM Data and processes it for aerodroms with various algorithms
+ Generated by Plugin Builder: http://g-sherman.github.io/Qgis-Plugin-Builder/
+                              -------------------
+        begin                : 2024-09-08
+        copyright            : (C) 2024 by Aiden Omondi
+        email                : helpertech83@gmail.com
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+import json
+import os
+import re
+from collections import deque
+
+import processing
+from qgis.PyQt.QtCore import QCoreApplication
+from qgis.core import (
+	QgsProcessingAlgorithm,
+	QgsProcessingContext,
+	QgsProcessingException,
+	QgsProcessingFeedback,
+	QgsProcessingParameterBoolean,
+	QgsProcessingParameterFile,
+	QgsProcessingParameterFolderDestination,
+	QgsProcessingParameterNumber,
+	QgsProcessingParameterString,
+)
+
+from .color_profile import ColorProfileError, load_color_profile
+from .fetch_osm_data_algorithm import FetchOSMDataAlgorithm
+
+
+class BatchFetchOSMDataAlgorithm(QgsProcessingAlgorithm):
+
+	ICAO_CODES = 'ICAO_CODES'
+	ICAO_FILE = 'ICAO_FILE'
+	OUTPUT_DIR = 'OUTPUT_DIR'
+	RESUME = 'RESUME'
+	MAX_ATTEMPTS = 'MAX_ATTEMPTS'
+
+	STATE_FILE = 'batch_state.json'
+
+	# Parameters forwarded unchanged to every per-airport fetch
+	FORWARDED_PARAMETERS = [
+		FetchOSMDataAlgorithm.AUTO_WIDEN_TAXIWAYS,
+		FetchOSMDataAlgorithm.AUTO_WIDEN_TAXIWAYS_WIDTH,
+		FetchOSMDataAlgorithm.AUTO_WIDEN_TAXIWAYS_WIDTH_EXPRESSION,
+		FetchOSMDataAlgorithm.AUTO_WIDEN_TAXIWAYS_CODE_LETTER,
+		FetchOSMDataAlgorithm.AUTO_WIDEN_TAXIWAYS_DISSOLVE,
+		FetchOSMDataAlgorithm.AUTO_WIDEN_TAXIWAYS_KEEP_CENTERLINE,
+		FetchOSMDataAlgorithm.SPLIT_TAXIWAYS,
+		FetchOSMDataAlgorithm.COLOR_PROFILE,
+		FetchOSMDataAlgorithm.BATCHED_FETCH,
+		FetchOSMDataAlgorithm.AREA_QUERY,
+		FetchOSMDataAlgorithm.DOWNLOAD_CONCURRENCY,
+		FetchOSMDataAlgorithm.QUERY_TIMEOUT,
+		FetchOSMDataAlgorithm.TILE_SIZE,
+		FetchOSMDataAlgorithm.CACHE_DIR,
+		FetchOSMDataAlgorithm.CACHE_TTL,
+		FetchOSMDataAlgorithm.CACHE_MAX_SIZE,
+		FetchOSMDataAlgorithm.FORCE_REFRESH,
+		FetchOSMDataAlgorithm.OVERPASS_SERVERS,
+		FetchOSMDataAlgorithm.WAIT_FOR_SLOTS,
+		FetchOSMDataAlgorithm.OSM_EXTRACT,
+		FetchOSMDataAlgorithm.LAYER_OUTPUT,
+		FetchOSMDataAlgorithm.REFRESH,
+		FetchOSMDataAlgorithm.LAYER_GROUP,
+		FetchOSMDataAlgorithm.WRITE_METRICS,
+	]
+
+	def initAlgorithm(self, config=None):
+		self.addParameter(QgsProcessingParameterString(self.ICAO_CODES, 'ICAO Codes (comma or space separated)', optional=True))
+		self.addParameter(QgsProcessingParameterFile(self.ICAO_FILE, 'ICAO Code List (text file or QuickOSM step JSON)', optional=True))
+		self.addParameter(QgsProcessingParameterFolderDestination(self.OUTPUT_DIR, 'Output Directory'))
+		self.addParameter(QgsProcessingParameterBoolean(self.RESUME, 'Skip airports completed by a previous run (not when refreshing)', defaultValue=True))
+		self.addParameter(QgsProcessingParameterNumber(self.MAX_ATTEMPTS, 'Attempts per airport', defaultValue=2, minValue=1))
+
+		# Per-airport fetch options, mirroring FetchOSMDataAlgorithm
+		fetch_algorithm = FetchOSMDataAlgorithm()
+		fetch_algorithm.initAlgorithm()
+		for name in self.FORWARDED_PARAMETERS:
+			parameter = fetch_algorithm.parameterDefinition(name).clone()
+			if name in (FetchOSMDataAlgorithm.BATCHED_FETCH, FetchOSMDataAlgorithm.WAIT_FOR_SLOTS, FetchOSMDataAlgorithm.LAYER_GROUP):
+				parameter.setDefaultValue(True)
+			self.addParameter(parameter)
+
+	def processAlgorithm(self, parameters, context: QgsProcessingContext, feedback: QgsProcessingFeedback):
+		output_dir = self.parameterAsString(parameters, self.OUTPUT_DIR, context)
+		resume = self.parameterAsBoolean(parameters, self.RESUME, context)
+		max_attempts = self.parameterAsInt(parameters, self.MAX_ATTEMPTS, context)
+
+		icao_codes = self.read_icao_codes(
+			self.parameterAsString(parameters, self.ICAO_CODES, context),
+			self.parameterAsString(parameters, self.ICAO_FILE, context)
+		)
+		if not icao_codes:
+			raise QgsProcessingException('No ICAO codes given.')
+
+		# A broken colour profile would fail every airport, check it up front
+		try:
+			load_color_profile(self.parameterAsString(parameters, FetchOSMDataAlgorithm.COLOR_PROFILE, context))
+		except ColorProfileError as e:
+			raise QgsProcessingException(str(e))
+
+		os.makedirs(output_dir, exist_ok=True)
+		state_path = os.path.join(output_dir, self.STATE_FILE)
+		state = self.load_state(state_path) if resume else {'completed': [], 'failed': {}}
+
+		# A refresh brings every airport up to date, so airports completed by
+		# an earlier run still need it
+		if resume and state['completed'] and self.parameterAsBoolean(parameters, FetchOSMDataAlgorithm.REFRESH, context):
+			feedback.pushInfo("Refreshing every airport, including those completed by a previous run")
+			state['completed'] = []
+
+		pending = deque((icao_code, 1) for icao_code in icao_codes if icao_code not in state['completed'])
+		skipped = len(icao_codes) - len(pending)
+		if skipped:
+			feedback.pushInfo(f"Skipping {skipped} airport(s) completed by a previous run")
+
+		fetch_parameters = {name: parameters[name] for name in self.FORWARDED_PARAMETERS if name in parameters}
+		done = skipped
+
+		# Failed airports go to the back of the queue so one flaky aerodrome
+		# does not hold up the rest of the batch
+		while pending:
+			if feedback.isCanceled():
+				break
+
+			icao_code, attempt = pending.popleft()
+			airport_dir = os.path.join(output_dir, icao_code)
+			os.makedirs(airport_dir, exist_ok=True)
+			feedback.pushInfo(f"[{done + 1}/{len(icao_codes)}] Fetching {icao_code} (attempt {attempt})")
+
+			error = None
+			try:
+				result = processing.run("aerodromeutilities:fetchosmdata", {
+					**fetch_parameters,
+					FetchOSMDataAlgorithm.ICAO_CODE: icao_code,
+					FetchOSMDataAlgorithm.OUTPUT_DIR: airport_dir,
+					FetchOSMDataAlgorithm.SPLIT_TAXIWAYS_OUTPUT: os.path.join(airport_dir, 'split_taxiways'),
+				}, context=context, feedback=feedback, is_child_algorithm=True)
+				if 'Output directory' not in result:
+					error = 'fetch returned no output'
+			except QgsProcessingException as e:
+				error = str(e)
+
+			# The fetch returns no output when canceled, which is not a
+			# failure of the airport, so it stays pending for a resume
+			if error is not None and feedback.isCanceled():
+				break
+
+			if error is None:
+				state['completed'].append(icao_code)
+				state['failed'].pop(icao_code, None)
+				done += 1
+			elif attempt < max_attempts:
+				feedback.reportError(f"{icao_code} failed ({error}), will retry")
+				pending.append((icao_code, attempt + 1))
+			else:
+				feedback.reportError(f"{icao_code} failed ({error}), giving up")
+				state['failed'][icao_code] = error
+				done += 1
+
+			self.save_state(state_path, state)
+			feedback.setProgress(100 * done / len(icao_codes))
+
+		feedback.pushInfo(f"Completed {len(state['completed'])} airport(s), {len(state['failed'])} failed")
+		return {self.OUTPUT_DIR: output_dir}
+
+	def read_icao_codes(self, icao_codes, icao_file):
+		""" Collects unique ICAO codes from the text parameter and list file, in order """
+		codes = re.split(r'[\s,;]+', icao_codes or '')
+
+		if icao_file:
+			with open(icao_file, 'r') as f:
+				if icao_file.lower().endswith('.json'):
+					# QuickOSM step files store the value wrapped in quotes
+					codes += [block["PARAMETERS"]["VALUE"][1:][:-1] for block in json.load(f)]
+				else:
+					for line in f:
+						codes += re.split(r'[\s,;]+', line.split('#')[0])
+
+		unique_codes = []
+		for code in codes:
+			code = code.strip().upper()
+			if code and code not in unique_codes:
+				unique_codes.append(code)
+		return unique_codes
+
+	def load_state(self, state_path):
+		if not os.path.exists(state_path):
+			return {'completed': [], 'failed': {}}
+		with open(state_path, 'r') as f:
+			return json.load(f)
+
+	def save_state(self, state_path, state):
+		with open(state_path, 'w') as f:
+			json.dump(state, f, indent=2)
+
+	def name(self):
+		return 'batchfetchosmdata'
+
+	def displayName(self):
+		return 'Batch Fetch OSM Data'
+
+	def group(self):
+		return self.tr(self.groupId())
+
+	def groupId(self):
+		return ''
+
+	def tr(self, string):
+		return QCoreApplication.translate('Processing', string)
+
+	def createInstance(self):
+		return BatchFetchOSMDataAlgorithm()
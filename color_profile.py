@@ -0,0 +1,173 @@
+# -*- coding: utf-8 -*-
+
+"""
+/***************************************************************************
+ AerodromeUtilities
+                                 A QGIS plugin
+ Fetches OSM Data and processes it for aerodroms with various algorithms
+ Generated by Plugin Builder: http://g-sherman.github.io/Qgis-Plugin-Builder/
+                              -------------------
+        begin                : 2024-09-08
+        copyright            : (C) 2024 by Aiden Omondi
+        email                : helpertech83@gmail.com
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+import json
+import os
+from functools import lru_cache
+
+from qgis.PyQt.QtGui import QColor
+from qgis.core import QgsSingleSymbolRenderer, QgsSymbol
+
+# Compiled profiles keyed by (path, mtime), so an unchanged file is parsed once
+_profiles = {}
+
+
+class ColorProfileError(Exception):
+	pass
+
+
+def parse_color(value, name):
+	"""
+	Parses an "r,g,b" colour string into a tuple of ints.
+	"""
+	try:
+		components = tuple(int(component) for component in str(value).split(','))
+	except ValueError:
+		components = ()
+	if len(components) != 3 or not all(0 <= component <= 255 for component in components):
+		raise ColorProfileError(f'Invalid color "{value}" for {name}, expected "r,g,b"')
+	return components
+
+
+class ColorEntry:
+	"""
+	A validated colour profile entry: the layer colour, its TopSky and
+	GroundRadar colour names, and a symbol per geometry type built on first
+	use.
+	"""
+
+	def __init__(self, name, color, ts_color=None, gr_color=None):
+		self.name = name
+		self.rgb = parse_color(color, name)
+		# Stored in layer custom properties in the same form as the profile
+		self.color = ','.join(str(component) for component in self.rgb)
+		self.ts_color = ts_color
+		self.gr_color = gr_color
+		self.qcolor = QColor.fromRgb(*self.rgb)
+		self.symbols = {}
+
+	@staticmethod
+	def from_layer(layer):
+		"""
+		Returns the entry stored in a layer's custom properties, or None when
+		the layer has no colour.
+		"""
+		color = layer.customProperty('color', None)
+		if not color:
+			return None
+		return compile_entry(layer.name(), color, layer.customProperty('ts_color', None), layer.customProperty('gr_color', None))
+
+	def symbol(self, geometry_type):
+		if geometry_type not in self.symbols:
+			symbol = QgsSymbol.defaultSymbol(geometry_type)
+			if symbol is None:
+				return None
+			symbol.setColor(self.qcolor)
+			self.symbols[geometry_type] = symbol
+		return self.symbols[geometry_type].clone()
+
+	def apply(self, layer):
+		"""
+		Colours a layer and stores the colours in its custom properties.
+		"""
+		layer.setCustomProperty('color', self.color)
+		if self.ts_color is not None:
+			layer.setCustomProperty('ts_color', self.ts_color)
+		if self.gr_color is not None:
+			layer.setCustomProperty('gr_color', self.gr_color)
+
+		symbol = self.symbol(layer.geometryType())
+		if symbol is not None:
+			layer.setRenderer(QgsSingleSymbolRenderer(symbol))
+
+
+@lru_cache(maxsize=256)
+def compile_entry(name, color, ts_color=None, gr_color=None):
+	return ColorEntry(name, color, ts_color, gr_color)
+
+
+class ColorProfile:
+	"""
+	A colour profile, mapping feature types (and "background" for the
+	aerodrome) to colour entries. An empty profile colours nothing.
+	"""
+
+	def __init__(self, entries=None):
+		self.entries = entries or {}
+
+	@classmethod
+	def from_dict(cls, data):
+		"""
+		Validates and compiles a parsed profile of the form
+		{"colors": {"<feature>": {"color": "r,g,b", "ts_color": ..., "gr_color": ...}}}.
+		"""
+		colors = data.get('colors') if isinstance(data, dict) else None
+		if not isinstance(colors, dict):
+			raise ColorProfileError('Color profile has no "colors" object')
+
+		entries = {}
+		for name, entry in colors.items():
+			if not isinstance(entry, dict) or 'color' not in entry:
+				raise ColorProfileError(f'Color profile entry {name} has no "color"')
+			for key in ('ts_color', 'gr_color'):
+				if entry.get(key) is not None and not isinstance(entry[key], str):
+					raise ColorProfileError(f'{key} of color profile entry {name} must be a string')
+			entries[name] = compile_entry(name, entry['color'], entry.get('ts_color'), entry.get('gr_color'))
+		return cls(entries)
+
+	def get(self, name):
+		return self.entries.get(name)
+
+	def apply(self, name, layers):
+		"""
+		Colours every layer with the entry for name, if the profile has one.
+		"""
+		entry = self.entries.get(name)
+		if entry is None:
+			return
+		for layer in layers:
+			entry.apply(layer)
+
+
+def load_color_profile(path):
+	"""
+	Loads, validates and compiles a colour profile file, reusing the
+	compiled profile while the file is unchanged. Raises ColorProfileError
+	for unreadable or invalid profiles.
+	"""
+	if not path:
+		return ColorProfile()
+	try:
+		key = (os.path.abspath(path), os.path.getmtime(path))
+	except OSError as e:
+		raise ColorProfileError(f'Cannot read color profile {path}: {e}')
+
+	if key not in _profiles:
+		try:
+			with open(path, 'r') as f:
+				data = json.load(f)
+		except (OSError, ValueError) as e:
+			raise ColorProfileError(f'Cannot read color profile {path}: {e}')
+		_profiles[key] = ColorProfile.from_dict(data)
+	return _profiles[key]
@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+
+"""
+/***************************************************************************
+ AerodromeUtilities
+                                 A QGIS plugin
+ Fetches OSM Data and processes it for aerodroms with various algorithms
+ Generated by Plugin Builder: http://g-sherman.github.io/Qgis-Plugin-Builder/
+                              -------------------
+        begin                : 2024-09-08
+        copyright            : (C) 2024 by Aiden Omondi
+        email                : helpertech83@gmail.com
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+import json
+import threading
+import time
+from contextlib import contextmanager
+
+
+class FetchMetrics:
+	"""
+	Wall-clock timers and counters for the phases of a fetch.
+
+	Phases may be timed on several threads at once. A count is added to the
+	phase its thread is timing, or, on helper threads timing none, to the
+	phase open on the thread that created the metrics.
+	"""
+
+	def __init__(self):
+		self.phases = {}
+		self.lock = threading.Lock()
+		self.local = threading.local()
+		self.owner = threading.get_ident()
+		self.owner_phase = None
+		self.started = time.perf_counter()
+
+	def _entry(self, name):
+		return self.phases.setdefault(name, {'seconds': 0.0, 'calls': 0})
+
+	def current_phase(self):
+		return getattr(self.local, 'phase', None) or self.owner_phase or 'other'
+
+	@contextmanager
+	def phase(self, name):
+		"""
+		Times the block as the named phase. Time of repeated phases adds up.
+		"""
+		previous = getattr(self.local, 'phase', None)
+		self.local.phase = name
+		if threading.get_ident() == self.owner:
+			self.owner_phase = name
+		started = time.perf_counter()
+		try:
+			yield
+		finally:
+			elapsed = time.perf_counter() - started
+			self.local.phase = previous
+			if threading.get_ident() == self.owner:
+				self.owner_phase = previous
+			with self.lock:
+				entry = self._entry(name)
+				entry['seconds'] += elapsed
+				entry['calls'] += 1
+
+	def count(self, counter, amount=1, phase=None):
+		""" Adds amount to a counter of the given or the current phase """
+		with self.lock:
+			entry = self._entry(phase or self.current_phase())
+			entry[counter] = entry.get(counter, 0) + amount
+
+	def as_dict(self):
+		with self.lock:
+			return {
+				'total_seconds': round(time.perf_counter() - self.started, 3),
+				'phases': {
+					name: {key: round(value, 3) if isinstance(value, float) else value for key, value in entry.items()}
+					for name, entry in self.phases.items()
+				},
+			}
+
+	def report(self, feedback):
+		""" Pushes the breakdown to feedback, slowest phase first """
+		metrics = self.as_dict()
+		feedback.pushInfo(f"Fetch took {metrics['total_seconds']:.2f} s")
+		for name, entry in sorted(metrics['phases'].items(), key=lambda item: -item[1]['seconds']):
+			counters = ''.join(
+				f', {value:,} {counter}'
+				for counter, value in entry.items()
+				if counter not in ('seconds', 'calls')
+			)
+			feedback.pushInfo(f"  {name}: {entry['seconds']:.2f} s in {entry['calls']} call(s){counters}")
+
+	def write(self, path):
+		with open(path, 'w') as f:
+			json.dump(self.as_dict(), f, indent=2)
@@ -24,27 +24,40 @@
 
 import os
 import processing
-import requests
 import json
-from qgis.PyQt.QtCore import QCoreApplication
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from qgis.PyQt.QtCore import QCoreApplication, Qt
 from qgis.core import (
+	QgsApplication,
 	QgsProcessingAlgorithm, 
 	QgsProcessingParameterString, 
 	QgsProcessingParameterBoolean,
 	QgsProcessingFeedback, 
+	QgsProcessingMultiStepFeedback,
 	QgsProcessingContext, 
+	QgsProcessingException,
 	QgsProject, 
 	QgsVectorLayer,
 	QgsVectorFileWriter,
 	QgsDataProvider,
 	QgsCoordinateReferenceSystem,
 	QgsProcessingParameterNumber,
+	QgsProcessingParameterEnum,
 	QgsWkbTypes,
-	QgsFeatureRequest,
+	QgsGeometry,
 	QgsProcessingParameterFile
 )
 from qgis.core import QgsProcessingParameterFolderDestination
-from qgis.PyQt.QtGui import QColor
+from .color_profile import ColorProfileError, load_color_profile
+from .fetch_metrics import FetchMetrics
+from .osm_layer_builder import OsmGeometryBuilder, append_records, build_layers, build_ref_layers, create_spatial_indexes, delete_features, element_records, group_elements_by_aeroway, group_features_by_ref, records_extent, records_within, write_layers_to_gpkg
+from .osm_extract_reader import read_aerodrome, read_aeroway_features
+from .overpass_cache import OverpassCache
+from .overpass_client import OVERPASS_SERVERS, OverpassCanceled, OverpassClient, OverpassError, aerodrome_area_query, aerodrome_query, aeroway_bbox_query, aeroway_query, parse_servers
+from .overpass_diff import adiff_query, iter_adiff_actions
+from .overpass_slots import shared_scheduler
+from .overpass_tiles import LOG_INTERVAL, fetch_tiled_elements
+from .widening_engine import CODE_LETTER_WIDTHS
 
 class FetchOSMDataAlgorithm(QgsProcessingAlgorithm):
 
@@ -53,6 +66,8 @@ class FetchOSMDataAlgorithm(QgsProcessingAlgorithm):
 	
 	AUTO_WIDEN_TAXIWAYS = 'AUTO_WIDEN_TAXIWAY'
 	AUTO_WIDEN_TAXIWAYS_WIDTH = 'AUTO_WIDEN_TAXIWAYS_WIDTH'
+	AUTO_WIDEN_TAXIWAYS_WIDTH_EXPRESSION = 'AUTO_WIDEN_TAXIWAYS_WIDTH_EXPRESSION'
+	AUTO_WIDEN_TAXIWAYS_CODE_LETTER = 'AUTO_WIDEN_TAXIWAYS_CODE_LETTER'
 	AUTO_WIDEN_TAXIWAYS_DISSOLVE = 'AUTO_WIDEN_TAXIWAYS_DISSOLVE'
 	AUTO_WIDEN_TAXIWAYS_KEEP_CENTERLINE = 'AUTO_WIDEN_TAXIWAYS_KEEP_CENTERLINE'
 	AUTO_WIDENED_TAXIWAYS_LINESTRING = 'AUTO_WIDENED_TAXIWAYS_LINESTRING'
@@ -63,6 +78,33 @@ class FetchOSMDataAlgorithm(QgsProcessingAlgorithm):
 	
 	COLOR_PROFILE = 'COLOR_PROFILE'
 
+	BATCHED_FETCH = 'BATCHED_FETCH'
+	AREA_QUERY = 'AREA_QUERY'
+	DOWNLOAD_CONCURRENCY = 'DOWNLOAD_CONCURRENCY'
+	QUERY_TIMEOUT = 'QUERY_TIMEOUT'
+	TILE_SIZE = 'TILE_SIZE'
+
+	CACHE_DIR = 'CACHE_DIR'
+	CACHE_TTL = 'CACHE_TTL'
+	CACHE_MAX_SIZE = 'CACHE_MAX_SIZE'
+	FORCE_REFRESH = 'FORCE_REFRESH'
+
+	OSM_EXTRACT = 'OSM_EXTRACT'
+	OVERPASS_SERVERS = 'OVERPASS_SERVERS'
+	WAIT_FOR_SLOTS = 'WAIT_FOR_SLOTS'
+
+	LAYER_OUTPUT = 'LAYER_OUTPUT'
+	LAYER_OUTPUT_GPKG = 0
+	LAYER_OUTPUT_MEMORY = 1
+	LAYER_OUTPUT_SINGLE_GPKG = 2
+
+	REFRESH = 'REFRESH'
+	LAYER_GROUP = 'LAYER_GROUP'
+	STATE_FILE = 'fetch_state.json'
+
+	WRITE_METRICS = 'WRITE_METRICS'
+	METRICS_FILE = 'fetch_metrics.json'
+
 	FEATURE_TYPES = [
 		'heliport',
 		'grass',
@@ -100,240 +142,503 @@ class FetchOSMDataAlgorithm(QgsProcessingAlgorithm):
 		self.addParameter(QgsProcessingParameterBoolean(self.AUTO_WIDEN_TAXIWAYS_DISSOLVE, 'Automatically Dissolve widened taxiways', defaultValue=True))
 		self.addParameter(QgsProcessingParameterBoolean(self.AUTO_WIDEN_TAXIWAYS_KEEP_CENTERLINE, 'Keep Original Line as Centerline', defaultValue=True))
 		self.addParameter(QgsProcessingParameterNumber(self.AUTO_WIDEN_TAXIWAYS_WIDTH, 'Auto Taxiway Widen Width'))
+		self.addParameter(QgsProcessingParameterString(self.AUTO_WIDEN_TAXIWAYS_WIDTH_EXPRESSION, 'Auto Taxiway Widen Width Expression (metres, e.g. "width")', optional=True))
+		self.addParameter(QgsProcessingParameterEnum(self.AUTO_WIDEN_TAXIWAYS_CODE_LETTER, 'Auto Taxiway Widen Width without an expression value', options=['Auto Taxiway Widen Width'] + [f'Code letter {letter} ({width:g} m)' for letter, width in CODE_LETTER_WIDTHS.items()], defaultValue=0))
 		self.addParameter(QgsProcessingParameterBoolean(self.SPLIT_TAXIWAYS, 'Split Taxiways'))
 		self.addParameter(QgsProcessingParameterFolderDestination(self.SPLIT_TAXIWAYS_OUTPUT, 'Split Taxiways Output Directory'))
 		self.addParameter(QgsProcessingParameterFolderDestination(self.OUTPUT_DIR, 'Output Directory'))
 		self.addParameter(QgsProcessingParameterFile(self.COLOR_PROFILE, 'Color Profile', optional=True))
+		self.addParameter(QgsProcessingParameterBoolean(self.BATCHED_FETCH, 'Fetch all feature types in a single Overpass request', defaultValue=False))
+		self.addParameter(QgsProcessingParameterBoolean(self.AREA_QUERY, 'Fetch the aerodrome and only the features inside its boundary in a single request', defaultValue=False))
+		self.addParameter(QgsProcessingParameterNumber(self.DOWNLOAD_CONCURRENCY, 'Parallel feature type downloads', defaultValue=1, minValue=1, maxValue=4))
+		self.addParameter(QgsProcessingParameterNumber(self.QUERY_TIMEOUT, 'Overpass Query Timeout (seconds)', defaultValue=25, minValue=1))
+		self.addParameter(QgsProcessingParameterNumber(self.TILE_SIZE, 'Fetch in tiles of at most this size (metres, 0 fetches the whole aerodrome at once)', defaultValue=0, minValue=0))
+		self.addParameter(QgsProcessingParameterFile(self.CACHE_DIR, 'Overpass Cache Directory', behavior=QgsProcessingParameterFile.Folder, optional=True))
+		self.addParameter(QgsProcessingParameterNumber(self.CACHE_TTL, 'Overpass Cache Lifetime (hours, 0 disables the cache)', QgsProcessingParameterNumber.Double, defaultValue=24, minValue=0))
+		self.addParameter(QgsProcessingParameterNumber(self.CACHE_MAX_SIZE, 'Overpass Cache Size Limit (MB)', defaultValue=256, minValue=1))
+		self.addParameter(QgsProcessingParameterBoolean(self.FORCE_REFRESH, 'Force refresh (ignore cached responses)', defaultValue=False))
+		self.addParameter(QgsProcessingParameterString(self.OVERPASS_SERVERS, 'Overpass Servers (tried in order)', defaultValue='\n'.join(OVERPASS_SERVERS), multiLine=True))
+		self.addParameter(QgsProcessingParameterBoolean(self.WAIT_FOR_SLOTS, 'Wait for free Overpass slots before each request', defaultValue=False))
+		self.addParameter(QgsProcessingParameterFile(self.OSM_EXTRACT, 'Offline OSM Extract (.osm / .osm.pbf, skips Overpass)', fileFilter='OSM files (*.osm *.pbf)', optional=True))
+		self.addParameter(QgsProcessingParameterEnum(self.LAYER_OUTPUT, 'Layer Output', options=['GeoPackage per feature type', 'Memory layers (no files written)', 'Single GeoPackage with one table per layer'], defaultValue=self.LAYER_OUTPUT_GPKG))
+		self.addParameter(QgsProcessingParameterBoolean(self.LAYER_GROUP, 'Group the layers under the ICAO code', defaultValue=False))
+		self.addParameter(QgsProcessingParameterBoolean(self.REFRESH, 'Refresh a previous fetch with the changes made since then', defaultValue=False))
+		self.addParameter(QgsProcessingParameterBoolean(self.WRITE_METRICS, f'Write a timing breakdown to {self.METRICS_FILE} in the output directory', defaultValue=False))
 
 	def processAlgorithm(self, parameters, context: QgsProcessingContext, feedback: QgsProcessingFeedback):
 		# Get ICAO code and output directory
 		icao_code = self.parameterAsString(parameters, self.ICAO_CODE, context).upper()
 		output_dir = self.parameterAsString(parameters, self.OUTPUT_DIR, context)
+		# Time and bytes spent in each phase, reported at the end
+		metrics = FetchMetrics()
+
+		# Color profile, checked before anything is downloaded
+		try:
+			color_profile = load_color_profile(self.parameterAsString(parameters, self.COLOR_PROFILE, context))
+		except ColorProfileError as e:
+			raise QgsProcessingException(str(e)) from e
 
 		# AUTO WIDEN TAXIWAY SETTINGS
 		auto_widen_taxiway = self.parameterAsBoolean(parameters, self.AUTO_WIDEN_TAXIWAYS, context)
 		auto_widen_width = self.parameterAsInt(parameters, self.AUTO_WIDEN_TAXIWAYS_WIDTH, context)
+		auto_widen_width_expression = self.parameterAsString(parameters, self.AUTO_WIDEN_TAXIWAYS_WIDTH_EXPRESSION, context)
+		auto_widen_code_letter = self.parameterAsEnum(parameters, self.AUTO_WIDEN_TAXIWAYS_CODE_LETTER, context)
 		auto_widen_dissolve = self.parameterAsBoolean(parameters, self.AUTO_WIDEN_TAXIWAYS_DISSOLVE, context)
 		auto_widen_keep_centerline = self.parameterAsBoolean(parameters, self.AUTO_WIDEN_TAXIWAYS_KEEP_CENTERLINE, context)
 
+		# Taxiways whose expression gives no width fall back to the width or
+		# code letter, so an expression alone would buffer them to nothing
+		if auto_widen_taxiway and auto_widen_width_expression and auto_widen_width <= 0 and auto_widen_code_letter <= 0:
+			raise QgsProcessingException("Auto Taxiway Widen Width Expression needs a width or code letter as its fallback")
+
 		split_taxiways = self.parameterAsBoolean(parameters, self.SPLIT_TAXIWAYS, context)
 		split_taxiways_output_folder = self.parameterAsString(parameters, self.SPLIT_TAXIWAYS_OUTPUT, context)
 
-		# Color profile
-		color_profile = self.parameterAsString(parameters, self.COLOR_PROFILE, context)
-		color_profile_data = None
-
-		if color_profile:
-			with open(color_profile, 'r') as f:
-				color_profile_data: dict[str, str] = json.load(f)["colors"]
-		# Run OSM query for airport based on ICAO code
-		feedback.pushInfo(f"Fetching OSM data for {icao_code}...")
-		feature_path = os.path.join(output_dir, '001_aeroway_aerodrome.gpkg')
-		ad_layer_initial = processing.run("quickosm:downloadosmdatanotspatialquery", {
-			'KEY': 'icao',
-			'VALUE': icao_code,
-			'TIMEOUT': 25,
-			'SERVER': 'https://overpass-api.de/api/interpreter',
-			'FILE': feature_path
-		}, context=context, feedback=feedback)
-		layer = QgsVectorLayer(feature_path, "master", "ogr")
-		sub_layers = layer.dataProvider().subLayers()
-
-		for sub_layer in sub_layers:
-			name = sub_layer.split(QgsDataProvider.sublayerSeparator())[1]
-			uri = f"{feature_path}|layername={name}"
-			sub_vlayer = QgsVectorLayer(uri, name, "ogr")
-
-			# Add the layer to the project
-			if sub_vlayer.isValid():
-				QgsProject.instance().addMapLayer(sub_vlayer)
-				sub_vlayer.setCrs(QgsCoordinateReferenceSystem("EPSG:4326"))
-				color_feature = None
-				if color_profile_data:
-					color_feature: dict[str, str] = color_profile_data.get('background', None)
-				if color_feature:
-					color = color_feature["color"]
-					color_comp = color.split(",")
-					color_ints = list(map(int, color_comp))
-					sub_vlayer.renderer().symbol().setColor(QColor().fromRgb(color_ints[0], color_ints[1], color_ints[2]))
-
-					gr_color = color_feature["gr_color"]
-					ts_color = color_feature["ts_color"]
-					sub_vlayer.setCustomProperty("ts_color", ts_color)
-					sub_vlayer.setCustomProperty("gr_color", gr_color)
-					sub_vlayer.setCustomProperty("color", color)
-
-					QgsProject.instance().addMapLayer(sub_vlayer)
-			
-		ad_multipoly: QgsVectorLayer = ad_layer_initial['OUTPUT_MULTIPOLYGONS']
-
-
-		if not ad_multipoly.isValid():
-			feedback.reportError("Failed to load aerodrome layer.")
-			return {}
-		
-		ad_extent = ad_multipoly.extent()
-		ad_bbox = (ad_extent.xMinimum(), ad_extent.yMinimum(), ad_extent.xMaximum(), ad_extent.yMaximum())
-		query = f"""
-		[out:json];
-		(
-		node["aeroway"]({ad_bbox[1]},{ad_bbox[0]},{ad_bbox[3]},{ad_bbox[2]});
-		way["aeroway"]({ad_bbox[1]},{ad_bbox[0]},{ad_bbox[3]},{ad_bbox[2]});
-		relation["aeroway"]({ad_bbox[1]},{ad_bbox[0]},{ad_bbox[3]},{ad_bbox[2]});
-		);
-		out body;
-		"""
-
-		
-		# Send the request
-		url = "https://overpass-api.de/api/interpreter"
-		response = requests.get(url, params={"data": query})
-		feature_types = []
-
-		if response.status_code == 200:
-			data = response.json()
-			
-			# Extract unique "aeroway" values
-			feature_types_init = set()
-			for element in data["elements"]:
-				if "tags" in element and "aeroway" in element["tags"]:
-					feature_types_init.add(element["tags"]["aeroway"])
-			if  len(feature_types_init) > 0:
-				feature_types = list(filter(lambda x: x in list(feature_types_init), self.FEATURE_TYPES))
-		else:
-			feedback.reportError("Failed to fetch OSM data.")
-			return {}
+		batched_fetch = self.parameterAsBoolean(parameters, self.BATCHED_FETCH, context)
+		area_query = self.parameterAsBoolean(parameters, self.AREA_QUERY, context)
+		download_concurrency = self.parameterAsInt(parameters, self.DOWNLOAD_CONCURRENCY, context)
+		query_timeout = self.parameterAsInt(parameters, self.QUERY_TIMEOUT, context)
+		tile_size = self.parameterAsInt(parameters, self.TILE_SIZE, context)
+		osm_extract = self.parameterAsString(parameters, self.OSM_EXTRACT, context)
+		layer_output = self.parameterAsEnum(parameters, self.LAYER_OUTPUT, context)
+
+		# Incremental refresh patches the GeoPackages of a previous online
+		# fetch, so it needs per feature type files and a recorded timestamp
+		state_path = os.path.join(output_dir, self.STATE_FILE)
+		fetch_state = self.load_fetch_state(state_path)
+		previous_fetch = fetch_state.get(icao_code)
+		refresh = self.parameterAsBoolean(parameters, self.REFRESH, context)
+		if refresh and (previous_fetch is None or osm_extract or layer_output != self.LAYER_OUTPUT_GPKG):
+			feedback.pushInfo("Nothing to refresh incrementally, fetching everything")
+			refresh = False
+
+		# In single GeoPackage mode every table goes to <ICAO>.gpkg and its
+		# spatial index is built once, after all tables are written
+		single_gpkg_path = os.path.join(output_dir, f'{icao_code}.gpkg')
+		single_gpkg_tables = []
+
+		client = OverpassClient(
+			servers=parse_servers(self.parameterAsString(parameters, self.OVERPASS_SERVERS, context)),
+			cache=self.cache_from_parameters(parameters, context),
+			force_refresh=refresh or self.parameterAsBoolean(parameters, self.FORCE_REFRESH, context),
+			scheduler=shared_scheduler() if self.parameterAsBoolean(parameters, self.WAIT_FOR_SLOTS, context) else None,
+			feedback=feedback,
+			label=icao_code,
+			metrics=metrics
+		)
+		# Cancelling in the toolbox aborts running downloads immediately. The
+		# algorithm runs on a task thread without an event loop, so the slot
+		# must be called directly by the thread that cancels, and disconnected
+		# again as the batch algorithm reuses the feedback for every airport
+		feedback.canceled.connect(client.cancel, Qt.DirectConnection)
+		try:
+			# Progress of the aerodrome, feature download and layer stages
+			steps = QgsProcessingMultiStepFeedback(3, feedback)
+
+			# Run OSM query for airport based on ICAO code
+			feedback.pushInfo(f"Fetching OSM data for {icao_code}...")
+			feature_path = os.path.join(output_dir, '001_aeroway_aerodrome.gpkg')
+			header = {}
+			if osm_extract:
+				with metrics.phase('extract read'):
+					ad_records = read_aerodrome(osm_extract, icao_code)
+				if not ad_records:
+					raise QgsProcessingException(f"No aerodrome tagged icao={icao_code} in {osm_extract}")
+			else:
+				try:
+					with metrics.phase('aerodrome query'):
+						if area_query:
+							area_elements = list(client.stream_elements(aerodrome_area_query(icao_code, query_timeout), header))
+						else:
+							ad_elements = list(client.stream_elements(aerodrome_query(icao_code, query_timeout)))
+				except (OverpassError, OSError) as e:
+					raise QgsProcessingException(f"Failed to fetch aerodrome: {e}") from e
+
+				if area_query:
+					# The aerodrome is listed again among the aeroways inside it
+					ad_elements = list({
+						(element['type'], element['id']): element
+						for element in area_elements
+						if element.get('tags', {}).get('aeroway') == 'aerodrome' and element['tags'].get('icao', '').upper() == icao_code
+					}.values())
+				ad_records = list(element_records(ad_elements))
+
+			with metrics.phase('sublayer load'):
+				if layer_output == self.LAYER_OUTPUT_SINGLE_GPKG:
+					ad_layers = self.output_layers(ad_records, 'aerodrome', layer_output, single_gpkg_path, '001_aeroway_aerodrome')
+					single_gpkg_tables += [layer.name() for layer in ad_layers.values()]
+				else:
+					ad_layers = self.output_layers(ad_records, 'aerodrome', layer_output, feature_path)
+				metrics.count('features', len(ad_records))
+			ad_multipoly = ad_layers.get('multipolygons')
+
+			# Every layer for the project, registered in one call at the end
+			project_layers = []
+
+			for sub_vlayer in ad_layers.values():
+				# Add the layer to the project
+				if sub_vlayer.isValid():
+					project_layers.append(sub_vlayer)
+					sub_vlayer.setCrs(QgsCoordinateReferenceSystem("EPSG:4326"))
+			color_profile.apply('background', project_layers)
+
+			if ad_multipoly is None or not ad_multipoly.isValid():
+				raise QgsProcessingException("Failed to load aerodrome layer.")
 		
+			if feedback.isCanceled():
+				return {}
+			steps.setCurrentStep(1)
+
+			ad_extent = records_extent(ad_records)
+			ad_bbox = (ad_extent.xMinimum(), ad_extent.yMinimum(), ad_extent.xMaximum(), ad_extent.yMaximum())
+
+			feature_types = []
+			# Layer records of every feature type, keyed by aeroway value
+			feature_records = {}
+			# Feature types whose download failed, their data is missing
+			failed_types = []
+			# GeoPackage file name of every feature type, kept for later refreshes
+			feature_files = {}
+
+			if refresh:
+				try:
+					with metrics.phase('refresh'):
+						feature_files, osm_timestamp = self.refresh_feature_files(previous_fetch, ad_bbox, output_dir, client, feedback, query_timeout)
+				except (OverpassError, OSError) as e:
+					raise QgsProcessingException(f"Failed to fetch OSM changes: {e}") from e
+				header['timestamp_osm_base'] = osm_timestamp
+				feature_types = list(filter(lambda x: x in feature_files, self.FEATURE_TYPES))
+			elif osm_extract:
+				boundary = QgsGeometry.unaryUnion([record[1] for record in ad_records])
+				with metrics.phase('extract read'):
+					feature_records = read_aeroway_features(osm_extract, boundary, feedback)
+				feature_types = list(filter(lambda x: x in feature_records, self.FEATURE_TYPES))
+			elif area_query:
+				# Overpass areas also match ways that only cross the boundary,
+				# keep what actually touches the aerodrome polygon
+				boundary = QgsGeometry.unaryUnion([record[1] for record in ad_records])
+				feature_elements = group_elements_by_aeroway(area_elements)
+				builder = OsmGeometryBuilder(area_elements)
+				with metrics.phase('area filter'):
+					for feature in filter(lambda x: x in feature_elements, self.FEATURE_TYPES):
+						records = list(records_within(builder.records(feature_elements[feature]), boundary))
+						if records:
+							feature_records[feature] = records
+				feature_types = list(feature_records)
+			else:
+				# Tiled fetches always download geometry, like a batched fetch
+				batched_fetch = batched_fetch or tile_size > 0
+				query = aeroway_bbox_query(ad_bbox, geometry=batched_fetch, timeout=query_timeout)
+
+				# Send the request, only keeping what this stage needs while the
+				# response streams in
+				try:
+					with metrics.phase('discovery query'):
+						if tile_size > 0:
+							feature_elements = group_elements_by_aeroway(fetch_tiled_elements(
+								client,
+								lambda tile: aeroway_bbox_query(tile, geometry=True, timeout=query_timeout),
+								ad_bbox,
+								tile_size,
+								download_concurrency,
+								feedback=steps,
+								header=header
+							))
+						elif batched_fetch:
+							feature_elements = group_elements_by_aeroway(client.stream_elements(query, header))
+						else:
+							feature_elements = dict.fromkeys(
+								element["tags"]["aeroway"]
+								for element in client.stream_elements(query, header)
+								if "aeroway" in element.get("tags", {})
+							)
+				except (OverpassError, OSError) as e:
+					raise QgsProcessingException(f"Failed to fetch OSM data: {e}") from e
+
+				# Extract unique "aeroway" values
+				if  len(feature_elements) > 0:
+					feature_types = list(filter(lambda x: x in feature_elements, self.FEATURE_TYPES))
+				if batched_fetch:
+					with metrics.phase('geometry build'):
+						builder = OsmGeometryBuilder([element for elements in feature_elements.values() for element in elements])
+						feature_records = {feature: list(builder.records(feature_elements[feature])) for feature in feature_types}
+				else:
+					feature_records = self.download_feature_types(feature_types, ad_bbox, client, download_concurrency, steps, query_timeout, metrics)
+					failed_types = [feature for feature in feature_types if feature not in feature_records]
+
+			if feedback.isCanceled():
+				return {}
+			steps.setCurrentStep(2)
+
+			count = 2
+
+			for feature_index, feature in enumerate(feature_types):
+				if feedback.isCanceled():
+					return {}
+				steps.setProgress(100 * feature_index / len(feature_types))
+				feedback.pushInfo(f"BBOX {ad_extent}")
+				feature_path = os.path.join(output_dir, f'{str(count).zfill(3)}_{feature}.gpkg')
+				if not refresh and feature not in feature_records:
+					continue
+				with metrics.phase('sublayer load'):
+					if refresh:
+						feature_path = os.path.join(output_dir, feature_files[feature])
+						sub_vlayers = {layer.name(): layer for layer in self.load_all_layers_from_gpkg(feature_path, feedback)}
+					elif layer_output == self.LAYER_OUTPUT_SINGLE_GPKG:
+						sub_vlayers = self.output_layers(feature_records[feature], feature, layer_output, single_gpkg_path, f'{str(count).zfill(3)}_{feature}', overwrite_file=False)
+						single_gpkg_tables += [layer.name() for layer in sub_vlayers.values()]
+					else:
+						sub_vlayers = self.output_layers(feature_records[feature], feature, layer_output, feature_path)
+						feature_files[feature] = os.path.basename(feature_path)
+					if not refresh:
+						metrics.count('features', len(feature_records[feature]))
+
+				# Colour before widening, so the widened layers inherit it
+				color_profile.apply(feature, sub_vlayers.values())
+
+				for sub_vlayer in sub_vlayers.values():
+					sub_vlayer.setName(f"{str(count).zfill(3)}_{feature}_{self.GEOMETRY_TYPES[sub_vlayer.geometryType()]}")
+
+					# Taxiway features grouped by ref in one pass, geometry is
+					# only read when the groups become split layers
+					with metrics.phase('taxiway ref scan'):
+						taxiway_refs = group_features_by_ref(sub_vlayer, 'taxiway', geometry=split_taxiways)
+						metrics.count('taxiways', sum(len(features) for features in taxiway_refs.values()))
+					taxiway = len(taxiway_refs) > 0
+
+					if taxiway:
+						if split_taxiways:
+							with metrics.phase('split writing'):
+								# Prefixed with the sublayer name, so the split layers
+								# of the lines and multipolygons sublayers never clash
+								ref_layers = build_ref_layers(sub_vlayer, taxiway_refs, f'{sub_vlayer.name()}_TAXIWAY_')
+								if layer_output == self.LAYER_OUTPUT_SINGLE_GPKG:
+									table_names = {ref: ref_layer.name() for ref, ref_layer in ref_layers.items()}
+									write_layers_to_gpkg(ref_layers, single_gpkg_path, table_names, overwrite_file=False, spatial_index=False)
+									single_gpkg_tables += table_names.values()
+								else:
+									save_options = QgsVectorFileWriter.SaveVectorOptions()
+									transform_context = QgsProject.instance().transformContext()
+									for ref_layer in ref_layers.values():
+										QgsVectorFileWriter.writeAsVectorFormatV3(
+											ref_layer,
+											os.path.join(split_taxiways_output_folder, ref_layer.name()),
+											transform_context,
+											save_options
+										)
+								project_layers += ref_layers.values()
+								metrics.count('layers', len(ref_layers))
+
+
+						if auto_widen_taxiway and (auto_widen_width > 0 or auto_widen_width_expression or auto_widen_code_letter > 0):
+						
+							with metrics.phase('widening'):
+								output_layer: QgsVectorLayer = processing.run("aerodromeutilities:taxiwaywidener", {
+									'INPUT': sub_vlayer,
+									'BUFFER_DISTANCE':auto_widen_width,
+									'WIDTH_EXPRESSION': auto_widen_width_expression,
+									'CODE_LETTER': auto_widen_code_letter,
+									'BUFFER_CAP_STYLE':0,
+									'AUTO_POLY_LINESTRING':False,
+									'DISSOLVE': auto_widen_dissolve,
+									'OUTPUT':'memory:'
+								})['OUTPUT']
+								metrics.count('widened features', sub_vlayer.featureCount())
+						
+							output_layer.setName(f"{str(count+1).zfill(3)}_{feature}_{self.GEOMETRY_TYPES[output_layer.geometryType()]}")
+							if auto_widen_keep_centerline:
+								project_layers.append(sub_vlayer)
+							project_layers.append(output_layer)
+							
+						
+						else:
+							sub_vlayer.setName(f"{str(count).zfill(3)}_{feature}_centerline_{self.GEOMETRY_TYPES[sub_vlayer.geometryType()]}")
+							project_layers.append(sub_vlayer)
 
+								
+								
 
+						sub_vlayer.setName(f"{str(count).zfill(3)}_{feature}_centerline_{self.GEOMETRY_TYPES[sub_vlayer.geometryType()]}")
 
+					else:
+						project_layers.append(sub_vlayer)
+					count += 1
 
-		count = 2
-		ref_layers = []
-		
-
-		for feature in feature_types:
-			feedback.pushInfo(f"BBOX {ad_extent}")
-			color_feature = None
-			if color_profile_data:
-				color_feature: dict[str, str] = color_profile_data.get(feature, None)
-			if color_feature:
-				color = color_feature.get('color', None)
-			feature_path = os.path.join(output_dir, f'{str(count).zfill(3)}_{feature}.gpkg')
-			processing.run("quickosm:downloadosmdataextentquery", {
-				'KEY': 'aeroway',
-				'VALUE': feature,
-				'EXTENT': ad_extent,
-				'TIMEOUT': 25,
-				'SERVER': 'https://overpass-api.de/api/interpreter',
-				'FILE': feature_path
-			}, context=context, feedback=feedback)
-			
-			# filtered_layers = list(filter(lambda x: x.featureCount() > 0, feature_initial.values()))
-			# for layer in filtered_layers:
-			# 	layer_name = f'{str(count).zfill(3)}_aeroway_{feature}'
-			# 	layer.setName(layer_name)
 
-			# 	layer_path = os.path.join(output_dir, f'{layer_name}.gpkg')
-				
-			# 	processing.run("native:saveselectedfeatures", {
-			# 		'INPUT': layer,
-			# 		'OUTPUT': layer_path
-			# 	}, context=context, feedback=feedback)
-			
-			# 	self.load_all_layers_from_gpkg(layer_path, feedback)
-			# 	count += 1
-
-			layer = QgsVectorLayer(feature_path, "master", "ogr")
-			sub_layers = layer.dataProvider().subLayers()
-
-			for sub_layer in sub_layers:
-				name = sub_layer.split(QgsDataProvider.sublayerSeparator())[1]
-				uri = f"{feature_path}|layername={name}"
-				sub_vlayer = QgsVectorLayer(uri, name, "ogr")
-				taxiway = False
-				sub_vlayer.setName(f"{str(count).zfill(3)}_{feature}_{self.GEOMETRY_TYPES[sub_vlayer.geometryType()]}")
-
-				discovered_taxiway_ref_codes = []
-
-				for layer_feature in sub_vlayer.getFeatures():
-					
-					aeroway = "N/A"
-					ref = "NULL"
-
-					if "aeroway" in layer_feature.fields().names():
-						aeroway = layer_feature["aeroway"]
-
-					if aeroway == "taxiway":
-						taxiway = True
-
-						if "ref" in layer_feature.fields().names():
-							ref = layer_feature["ref"]
-
-						if ref not in discovered_taxiway_ref_codes:
-							discovered_taxiway_ref_codes.append(ref)
-				color = None
-				if taxiway:
-					if split_taxiways:
-						for ref in discovered_taxiway_ref_codes:
-							sub_vlayer.selectByExpression(f'"ref"=\'{ref}\'', QgsVectorLayer.SetSelection)
-							ref_layer = sub_vlayer.materialize(QgsFeatureRequest().setFilterFids(sub_vlayer.selectedFeatureIds()))
-							save_options = QgsVectorFileWriter.SaveVectorOptions()
-							transform_context = QgsProject.instance().transformContext()
-							QgsVectorFileWriter.writeAsVectorFormatV3(
-								ref_layer,
-								os.path.join(split_taxiways_output_folder, ref_layer.name()),
-								transform_context,
-								save_options
-							)
-							ref_layer.setName(f'TAXIWAY_{ref}')
-							ref_layers.append(ref_layer)
 
-							sub_vlayer.removeSelection()						
-						QgsProject.instance().addMapLayers(ref_layers)
 
+			with metrics.phase('layer registration'):
+				if single_gpkg_tables:
+					create_spatial_indexes(single_gpkg_path, list(dict.fromkeys(single_gpkg_tables)))
 
-					if auto_widen_taxiway and auto_widen_width > 0:
-						
-						QgsProject.instance().addMapLayer(sub_vlayer)
-						output_layer: QgsVectorLayer = processing.run("aerodromeutilities:taxiwaywidener", {
-							'INPUT': sub_vlayer.id(),
-							'BUFFER_DISTANCE':auto_widen_width / 2,
-							'BUFFER_CAP_STYLE':0,
-							'AUTO_POLY_LINESTRING':False,
-							'DISSOLVE': auto_widen_dissolve,
-							'OUTPUT':'memory:'
-						})['OUTPUT']
-						
-						output_layer.setName(f"{str(count+1).zfill(3)}_{feature}_{self.GEOMETRY_TYPES[output_layer.geometryType()]}")
-						QgsProject.instance().addMapLayer(output_layer)
+				self.register_layers(project_layers, icao_code if self.parameterAsBoolean(parameters, self.LAYER_GROUP, context) else None)
+				metrics.count('layers', len(project_layers))
 
-						if not auto_widen_keep_centerline:
-							QgsProject.instance().removeMapLayer(sub_vlayer)
-							
-						
-					else:
-						sub_vlayer.setName(f"{str(count).zfill(3)}_{feature}_centerline_{self.GEOMETRY_TYPES[sub_vlayer.geometryType()]}")
-						QgsProject.instance().addMapLayer(sub_vlayer)
+			if failed_types:
+				# A refresh from this timestamp would never fetch the changes
+				# of the failed types, so the next refresh fetches everything
+				feedback.reportError(f"Not recording the fetch for refreshes, failed to download: {', '.join(failed_types)}")
+				if fetch_state.pop(icao_code, None) is not None:
+					self.save_fetch_state(state_path, fetch_state)
+			elif layer_output == self.LAYER_OUTPUT_GPKG and not osm_extract and 'timestamp_osm_base' in header:
+				fetch_state[icao_code] = {
+					'timestamp': header['timestamp_osm_base'],
+					'bbox': list(ad_bbox),
+					'files': feature_files,
+				}
+				self.save_fetch_state(state_path, fetch_state)
 
-								
-								
+			metrics.report(feedback)
+			if self.parameterAsBoolean(parameters, self.WRITE_METRICS, context):
+				metrics.write(os.path.join(output_dir, self.METRICS_FILE))
 
-					sub_vlayer.setName(f"{str(count).zfill(3)}_{feature}_centerline_{self.GEOMETRY_TYPES[sub_vlayer.geometryType()]}")
+			feedback.pushInfo(f"Completed fetching data for {icao_code}")
+			return {'Output directory': output_dir}
+		finally:
+			feedback.canceled.disconnect(client.cancel)
 
-				else:
-					if color is not None:
-						color_comp = color.split(",")
-						color_ints = list(map(int, color_comp))
-						sub_vlayer.renderer().symbol().setColor(QColor().fromRgb(color_ints[0], color_ints[1], color_ints[2]))
-					QgsProject.instance().addMapLayer(sub_vlayer)
-				count += 1
+	def register_layers(self, layers, group_name=None):
+		"""
+		Adds layers to the project in a single call, so the canvas and legend
+		update once. Later layers end up on top, as when added one by one.
+		With a group_name they go into that layer tree group instead.
+		"""
+		layers = list(reversed(layers))
+		project = QgsProject.instance()
+		if group_name is None:
+			project.addMapLayers(layers)
+			return
+
+		project.addMapLayers(layers, False)
+		root = project.layerTreeRoot()
+		group = root.findGroup(group_name) or root.insertGroup(0, group_name)
+		for layer in layers:
+			group.addLayer(layer)
+
+	def cache_from_parameters(self, parameters, context):
+		""" Builds the Overpass response cache, or None when it is disabled """
+		cache_ttl = self.parameterAsDouble(parameters, self.CACHE_TTL, context)
+		if cache_ttl <= 0:
+			return None
+
+		cache_dir = self.parameterAsString(parameters, self.CACHE_DIR, context)
+		if not cache_dir:
+			cache_dir = os.path.join(QgsApplication.qgisSettingsDirPath(), 'aerodrome_utilities', 'overpass_cache')
+
+		cache_max_size = self.parameterAsInt(parameters, self.CACHE_MAX_SIZE, context)
+		return OverpassCache(cache_dir, ttl=cache_ttl * 3600, max_size=cache_max_size * 1024 * 1024)
+
+	def download_feature_types(self, feature_types, bbox, client, concurrency, feedback, timeout=25, metrics=None):
+		"""
+		Downloads every feature type from Overpass on a bounded worker pool.
 
+		Returns a dict of feature type to layer records. Feature types that
+		fail to download are reported and left out. Each download is timed as
+		its own phase of metrics.
+		"""
+		if metrics is None:
+			metrics = FetchMetrics()
+
+		def download(feature):
+			with metrics.phase(f'download {feature}'):
+				records = list(element_records(list(client.stream_elements(aeroway_query(feature, bbox, timeout)))))
+				metrics.count('downloaded features', len(records))
+				return records
+
+		feature_records = {}
+		with ThreadPoolExecutor(max_workers=concurrency) as executor:
+			futures = {executor.submit(download, feature): feature for feature in feature_types}
+			pending = set(futures)
+			while pending:
+				# Wakes up regularly to report slot waits of the workers, the
+				# feedback may only be used from this thread
+				finished, pending = wait(pending, timeout=LOG_INTERVAL, return_when=FIRST_COMPLETED)
+				client.flush_log()
+				for future in finished:
+					feature = futures[future]
+					try:
+						feature_records[feature] = future.result()
+						feedback.pushInfo(f"Downloaded {feature}")
+					except OverpassCanceled:
+						pass
+					except (OverpassError, OSError) as e:
+						feedback.reportError(f"Failed to download {feature}: {e}")
+				feedback.setProgress(100 * (len(futures) - len(pending)) / len(futures))
+		return feature_records
+
+	def refresh_feature_files(self, previous_fetch, bbox, output_dir, client, feedback, timeout=25):
+		"""
+		Patches the GeoPackages of a previous fetch in place with the aeroway
+		changes Overpass recorded since its timestamp.
 
+		Every touched element is removed, then the current version of those
+		still tagged as aeroways is added back. Returns the updated feature
+		type to file name map and the OSM timestamp of the diff.
+		"""
+		header = {}
+		changed_ids = set()
+		new_elements = []
+		query = adiff_query(previous_fetch['timestamp'], bbox, timeout)
+		# The diff is only cached once it parsed without an error
+		with client.body(query) as chunks:
+			for _, old, new in iter_adiff_actions(chunks, header):
+				for element in (old, new):
+					if element is not None:
+						changed_ids.add(f"{element['type'][0]}{element['id']}")
+				if new is not None and 'aeroway' in new['tags']:
+					new_elements.append(new)
+		feedback.pushInfo(f"{len(changed_ids)} aeroway element(s) changed since {previous_fetch['timestamp']}")
+
+		feature_files = dict(previous_fetch['files'])
+		for file_name in feature_files.values():
+			delete_features(os.path.join(output_dir, file_name), changed_ids)
+
+		builder = OsmGeometryBuilder(new_elements)
+		next_count = max((int(file_name[:3]) for file_name in feature_files.values()), default=1) + 1
+		for feature, elements in group_elements_by_aeroway(new_elements).items():
+			if feature not in self.FEATURE_TYPES:
+				continue
+			if feature not in feature_files:
+				feature_files[feature] = f'{str(next_count).zfill(3)}_{feature}.gpkg'
+				next_count += 1
+			append_records(os.path.join(output_dir, feature_files[feature]), list(builder.records(elements)), feature)
+
+		return feature_files, header.get('timestamp_osm_base', previous_fetch['timestamp'])
+
+	def load_fetch_state(self, state_path):
+		if not os.path.exists(state_path):
+			return {}
+		with open(state_path, 'r') as f:
+			return json.load(f)
 
+	def save_fetch_state(self, state_path, state):
+		with open(state_path, 'w') as f:
+			json.dump(state, f, indent=2)
 
-		feedback.pushInfo(f"Completed fetching data for {icao_code}")
-		return {'Output directory': output_dir}
+	def output_layers(self, records, name, layer_output, feature_path, table_prefix=None, overwrite_file=True):
+		"""
+		Builds the layers of one feature type straight from OSM records.
+
+		Memory output returns the built layers as they are, otherwise they are
+		written to the GeoPackage at feature_path and the written tables are
+		returned. With a table_prefix the tables are added to an existing
+		GeoPackage as <table_prefix>_<sublayer>, without a spatial index, and
+		overwrite_file decides whether the file is replaced first.
+		Returns a dict of sublayer name to layer.
+		"""
+		layers = build_layers(records, name)
+		if layer_output == self.LAYER_OUTPUT_MEMORY:
+			return layers
+
+		table_names = {
+			sublayer: f'{table_prefix}_{sublayer}' if table_prefix else sublayer
+			for sublayer in layers
+		}
+		write_layers_to_gpkg(layers, feature_path, table_names, overwrite_file=overwrite_file, spatial_index=table_prefix is None)
+		return {
+			sublayer: QgsVectorLayer(f"{feature_path}|layername={table_name}", table_name, "ogr")
+			for sublayer, table_name in table_names.items()
+		}
 
 	def load_all_layers_from_gpkg(self, gpkg_path, feedback):
 		""" Load all layers from a given GeoPackage """
@@ -0,0 +1,150 @@
+# -*- coding: utf-8 -*-
+
+"""
+/***************************************************************************
+ AerodromeUtilities
+                                 A QGIS plugin
+ Fetches OSM Data and processes it for aerodroms with various algorithms
+ Generated by Plugin Builder: http://g-sherman.github.io/Qgis-Plugin-Builder/
+                              -------------------
+        begin                : 2024-09-08
+        copyright            : (C) 2024 by Aiden Omondi
+        email                : helpertech83@gmail.com
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+import re
+
+from qgis.core import (
+	QgsFeatureRequest,
+	QgsGeometry,
+	QgsVectorLayer,
+)
+
+from .osm_layer_builder import is_area
+
+# Matches one "key"=>"value" pair of GDAL's hstore encoded other_tags field
+OTHER_TAGS_PATTERN = re.compile(r'"((?:[^"\\]|\\.)*)"=>"((?:[^"\\]|\\.)*)"')
+
+# Matches a backslash escape inside an hstore key or value
+ESCAPE_PATTERN = re.compile(r'\\(.)')
+
+# GDAL OSM driver bookkeeping fields that are not OSM tags
+NON_TAG_FIELDS = {'osm_id', 'osm_way_id', 'other_tags'}
+
+# Sublayers of the GDAL OSM driver that can hold aeroway features
+EXTRACT_SUBLAYERS = ['points', 'lines', 'multipolygons']
+
+
+def parse_other_tags(value):
+	"""
+	Parses GDAL's hstore encoded other_tags field into a dict.
+
+	GDAL escapes both double quotes and backslashes inside keys and values.
+	"""
+	if not value:
+		return {}
+	return {
+		ESCAPE_PATTERN.sub(r'\1', key): ESCAPE_PATTERN.sub(r'\1', tag_value)
+		for key, tag_value in OTHER_TAGS_PATTERN.findall(value)
+	}
+
+
+def feature_tags(feature, field_names):
+	tags = {}
+	for name in field_names:
+		if name in NON_TAG_FIELDS:
+			continue
+		value = feature[name]
+		if value is not None and value != '':
+			tags[name] = str(value)
+	if 'other_tags' in field_names:
+		tags.update(parse_other_tags(feature['other_tags']))
+	return tags
+
+
+def _open_sublayer(path, sublayer):
+	layer = QgsVectorLayer(f'{path}|layername={sublayer}', sublayer, 'ogr')
+	return layer if layer.isValid() else None
+
+
+def _feature_record(sublayer, feature, field_names):
+	tags = feature_tags(feature, field_names)
+	geometry = QgsGeometry(feature.geometry())
+
+	if sublayer == 'points':
+		return 'points', geometry, 'node', feature['osm_id'], tags
+	if sublayer == 'lines':
+		return 'lines', geometry, 'way', feature['osm_id'], tags
+
+	if feature['osm_way_id']:
+		# GDAL turns every closed aeroway way into a polygon, use the same
+		# area rule as the Overpass path so both produce identical layers
+		if not is_area(tags):
+			ring = geometry.asMultiPolygon()[0][0]
+			return 'lines', QgsGeometry.fromPolylineXY(ring), 'way', feature['osm_way_id'], tags
+		return 'multipolygons', geometry, 'way', feature['osm_way_id'], tags
+	return 'multipolygons', geometry, 'relation', feature['osm_id'], tags
+
+
+def read_aerodrome(path, icao_code):
+	"""
+	Finds the aerodrome tagged with the ICAO code in an .osm or .osm.pbf file.
+
+	Returns the list of aerodrome records, empty when none is found.
+	"""
+	layer = _open_sublayer(path, 'multipolygons')
+	if layer is None:
+		return []
+
+	field_names = layer.fields().names()
+	request = QgsFeatureRequest().setFilterExpression('"aeroway" = \'aerodrome\'')
+	records = []
+	for feature in layer.getFeatures(request):
+		tags = feature_tags(feature, field_names)
+		if tags.get('icao', '').upper() == icao_code:
+			records.append(_feature_record('multipolygons', feature, field_names))
+	return records
+
+
+def read_aeroway_features(path, boundary, feedback=None):
+	"""
+	Streams an .osm or .osm.pbf file and groups every aeroway feature that
+	intersects the boundary geometry by its aeroway value.
+
+	GDAL's OSM driver reads the file sequentially and keeps its node index on
+	disk, and only features inside the boundary are kept, so memory stays
+	bounded by the size of the aerodrome rather than the extract.
+	"""
+	engine = QgsGeometry.createGeometryEngine(boundary.constGet())
+	engine.prepareGeometry()
+
+	groups = {}
+	for sublayer in EXTRACT_SUBLAYERS:
+		layer = _open_sublayer(path, sublayer)
+		if layer is None:
+			continue
+		if feedback is not None:
+			feedback.pushInfo(f"Scanning {sublayer} in {path}")
+
+		field_names = layer.fields().names()
+		request = QgsFeatureRequest().setFilterRect(boundary.boundingBox())
+		for feature in layer.getFeatures(request):
+			if feedback is not None and feedback.isCanceled():
+				return groups
+			if not engine.intersects(feature.geometry().constGet()):
+				continue
+			record = _feature_record(sublayer, feature, field_names)
+			aeroway = record[4].get('aeroway')
+			if aeroway is not None:
+				groups.setdefault(aeroway, []).append(record)
+	return groups
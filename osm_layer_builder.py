@@ -0,0 +1,442 @@
+# -*- coding: utf-8 -*-
+
+"""
+/***************************************************************************
+ AerodromeUtilities
+                                 A QGIS plugin
+ Fetches OSM Data and processes it for aerodroms with various algorithms
+ Generated by Plugin Builder: http://g-sherman.github.io/Qgis-Plugin-Builder/
+                              -------------------
+        begin                : 2024-09-08
+        copyright            : (C) 2024 by Aiden Omondi
+        email                : helpertech83@gmail.com
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+import os
+import re
+
+from qgis.PyQt.QtCore import QVariant
+from qgis.core import (
+	QgsExpression,
+	QgsFeature,
+	QgsFeatureRequest,
+	QgsField,
+	QgsGeometry,
+	QgsMemoryProviderUtils,
+	QgsPointXY,
+	QgsProject,
+	QgsRectangle,
+	QgsVectorFileWriter,
+	QgsVectorLayer,
+)
+
+# Closed ways with these aeroway values are areas unless tagged area=no,
+# the same rule the OSM wiki and QuickOSM use for aeroway features.
+AREA_AEROWAYS = {
+	'aerodrome',
+	'apron',
+	'gate',
+	'grass',
+	'hangar',
+	'heliport',
+	'helipad',
+	'parking_position',
+	'spaceport',
+	'terminal',
+	'tower',
+}
+
+# Characters of a ref that are not safe in file and table names, such as the
+# '/' and ';' of 'A/B' and 'A;B' refs
+UNSAFE_NAME_PATTERN = re.compile(r'[^\w.-]+')
+
+# Sublayer name and memory provider geometry for each output table, in the
+# order QuickOSM writes them.
+LAYER_GEOMETRIES = {
+	'points': 'Point',
+	'lines': 'LineString',
+	'multipolygons': 'MultiPolygon',
+}
+
+
+def group_elements_by_aeroway(elements):
+	"""
+	Groups Overpass elements by their aeroway tag value.
+	"""
+	groups = {}
+	for element in elements:
+		aeroway = element.get('tags', {}).get('aeroway')
+		if aeroway is not None:
+			groups.setdefault(aeroway, []).append(element)
+	return groups
+
+
+def is_area(tags):
+	"""
+	Returns whether a closed way with these tags is an area rather than a
+	line. Shared by the Overpass and extract backends so both build the same
+	layers.
+	"""
+	if tags.get('area') == 'no':
+		return False
+	return tags.get('area') == 'yes' or tags.get('aeroway') in AREA_AEROWAYS
+
+
+def _is_area(tags, points):
+	if len(points) < 4 or points[0] != points[-1]:
+		return False
+	return is_area(tags)
+
+
+def _to_points(coordinates):
+	return [QgsPointXY(x, y) for x, y in coordinates]
+
+
+def stitch_rings(segments):
+	"""
+	Joins way segments that share end points into closed rings.
+
+	Segments are lists of (x, y) tuples. Segments that cannot be closed are
+	dropped, as QuickOSM and GDAL do for broken multipolygons.
+	"""
+	segments = [list(segment) for segment in segments if len(segment) >= 2]
+	rings = []
+	while segments:
+		ring = segments.pop()
+		while ring[0] != ring[-1]:
+			for i, segment in enumerate(segments):
+				if segment[0] == ring[-1]:
+					ring.extend(segment[1:])
+				elif segment[-1] == ring[-1]:
+					ring.extend(reversed(segment[:-1]))
+				elif segment[-1] == ring[0]:
+					ring[:0] = segment[:-1]
+				elif segment[0] == ring[0]:
+					ring[:0] = reversed(segment[1:])
+				else:
+					continue
+				segments.pop(i)
+				break
+			else:
+				break
+		if len(ring) >= 4 and ring[0] == ring[-1]:
+			rings.append(ring)
+	return rings
+
+
+class OsmGeometryBuilder:
+	"""
+	Builds QGIS geometries from an Overpass JSON response.
+
+	Handles both ``out geom`` responses, where ways and relation members carry
+	their coordinates inline, and ``out body; >; out skel qt;`` responses,
+	where they reference nodes and ways by id and are resolved through
+	indexes built once per response.
+	"""
+
+	def __init__(self, elements):
+		self.nodes = {}
+		self.ways = {}
+		for element in elements:
+			if element['type'] == 'node':
+				self.nodes[element['id']] = (element['lon'], element['lat'])
+		for element in elements:
+			if element['type'] == 'way':
+				self.ways[element['id']] = self.way_coordinates(element)
+
+	def way_coordinates(self, way):
+		if 'geometry' in way:
+			return [(point['lon'], point['lat']) for point in way['geometry'] if point]
+		return [self.nodes[node_id] for node_id in way.get('nodes', []) if node_id in self.nodes]
+
+	def member_coordinates(self, member):
+		if 'geometry' in member:
+			return [(point['lon'], point['lat']) for point in member['geometry'] if point]
+		return self.ways.get(member['ref'], [])
+
+	def geometry(self, element):
+		"""
+		Returns a tuple of (sublayer name, QgsGeometry), or (None, None) when
+		the element has no usable geometry.
+		"""
+		tags = element.get('tags', {})
+
+		if element['type'] == 'node':
+			return 'points', QgsGeometry.fromPointXY(QgsPointXY(element['lon'], element['lat']))
+
+		if element['type'] == 'way':
+			coordinates = self.ways.get(element['id']) or self.way_coordinates(element)
+			if len(coordinates) < 2:
+				return None, None
+			if _is_area(tags, coordinates):
+				return 'multipolygons', QgsGeometry.fromMultiPolygonXY([[_to_points(coordinates)]])
+			return 'lines', QgsGeometry.fromPolylineXY(_to_points(coordinates))
+
+		if element['type'] == 'relation' and tags.get('type') == 'multipolygon':
+			outer_segments = []
+			inner_segments = []
+			for member in element.get('members', []):
+				if member.get('type') != 'way':
+					continue
+				if member.get('role') == 'inner':
+					inner_segments.append(self.member_coordinates(member))
+				else:
+					outer_segments.append(self.member_coordinates(member))
+
+			polygons = [[_to_points(ring)] for ring in stitch_rings(outer_segments)]
+			if not polygons:
+				return None, None
+
+			for inner in stitch_rings(inner_segments):
+				inner_points = _to_points(inner)
+				inner_geometry = QgsGeometry.fromPolygonXY([inner_points])
+				for polygon in polygons:
+					if QgsGeometry.fromPolygonXY([polygon[0]]).contains(inner_geometry):
+						polygon.append(inner_points)
+						break
+			return 'multipolygons', QgsGeometry.fromMultiPolygonXY(polygons)
+
+		return None, None
+
+	def records(self, elements):
+		"""
+		Yields a (sublayer, geometry, osm_type, osm_id, tags) record for every
+		tagged element with a usable geometry. Untagged nodes and ways only
+		carry geometry for other elements and are skipped.
+		"""
+		for element in elements:
+			if not element.get('tags'):
+				continue
+			sublayer, geometry = self.geometry(element)
+			if geometry is not None:
+				yield sublayer, geometry, element['type'], element['id'], element['tags']
+
+
+def element_records(elements):
+	"""
+	Yields the records of every element of a self-contained Overpass response.
+	"""
+	return OsmGeometryBuilder(elements).records(elements)
+
+
+def records_extent(records, sublayer='multipolygons'):
+	"""
+	Returns the bounding box of the records of one sublayer as a
+	QgsRectangle, or None when there are none.
+
+	Computed from the records rather than from a written layer, so every
+	caller derives the same bbox, and the same Overpass query, for an
+	aerodrome.
+	"""
+	extent = None
+	for record in records:
+		if record[0] != sublayer:
+			continue
+		if extent is None:
+			extent = QgsRectangle(record[1].boundingBox())
+		else:
+			extent.combineExtentWith(record[1].boundingBox())
+	return extent
+
+
+def records_within(records, boundary):
+	"""
+	Yields the records whose geometry intersects the boundary geometry.
+	"""
+	engine = QgsGeometry.createGeometryEngine(boundary.constGet())
+	engine.prepareGeometry()
+	for record in records:
+		if engine.intersects(record[1].constGet()):
+			yield record
+
+
+def build_layers(records, name='osm'):
+	"""
+	Converts (sublayer, geometry, osm_type, osm_id, tags) records into memory
+	layers keyed by sublayer name.
+
+	Every OSM tag becomes a string field, next to the full_id, osm_id and
+	osm_type fields QuickOSM emits, so the layers can be used interchangeably
+	with QuickOSM output.
+	"""
+	records_by_sublayer = {}
+	for record in records:
+		records_by_sublayer.setdefault(record[0], []).append(record)
+
+	layers = {}
+	for sublayer, geometry_type in LAYER_GEOMETRIES.items():
+		if sublayer not in records_by_sublayer:
+			continue
+
+		keys = []
+		for _, _, _, _, tags in records_by_sublayer[sublayer]:
+			for key in tags:
+				if key not in keys:
+					keys.append(key)
+
+		layer = QgsVectorLayer(f'{geometry_type}?crs=EPSG:4326', f'{name}_{sublayer}', 'memory')
+		provider = layer.dataProvider()
+		provider.addAttributes(
+			[QgsField('full_id', QVariant.String), QgsField('osm_id', QVariant.String), QgsField('osm_type', QVariant.String)]
+			+ [QgsField(key, QVariant.String) for key in keys]
+		)
+		layer.updateFields()
+
+		features = []
+		for _, geometry, osm_type, osm_id, tags in records_by_sublayer[sublayer]:
+			feature = QgsFeature(layer.fields())
+			feature.setGeometry(geometry)
+			feature.setAttributes(
+				[f"{osm_type[0]}{osm_id}", str(osm_id), osm_type]
+				+ [tags.get(key) for key in keys]
+			)
+			features.append(feature)
+		provider.addFeatures(features)
+		layer.updateExtents()
+		layers[sublayer] = layer
+
+	return layers
+
+
+def group_features_by_ref(layer, aeroway='taxiway', geometry=True):
+	"""
+	Groups the features of a layer tagged with the given aeroway by their ref
+	in a single pass, in order of first appearance. Features without a ref
+	are grouped under 'NULL'. With geometry False only attributes are read.
+
+	Returns a dict of ref to feature list.
+	"""
+	fields = layer.fields()
+	ref_index = fields.indexOf('ref')
+	if fields.indexOf('aeroway') < 0:
+		return {}
+
+	request = QgsFeatureRequest().setFilterExpression(QgsExpression.createFieldEqualityExpression('aeroway', aeroway))
+	if not geometry:
+		request.setFlags(QgsFeatureRequest.NoGeometry)
+
+	groups = {}
+	for feature in layer.getFeatures(request):
+		ref = feature[ref_index] if ref_index >= 0 else None
+		groups.setdefault(str(ref) if ref else 'NULL', []).append(feature)
+	return groups
+
+
+def build_ref_layers(layer, groups, name_prefix='TAXIWAY_'):
+	"""
+	Builds a memory layer named <name_prefix><ref>, with the fields and CRS
+	of layer, for every group of group_features_by_ref. Each layer gets all
+	its features in one call.
+
+	Characters of the ref that are unsafe in file and table names are
+	replaced with '_', and a counter is appended when two refs end up with
+	the same name.
+
+	Returns a dict of ref to layer.
+	"""
+	ref_layers = {}
+	names = set()
+	for ref, features in groups.items():
+		name = base_name = f'{name_prefix}{UNSAFE_NAME_PATTERN.sub("_", ref)}'
+		suffix = 1
+		while name in names:
+			suffix += 1
+			name = f'{base_name}_{suffix}'
+		names.add(name)
+		ref_layer = QgsMemoryProviderUtils.createMemoryLayer(name, layer.fields(), layer.wkbType(), layer.crs())
+		ref_layer.dataProvider().addFeatures(features)
+		ref_layer.updateExtents()
+		ref_layers[ref] = ref_layer
+	return ref_layers
+
+
+def write_layers_to_gpkg(layers, path, table_names=None, overwrite_file=True, spatial_index=True):
+	"""
+	Writes layers to one GeoPackage, one table per sublayer.
+
+	table_names optionally maps sublayer names to table names. Existing
+	files are replaced unless overwrite_file is False, in which case only
+	same-named tables are. QgsVectorFileWriter writes each table inside a
+	single OGR transaction; with spatial_index False the R-tree is not
+	maintained per insert and is left to create_spatial_indexes.
+	"""
+	transform_context = QgsProject.instance().transformContext()
+	action = QgsVectorFileWriter.CreateOrOverwriteFile if overwrite_file else QgsVectorFileWriter.CreateOrOverwriteLayer
+
+	for sublayer, layer in layers.items():
+		save_options = QgsVectorFileWriter.SaveVectorOptions()
+		save_options.driverName = 'GPKG'
+		save_options.layerName = table_names.get(sublayer, sublayer) if table_names else sublayer
+		save_options.actionOnExistingFile = action
+		if not spatial_index:
+			save_options.layerOptions = ['SPATIAL_INDEX=NO']
+		QgsVectorFileWriter.writeAsVectorFormatV3(layer, path, transform_context, save_options)
+		action = QgsVectorFileWriter.CreateOrOverwriteLayer
+
+
+def create_spatial_indexes(path, table_names):
+	"""
+	Builds the spatial index of each GeoPackage table in one pass.
+	"""
+	for table_name in table_names:
+		layer = QgsVectorLayer(f'{path}|layername={table_name}', table_name, 'ogr')
+		if layer.isValid():
+			layer.dataProvider().createSpatialIndex()
+
+
+def delete_features(path, full_ids):
+	"""
+	Deletes the features with the given full_id values from every sublayer
+	table of a GeoPackage written by write_layers_to_gpkg.
+	"""
+	if not full_ids:
+		return
+	id_list = ', '.join(f"'{full_id}'" for full_id in sorted(full_ids))
+	for sublayer in LAYER_GEOMETRIES:
+		layer = QgsVectorLayer(f'{path}|layername={sublayer}', sublayer, 'ogr')
+		if not layer.isValid():
+			continue
+		request = QgsFeatureRequest().setFilterExpression(f'"full_id" IN ({id_list})')
+		request.setFlags(QgsFeatureRequest.NoGeometry)
+		fids = [feature.id() for feature in layer.getFeatures(request)]
+		if fids:
+			layer.dataProvider().deleteFeatures(fids)
+
+
+def append_records(path, records, name='osm'):
+	"""
+	Adds records to the sublayer tables of an existing GeoPackage.
+
+	Tags without a field yet get a new string field, and sublayer tables
+	that do not exist yet are created, as is the file itself.
+	"""
+	for sublayer, layer in build_layers(records, name).items():
+		target = QgsVectorLayer(f'{path}|layername={sublayer}', sublayer, 'ogr')
+		if not target.isValid():
+			write_layers_to_gpkg({sublayer: layer}, path, overwrite_file=not os.path.exists(path))
+			continue
+
+		provider = target.dataProvider()
+		missing_fields = [QgsField(field) for field in layer.fields() if target.fields().indexOf(field.name()) < 0]
+		if missing_fields:
+			provider.addAttributes(missing_fields)
+			target.updateFields()
+
+		features = []
+		for source in layer.getFeatures():
+			feature = QgsFeature(target.fields())
+			feature.setGeometry(source.geometry())
+			for field_name in layer.fields().names():
+				feature[field_name] = source[field_name]
+			features.append(feature)
+		provider.addFeatures(features)
@@ -0,0 +1,216 @@
+# -*- coding: utf-8 -*-
+
+"""
+/***************************************************************************
+ AerodromeUtilities
+                                 A QGIS plugin
+ Fetches OSM Data and processes it for aerodroms with various algorithms
+ Generated by Plugin Builder: http://g-sherman.github.io/Qgis-Plugin-Builder/
+                              -------------------
+        begin                : 2024-09-08
+        copyright            : (C) 2024 by Aiden Omondi
+        email                : helpertech83@gmail.com
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+import gzip
+import hashlib
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+# Guards the index file against concurrent writers in this process
+_index_lock = threading.Lock()
+
+
+class OverpassCache:
+	"""
+	On-disk cache of raw Overpass responses.
+
+	Entries are keyed by the server URL and the whitespace-normalized query.
+	An entry expires ``ttl`` seconds after it was written, and once the cache
+	grows past ``max_size`` bytes the least recently read entries are evicted.
+
+	Responses are stored gzip compressed, written and read as streams, and
+	index.json records the label (the ICAO code), write time and compressed
+	and raw size of each entry.
+	"""
+
+	SUFFIX = '.json.gz'
+	# Uncompressed entries of earlier versions, removed on eviction. Other
+	# files in the directory, which may be an output folder, are left alone
+	LEGACY_PATTERN = re.compile(r'^[0-9a-f]{64}\.json$')
+	ENTRY_PATTERN = re.compile(r'^[0-9a-f]{64}\.json\.gz$')
+	INDEX_FILE = 'index.json'
+	COMPRESS_LEVEL = 6
+
+	def __init__(self, cache_dir, ttl=24 * 3600, max_size=256 * 1024 * 1024):
+		self.cache_dir = cache_dir
+		self.ttl = ttl
+		self.max_size = max_size
+		os.makedirs(cache_dir, exist_ok=True)
+
+	@staticmethod
+	def normalize_query(query):
+		return ' '.join(query.split())
+
+	@classmethod
+	def key(cls, query, server):
+		normalized = f'{server}\n{cls.normalize_query(query)}'
+		return hashlib.sha256(normalized.encode('utf-8')).hexdigest()
+
+	def path(self, query, server):
+		return os.path.join(self.cache_dir, self.key(query, server) + self.SUFFIX)
+
+	def open(self, query, server):
+		"""
+		Opens a cached response for streaming, decompressing reads, or returns
+		None on a miss.
+		"""
+		path = self.path(query, server)
+		try:
+			stat = os.stat(path)
+		except FileNotFoundError:
+			return None
+
+		if self.ttl > 0 and time.time() - stat.st_mtime > self.ttl:
+			self._remove(path)
+			return None
+
+		try:
+			f = gzip.open(path, 'rb')
+		except FileNotFoundError:
+			return None
+
+		# The access time drives LRU eviction, the modification time the TTL
+		os.utime(path, (time.time(), stat.st_mtime))
+		return f
+
+	def get(self, query, server):
+		"""
+		Returns the cached response body as bytes, or None on a miss.
+		"""
+		f = self.open(query, server)
+		if f is None:
+			return None
+		with f:
+			return f.read()
+
+	@contextmanager
+	def writer(self, query, server, label=None):
+		"""
+		Yields a binary file to stream a response into, compressing it as it
+		is written. The entry only becomes visible once the block completes,
+		an interrupted write is discarded.
+		"""
+		fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+		try:
+			with os.fdopen(fd, 'wb') as f:
+				with gzip.GzipFile(fileobj=f, mode='wb', compresslevel=self.COMPRESS_LEVEL) as compressed:
+					yield compressed
+					raw_size = compressed.tell()
+		except BaseException:
+			self._remove(tmp_path)
+			raise
+
+		path = self.path(query, server)
+		os.replace(tmp_path, path)
+		self.update_index(self.key(query, server), {
+			'label': label,
+			'timestamp': time.time(),
+			'size': os.path.getsize(path),
+			'raw_size': raw_size,
+		})
+		self.evict()
+
+	def put(self, query, server, body, label=None):
+		with self.writer(query, server, label) as f:
+			f.write(body)
+
+	def index(self):
+		"""
+		Returns the index as a dict of entry key to label, timestamp, size
+		and raw_size.
+		"""
+		try:
+			with open(os.path.join(self.cache_dir, self.INDEX_FILE), 'r') as f:
+				return json.load(f)
+		except (OSError, ValueError):
+			return {}
+
+	def update_index(self, key, entry=None):
+		"""
+		Records an entry in the index, or drops it when entry is None. Index
+		records of entries no longer on disk are dropped along the way.
+		"""
+		with _index_lock:
+			index = self.index()
+			if entry is None:
+				index.pop(key, None)
+			else:
+				index[key] = entry
+			index = {
+				key: entry for key, entry in index.items()
+				if os.path.exists(os.path.join(self.cache_dir, key + self.SUFFIX))
+			}
+
+			fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+			with os.fdopen(fd, 'w') as f:
+				json.dump(index, f, indent=1)
+			os.replace(tmp_path, os.path.join(self.cache_dir, self.INDEX_FILE))
+
+	def evict(self):
+		"""
+		Removes least recently used entries until the cache fits in max_size.
+		"""
+		entries = []
+		total_size = 0
+		for entry in os.scandir(self.cache_dir):
+			if self.LEGACY_PATTERN.match(entry.name):
+				self._remove(entry.path)
+				continue
+			if not self.ENTRY_PATTERN.match(entry.name):
+				continue
+			stat = entry.stat()
+			entries.append((stat.st_atime, stat.st_size, entry.path))
+			total_size += stat.st_size
+
+		entries.sort()
+		evicted = False
+		for _, size, path in entries:
+			if total_size <= self.max_size:
+				break
+			self._remove(path)
+			total_size -= size
+			evicted = True
+
+		if evicted:
+			self.update_index(None)
+
+	def discard(self, query, server):
+		self._remove(self.path(query, server))
+
+	def clear(self):
+		for entry in os.scandir(self.cache_dir):
+			if self.ENTRY_PATTERN.match(entry.name) or self.LEGACY_PATTERN.match(entry.name):
+				self._remove(entry.path)
+		self.update_index(None)
+
+	def _remove(self, path):
+		try:
+			os.remove(path)
+		except FileNotFoundError:
+			pass
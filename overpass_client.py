@@ -0,0 +1,550 @@
+# -*- coding: utf-8 -*-
+
+"""
+/***************************************************************************
+ AerodromeUtilities
+                                 A QGIS plugin
+ Fetches OSM Data and processes it for aerodroms with various algorithms
+ Generated by Plugin Builder: http://g-sherman.github.io/Qgis-Plugin-Builder/
+                              -------------------
+        begin                : 2024-09-08
+        copyright            : (C) 2024 by Aiden Omondi
+        email                : helpertech83@gmail.com
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+import codecs
+import email.utils
+import json
+import queue
+import re
+import socket
+import threading
+import time
+from contextlib import contextmanager
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# Public Overpass instances, tried in order when one is overloaded or down
+OVERPASS_SERVERS = [
+	'https://overpass-api.de/api/interpreter',
+	'https://overpass.kumi.systems/api/interpreter',
+	'https://maps.mail.ru/osm/tools/overpass/api/interpreter',
+]
+OVERPASS_URL = OVERPASS_SERVERS[0]
+
+# Rate limited and gateway timeout responses, worth retrying after a pause
+RETRY_STATUS_CODES = {429, 502, 503, 504}
+
+# Connect and read timeouts in seconds, the read timeout applies per chunk
+REQUEST_TIMEOUT = (10, 300)
+
+# Upper bound for a server requested Retry-After wait, in seconds
+MAX_RETRY_AFTER = 300
+
+# Connections kept alive per host, enough for every parallel download
+POOL_SIZE = 8
+
+CHUNK_SIZE = 64 * 1024
+
+JSON_WHITESPACE = ' \t\r\n,'
+
+# Timestamps of the database state a response was generated from
+HEADER_PATTERN = re.compile(r'"(timestamp_osm_base|timestamp_areas_base)"\s*:\s*"([^"]*)"')
+
+# Overpass reports queries it aborted in a remark after the elements
+REMARK_PATTERN = re.compile(r'"remark"\s*:\s*"((?:[^"\\]|\\.)*)"')
+
+
+_session = None
+
+
+class OverpassError(Exception):
+	pass
+
+
+class OverpassRuntimeError(OverpassError):
+	"""
+	The server aborted the query because it ran out of time or memory. The
+	same query over a smaller area may succeed.
+	"""
+	pass
+
+
+class OverpassCanceled(OverpassError):
+	pass
+
+
+def shared_session():
+	"""
+	Returns the HTTP session shared by every client in this QGIS session, so
+	consecutive fetches reuse open connections.
+	"""
+	global _session
+	if _session is None:
+		_session = requests.Session()
+		adapter = HTTPAdapter(pool_connections=len(OVERPASS_SERVERS), pool_maxsize=POOL_SIZE)
+		_session.mount('https://', adapter)
+		_session.mount('http://', adapter)
+	return _session
+
+
+def abort_response(response):
+	"""
+	Shuts down the connection of a streaming response, so a read blocked on
+	it in another thread returns immediately instead of at the next chunk.
+	"""
+	try:
+		# requests does not expose the socket of a response being streamed
+		response.raw._fp.fp.raw._sock.shutdown(socket.SHUT_RDWR)
+	except (AttributeError, OSError):
+		pass
+	response.close()
+
+
+def parse_servers(value):
+	"""
+	Splits a comma or whitespace separated server list, falling back to the
+	public Overpass instances when it is empty.
+	"""
+	servers = [server for server in re.split(r'[\s,;]+', value or '') if server]
+	return servers or list(OVERPASS_SERVERS)
+
+
+def retry_after(response):
+	"""
+	Returns the wait a response asks for in its Retry-After header, in
+	seconds, or None when it does not ask for one.
+	"""
+	value = response.headers.get('Retry-After')
+	if not value:
+		return None
+	try:
+		seconds = float(value)
+	except ValueError:
+		try:
+			seconds = email.utils.parsedate_to_datetime(value).timestamp() - time.time()
+		except (TypeError, ValueError):
+			return None
+	return min(max(seconds, 0), MAX_RETRY_AFTER)
+
+
+def iter_elements(chunks, header=None):
+	"""
+	Incrementally parses an Overpass JSON response given as byte chunks and
+	yields the objects of its "elements" array one at a time.
+
+	Only the current, not yet complete element is buffered, so neither the
+	whole body nor the whole decoded element list is ever held in memory.
+	When a header dict is given, the osm3s timestamps are stored in it.
+
+	The rest of the body after the array is read as well, both to raise
+	OverpassError for an error remark, OverpassRuntimeError when Overpass
+	aborted the query part way, and so a write-through cache sees the
+	complete response.
+	"""
+	chunks = iter(chunks)
+	decoder = json.JSONDecoder()
+	text_decoder = codecs.getincrementaldecoder('utf-8')()
+	buffer = ''
+	position = 0
+	in_elements = False
+
+	for chunk in chunks:
+		buffer = buffer[position:] + text_decoder.decode(chunk)
+		position = 0
+
+		if not in_elements:
+			start = buffer.find('"elements"')
+			bracket = buffer.find('[', start) if start != -1 else -1
+			if bracket == -1:
+				# The header before the elements is small, keep all of it
+				continue
+			if header is not None:
+				header.update(HEADER_PATTERN.findall(buffer[:start]))
+			position = bracket + 1
+			in_elements = True
+
+		while True:
+			while position < len(buffer) and buffer[position] in JSON_WHITESPACE:
+				position += 1
+			if position >= len(buffer):
+				break
+			if buffer[position] == ']':
+				trailer = buffer[position + 1:] + ''.join(text_decoder.decode(chunk) for chunk in chunks)
+				remark = REMARK_PATTERN.search(trailer)
+				if remark and 'runtime error' in remark.group(1):
+					raise OverpassRuntimeError(remark.group(1))
+				if remark and 'error' in remark.group(1):
+					raise OverpassError(remark.group(1))
+				return
+			try:
+				element, position = decoder.raw_decode(buffer, position)
+			except json.JSONDecodeError:
+				# The element continues in the next chunk
+				break
+			yield element
+
+	raise OverpassError('Truncated Overpass response')
+
+
+def aerodrome_query(icao_code, timeout=25):
+	"""
+	Query for every element tagged with the given ICAO code, with geometry.
+	"""
+	return f"""
+	[out:json][timeout:{timeout}];
+	(
+	node["icao"="{icao_code}"];
+	way["icao"="{icao_code}"];
+	relation["icao"="{icao_code}"];
+	);
+	out body geom;
+	"""
+
+
+def aerodrome_area_query(icao_code, timeout=25):
+	"""
+	Query for the aerodrome area tagged with the given ICAO code followed by
+	every aeroway element inside it, all with geometry, in one request.
+	"""
+	return f"""
+	[out:json][timeout:{timeout}];
+	(
+	way["aeroway"="aerodrome"]["icao"="{icao_code}"];
+	relation["aeroway"="aerodrome"]["icao"="{icao_code}"];
+	)->.aerodrome;
+	.aerodrome out body geom;
+	.aerodrome map_to_area->.airport;
+	(
+	node["aeroway"](area.airport);
+	way["aeroway"](area.airport);
+	relation["aeroway"](area.airport);
+	);
+	out body geom;
+	"""
+
+
+def aeroway_bbox_query(bbox, geometry=False, timeout=25):
+	"""
+	Query for every aeroway element in a (xmin, ymin, xmax, ymax) bbox.
+	"""
+	south_west_north_east = f'{bbox[1]},{bbox[0]},{bbox[3]},{bbox[2]}'
+	return f"""
+	[out:json][timeout:{timeout}];
+	(
+	node["aeroway"]({south_west_north_east});
+	way["aeroway"]({south_west_north_east});
+	relation["aeroway"]({south_west_north_east});
+	);
+	out body{' geom' if geometry else ''};
+	"""
+
+
+def aeroway_query(value, bbox, timeout=25):
+	"""
+	Query for the aeroway=<value> elements in a (xmin, ymin, xmax, ymax) bbox,
+	followed by the nodes and ways they reference.
+	"""
+	south_west_north_east = f'{bbox[1]},{bbox[0]},{bbox[3]},{bbox[2]}'
+	return f"""
+	[out:json][timeout:{timeout}];
+	(
+	node["aeroway"="{value}"]({south_west_north_east});
+	way["aeroway"="{value}"]({south_west_north_east});
+	relation["aeroway"="{value}"]({south_west_north_east});
+	);
+	out body;
+	>;
+	out skel qt;
+	"""
+
+
+class OverpassClient:
+	"""
+	Runs raw Overpass queries, optionally through an OverpassCache.
+
+	Requests go to the first working server of the list. Connection errors
+	and overloaded responses (429, 502, 503, 504) fail over to the next
+	server; once every server has failed, the client waits for the longest
+	Retry-After they sent, or an exponentially growing backoff, and tries
+	them all again, up to max_attempts rounds.
+
+	With a SlotScheduler every request first waits for a free slot on its
+	server, and waits are reported to feedback. QgsProcessingFeedback is not
+	thread safe, so messages of requests on other threads are queued until
+	the thread that created the client calls flush_log().
+
+	cancel() may be called from any thread, e.g. connected to the canceled
+	signal of a QgsFeedback. Requests waiting for a response, a backoff or a
+	chunk then raise OverpassCanceled right away.
+
+	label, usually the ICAO code being fetched, is recorded in the cache
+	index for every response written to the cache. With FetchMetrics, the
+	bytes read from the cache and downloaded are counted.
+	"""
+
+	def __init__(self, servers=None, cache=None, force_refresh=False, session=None, max_attempts=4, backoff=2.0, timeout=REQUEST_TIMEOUT, scheduler=None, feedback=None, label=None, metrics=None):
+		self.servers = list(servers) if servers else list(OVERPASS_SERVERS)
+		self.cache = cache
+		self.label = label
+		self.metrics = metrics
+		self.force_refresh = force_refresh
+		self.session = session if session is not None else shared_session()
+		self.max_attempts = max_attempts
+		self.backoff = backoff
+		self.timeout = timeout
+		self.scheduler = scheduler
+		self.feedback = feedback
+		self.owner = threading.current_thread()
+		self.log_messages = queue.SimpleQueue()
+		self.server_index = 0
+		self.canceled = threading.Event()
+		self.lock = threading.Lock()
+		self.waiters = set()
+		self.responses = set()
+
+	def cancel(self):
+		"""
+		Aborts every request of this client, now and later.
+		"""
+		self.canceled.set()
+		with self.lock:
+			waiters = list(self.waiters)
+			responses = list(self.responses)
+		for waiter in waiters:
+			waiter.set()
+		for response in responses:
+			abort_response(response)
+		if self.scheduler is not None:
+			self.scheduler.wake()
+
+	def log(self, message):
+		"""
+		Reports a message to feedback, right away on the thread that created
+		the client, otherwise at its next flush_log().
+		"""
+		if self.feedback is None:
+			return
+		if threading.current_thread() is not self.owner:
+			self.log_messages.put(message)
+			return
+		self.flush_log()
+		self.feedback.pushInfo(message)
+
+	def flush_log(self):
+		"""
+		Reports the messages queued by other threads to feedback. Only call
+		it from the thread that created the client.
+		"""
+		while self.feedback is not None:
+			try:
+				message = self.log_messages.get_nowait()
+			except queue.Empty:
+				return
+			self.feedback.pushInfo(message)
+
+	def check_canceled(self):
+		if self.canceled.is_set():
+			raise OverpassCanceled('Overpass request canceled')
+
+	def send(self, server, query):
+		"""
+		Sends a query and waits for the response headers.
+
+		Overpass only answers once the query has run, so the request is made
+		on a helper thread that a cancel does not have to wait for. A
+		response arriving after the cancel is closed unread.
+		"""
+		result = {}
+		done = threading.Event()
+
+		def run():
+			try:
+				result['response'] = self.session.get(server, params={'data': query}, stream=True, timeout=self.timeout)
+			except requests.RequestException as e:
+				result['error'] = e
+			with self.lock:
+				self.waiters.discard(done)
+				if self.canceled.is_set() and 'response' in result:
+					result['response'].close()
+			done.set()
+
+		with self.lock:
+			self.check_canceled()
+			self.waiters.add(done)
+		threading.Thread(target=run, daemon=True).start()
+		done.wait()
+
+		self.check_canceled()
+		if 'error' in result:
+			raise result['error']
+		return result['response']
+
+	def iter_response(self, response):
+		"""
+		Yields the body of a streaming response, checking for a cancel
+		between chunks.
+		"""
+		with self.lock:
+			self.check_canceled()
+			self.responses.add(response)
+		try:
+			for chunk in response.iter_content(CHUNK_SIZE):
+				self.check_canceled()
+				yield chunk
+		except requests.RequestException:
+			# An aborted connection surfaces as a broken stream
+			self.check_canceled()
+			raise
+		finally:
+			with self.lock:
+				self.responses.discard(response)
+		self.check_canceled()
+
+	@property
+	def server(self):
+		""" The server currently in use, cache entries are keyed by the first one """
+		return self.servers[self.server_index]
+
+	@contextmanager
+	def slot(self, server):
+		"""
+		Holds a scheduler slot on the server for the duration of the block.
+		"""
+		if self.scheduler is None:
+			yield
+			return
+		self.scheduler.acquire(server, self.log, self.canceled)
+		try:
+			yield
+		finally:
+			self.scheduler.release(server)
+
+	@contextmanager
+	def open_response(self, query):
+		"""
+		Sends a query, retrying and failing over as needed, and yields the
+		streaming response once a server answers with HTTP 200. The server
+		slot is held until the block completes.
+		"""
+		delay = self.backoff
+		errors = []
+		for attempt in range(self.max_attempts):
+			wait = 0
+			for _ in self.servers:
+				server = self.server
+				with self.slot(server):
+					try:
+						response = self.send(server, query)
+					except requests.RequestException as e:
+						errors.append(f'{server}: {e}')
+					else:
+						if response.status_code == 200:
+							with response:
+								yield response
+							return
+						response.close()
+						if response.status_code not in RETRY_STATUS_CODES:
+							raise OverpassError(f'Overpass returned HTTP {response.status_code}')
+						errors.append(f'{server}: HTTP {response.status_code}')
+						wait = max(wait, retry_after(response) or 0)
+				self.server_index = (self.server_index + 1) % len(self.servers)
+
+			if attempt + 1 < self.max_attempts:
+				if self.canceled.wait(max(wait, delay)):
+					self.check_canceled()
+				delay *= 2
+		raise OverpassError(f'No Overpass server answered ({errors[-1]})')
+
+	@contextmanager
+	def body(self, query):
+		"""
+		Yields the raw response body of a query as an iterator of chunks,
+		streamed from the cache or from the server.
+
+		Server responses are written through to the cache as they arrive,
+		but the entry is only committed when the block completes. A caller
+		that parses the body inside the block, and raises on a truncated or
+		failed response, keeps that response out of the cache.
+		"""
+		cache_server = self.servers[0]
+		if self.cache is not None and not self.force_refresh:
+			f = self.cache.open(query, cache_server)
+			if f is not None:
+				with f:
+					yield self.read_cached(f)
+				return
+
+		with self.open_response(query) as response:
+			if self.cache is None:
+				yield self.read_response(response)
+				return
+
+			with self.cache.writer(query, cache_server, self.label) as f:
+				yield self.read_response(response, f)
+
+	def read_cached(self, f):
+		for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+			self.check_canceled()
+			self.count_bytes('cached bytes', chunk)
+			yield chunk
+
+	def read_response(self, response, f=None):
+		for chunk in self.iter_response(response):
+			if f is not None:
+				f.write(chunk)
+			self.count_bytes('bytes', chunk)
+			yield chunk
+
+	def iter_chunks(self, query):
+		"""
+		Yields the raw response body of a query in chunks, committing it to
+		the cache once it has been read to the end.
+		"""
+		with self.body(query) as chunks:
+			yield from chunks
+
+	def count_bytes(self, counter, chunk):
+		if self.metrics is not None:
+			self.metrics.count(counter, len(chunk))
+
+	def query_bytes(self, query):
+		"""
+		Returns the raw response body of a query.
+		"""
+		return b''.join(self.iter_chunks(query))
+
+	def query(self, query):
+		"""
+		Returns the decoded JSON response of a query.
+		"""
+		return json.loads(self.query_bytes(query))
+
+	def stream_elements(self, query, header=None):
+		"""
+		Yields the elements of a query response as they are parsed.
+
+		The response is only cached once it parsed to a trailer without an
+		error remark, and a cached response that fails to parse is dropped,
+		so a bad response is never replayed until it expires.
+		"""
+		try:
+			with self.body(query) as chunks:
+				yield from iter_elements(chunks, header)
+		except OverpassCanceled:
+			raise
+		except OverpassError:
+			if self.cache is not None:
+				self.cache.discard(query, self.servers[0])
+			raise
@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+
+"""
+/***************************************************************************
+ AerodromeUtilities
+                                 A QGIS plugin
+ Fetches OSM Data and processes it for aerodroms with various algorithms
+ Generated by Plugin Builder: http://g-sherman.github.io/Qgis-Plugin-Builder/
+                              -------------------
+        begin                : 2024-09-08
+        copyright            : (C) 2024 by Aiden Omondi
+        email                : helpertech83@gmail.com
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+from xml.etree.ElementTree import XMLPullParser
+
+from .overpass_client import OverpassError, OverpassRuntimeError
+
+
+def adiff_query(timestamp, bbox, timeout=25):
+	"""
+	Augmented diff query for every aeroway element in a (xmin, ymin, xmax,
+	ymax) bbox that changed since the given OSM timestamp.
+
+	Augmented diffs are only available as XML.
+	"""
+	south_west_north_east = f'{bbox[1]},{bbox[0]},{bbox[3]},{bbox[2]}'
+	return f"""
+	[out:xml][timeout:{timeout}][adiff:"{timestamp}"];
+	(
+	node["aeroway"]({south_west_north_east});
+	way["aeroway"]({south_west_north_east});
+	relation["aeroway"]({south_west_north_east});
+	);
+	out body geom;
+	"""
+
+
+def _geometry_from_xml(xml_element):
+	return [
+		{'lat': float(nd.get('lat')), 'lon': float(nd.get('lon'))}
+		for nd in xml_element.findall('nd')
+		if nd.get('lat') is not None
+	]
+
+
+def element_from_xml(xml_element):
+	"""
+	Converts an Overpass XML node, way or relation into the dict form of
+	Overpass JSON output, so it can go through OsmGeometryBuilder.
+	"""
+	element = {
+		'type': xml_element.tag,
+		'id': int(xml_element.get('id')),
+		'tags': {tag.get('k'): tag.get('v') for tag in xml_element.findall('tag')},
+	}
+
+	if xml_element.tag == 'node':
+		if xml_element.get('lat') is not None:
+			element['lat'] = float(xml_element.get('lat'))
+			element['lon'] = float(xml_element.get('lon'))
+	elif xml_element.tag == 'way':
+		element['geometry'] = _geometry_from_xml(xml_element)
+	elif xml_element.tag == 'relation':
+		element['members'] = [
+			{
+				'type': member.get('type'),
+				'ref': int(member.get('ref')),
+				'role': member.get('role', ''),
+				'geometry': _geometry_from_xml(member),
+			}
+			for member in xml_element.findall('member')
+		]
+	return element
+
+
+def _action_element(xml_action, version):
+	container = xml_action.find(version)
+	if container is None:
+		# create actions hold the new element directly
+		if version == 'old':
+			return None
+		container = xml_action
+	for child in container:
+		if child.tag in ('node', 'way', 'relation'):
+			return element_from_xml(child)
+	return None
+
+
+def iter_adiff_actions(chunks, header=None):
+	"""
+	Incrementally parses an Overpass augmented diff given as byte chunks.
+
+	Yields (action type, old element, new element) tuples, where either
+	element may be None. When a header dict is given, the osm_base timestamp
+	of the diff is stored in it.
+	"""
+	parser = XMLPullParser(events=('start', 'end'))
+	depth = 0
+	finished = False
+
+	for chunk in chunks:
+		parser.feed(chunk)
+		for event, xml_element in parser.read_events():
+			if event == 'start':
+				depth += 1
+				if xml_element.tag == 'meta' and header is not None:
+					header['timestamp_osm_base'] = xml_element.get('osm_base')
+				continue
+
+			depth -= 1
+			if xml_element.tag == 'remark' and 'error' in (xml_element.text or ''):
+				# Runtime errors may succeed as smaller queries, other errors
+				# mean the diff is incomplete all the same
+				remark = xml_element.text.strip()
+				raise OverpassRuntimeError(remark) if 'runtime error' in remark else OverpassError(remark)
+			if xml_element.tag == 'action':
+				yield (
+					xml_element.get('type'),
+					_action_element(xml_element, 'old'),
+					_action_element(xml_element, 'new'),
+				)
+				# Drop the parsed action so memory does not grow with the diff
+				xml_element.clear()
+			if depth == 0:
+				finished = True
+
+	if not finished:
+		raise OverpassError('Truncated Overpass response')
@@ -0,0 +1,206 @@
+# -*- coding: utf-8 -*-
+
+"""
+/***************************************************************************
+ AerodromeUtilities
+                                 A QGIS plugin
+ Fetches OSM Data and processes it for aerodroms with various algorithms
+ Generated by Plugin Builder: http://g-sherman.github.io/Qgis-Plugin-Builder/
+                              -------------------
+        begin                : 2024-09-08
+        copyright            : (C) 2024 by Aiden Omondi
+        email                : helpertech83@gmail.com
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+import re
+import threading
+import time
+
+import requests
+
+from .overpass_client import OverpassCanceled, shared_session
+
+RATE_LIMIT_PATTERN = re.compile(r'^Rate limit: (\d+)', re.M)
+FREE_SLOTS_PATTERN = re.compile(r'^(\d+) slots? available now', re.M)
+SLOT_WAIT_PATTERN = re.compile(r'^Slot available after: \S+, in (-?\d+) seconds?', re.M)
+
+# Seconds between status polls while every slot is busy with no known end
+POLL_INTERVAL = 2
+
+STATUS_TIMEOUT = 10
+
+_scheduler = None
+
+
+def status_url(server):
+	"""
+	Returns the /api/status URL belonging to an /api/interpreter URL.
+	"""
+	return server.rsplit('/', 1)[0] + '/status'
+
+
+def parse_status(text):
+	"""
+	Parses an Overpass /api/status page into a tuple of (rate limit, free
+	slots, seconds until the next slot frees up). The rate limit is None
+	when the page is not an Overpass status page, 0 means unlimited, and the
+	wait is None when no slot is cooling down.
+	"""
+	rate_limit = RATE_LIMIT_PATTERN.search(text)
+	if rate_limit is None:
+		return None, 0, None
+	free_slots = FREE_SLOTS_PATTERN.search(text)
+	waits = [max(int(seconds), 0) for seconds in SLOT_WAIT_PATTERN.findall(text)]
+	return (
+		int(rate_limit.group(1)),
+		int(free_slots.group(1)) if free_slots else 0,
+		min(waits) if waits else None,
+	)
+
+
+def shared_scheduler():
+	"""
+	Returns the slot scheduler shared by every client in this QGIS session,
+	so concurrent fetches queue for the same server slots.
+	"""
+	global _scheduler
+	if _scheduler is None:
+		_scheduler = SlotScheduler()
+	return _scheduler
+
+
+class SlotScheduler:
+	"""
+	Queues Overpass requests until the server has a free slot for them.
+
+	Overpass gives each client IP a number of query slots, and a slot stays
+	blocked for a while after its query finishes. Requests beyond that get a
+	429. The scheduler never runs more requests than the server's rate limit
+	at once, and before each request asks /api/status whether a slot is free,
+	sleeping exactly until the next one frees up otherwise. Servers without a
+	status page are not throttled.
+
+	Status pages are fetched without holding the lock, and slots granted
+	since a status page was requested count against its free slots, as the
+	server may not have seen their requests yet.
+	"""
+
+	def __init__(self, session=None):
+		self.session = session if session is not None else shared_session()
+		self.condition = threading.Condition()
+		self.in_flight = {}
+		self.grants = {}
+		self.rate_limits = {}
+		self.queued = 0
+		self.unsupported = set()
+
+	def poll(self, server):
+		"""
+		Returns the parsed status of a server, or None when it is unknown.
+		Called without holding the lock.
+		"""
+		if server in self.unsupported:
+			return None
+		try:
+			response = self.session.get(status_url(server), timeout=STATUS_TIMEOUT)
+		except requests.RequestException:
+			return None
+		status = parse_status(response.text) if response.status_code == 200 else (None, 0, None)
+		if status[0] is None:
+			self.unsupported.add(server)
+			return None
+		self.rate_limits[server] = status[0]
+		return status
+
+	def own_slots_full(self, server):
+		rate_limit = self.rate_limits.get(server, 0)
+		return rate_limit and self.in_flight.get(server, 0) >= rate_limit
+
+	def wait_time(self, server, status, granted=0):
+		"""
+		Returns how many seconds to wait before sending a request, given a
+		polled status and the slots granted since it was requested: 0 to
+		send it now, or None to wait for one of our own requests to finish.
+		"""
+		if status is None or status[0] == 0:
+			return 0
+		rate_limit, free_slots, next_slot = status
+		if self.in_flight.get(server, 0) >= rate_limit:
+			return None
+		if free_slots - granted > 0:
+			return 0
+		return next_slot if next_slot is not None else POLL_INTERVAL
+
+	def acquire(self, server, report=None, canceled=None):
+		"""
+		Blocks until a request to the server may be sent, passing messages
+		about the wait to report. Raises OverpassCanceled once the canceled
+		event is set, waiters are woken for that by wake().
+
+		Requests wait on worker threads, so report must be safe to call from
+		any thread, such as OverpassClient.log.
+		"""
+		started = time.monotonic()
+		with self.condition:
+			self.queued += 1
+		try:
+			while True:
+				with self.condition:
+					self.check_canceled(canceled)
+					own_slots_full = self.own_slots_full(server)
+					grants = self.grants.get(server, 0)
+
+				status = None if own_slots_full else self.poll(server)
+
+				with self.condition:
+					self.check_canceled(canceled)
+					if own_slots_full or self.own_slots_full(server):
+						wait = None
+					else:
+						wait = self.wait_time(server, status, self.grants.get(server, 0) - grants)
+					if wait == 0:
+						self.in_flight[server] = self.in_flight.get(server, 0) + 1
+						self.grants[server] = self.grants.get(server, 0) + 1
+						break
+					if report is not None:
+						if wait is None:
+							report(f"All Overpass slots on {server} are in use, {self.queued} request(s) queued")
+						else:
+							report(f"Next Overpass slot on {server} frees up in {wait} s, {self.queued} request(s) queued")
+					self.condition.wait(POLL_INTERVAL if wait is None else wait)
+		finally:
+			with self.condition:
+				self.queued -= 1
+
+		waited = time.monotonic() - started
+		if report is not None and waited >= 1:
+			report(f"Got an Overpass slot after {waited:.0f} s, {self.queued} request(s) still queued")
+
+	def check_canceled(self, canceled):
+		if canceled is not None and canceled.is_set():
+			raise OverpassCanceled('Canceled while waiting for an Overpass slot')
+
+	def wake(self):
+		"""
+		Wakes up every queued request, so canceled ones stop waiting.
+		"""
+		with self.condition:
+			self.condition.notify_all()
+
+	def release(self, server):
+		"""
+		Frees the slot of a finished request and wakes up queued requests.
+		"""
+		with self.condition:
+			self.in_flight[server] -= 1
+			self.condition.notify_all()
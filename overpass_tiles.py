@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+
+"""
+/***************************************************************************
+ AerodromeUtilities
+                                 A QGIS plugin
+ Fetches OSM Data and processes it for aerodroms with various algorithms
+ Generated by Plugin Builder: http://g-sherman.github.io/Qgis-Plugin-Builder/
+                              -------------------
+        begin                : 2024-09-08
+        copyright            : (C) 2024 by Aiden Omondi
+        email                : helpertech83@gmail.com
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+import math
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from .overpass_client import OverpassRuntimeError
+
+# Seconds between reports of the messages of worker threads
+LOG_INTERVAL = 1
+
+# Approximate length of one degree of latitude, in metres
+METRES_PER_DEGREE = 111320
+
+
+def bbox_grid(bbox, tile_size):
+	"""
+	Splits a (xmin, ymin, xmax, ymax) bbox in degrees into a grid of tiles no
+	larger than tile_size metres a side. Small bboxes stay a single tile.
+	"""
+	xmin, ymin, xmax, ymax = bbox
+	latitude = math.radians((ymin + ymax) / 2)
+	width = (xmax - xmin) * METRES_PER_DEGREE * math.cos(latitude)
+	height = (ymax - ymin) * METRES_PER_DEGREE
+	columns = max(1, math.ceil(width / tile_size))
+	rows = max(1, math.ceil(height / tile_size))
+
+	step_x = (xmax - xmin) / columns
+	step_y = (ymax - ymin) / rows
+	return [
+		(
+			xmin + column * step_x,
+			ymin + row * step_y,
+			xmax if column == columns - 1 else xmin + (column + 1) * step_x,
+			ymax if row == rows - 1 else ymin + (row + 1) * step_y,
+		)
+		for row in range(rows)
+		for column in range(columns)
+	]
+
+
+def subdivide_bbox(bbox):
+	"""
+	Splits a bbox into its four quadrants.
+	"""
+	xmin, ymin, xmax, ymax = bbox
+	x = (xmin + xmax) / 2
+	y = (ymin + ymax) / 2
+	return [(xmin, ymin, x, y), (x, ymin, xmax, y), (xmin, y, x, ymax), (x, y, xmax, ymax)]
+
+
+def fetch_tiled_elements(client, query_for_bbox, bbox, tile_size, concurrency=1, max_depth=3, feedback=None, header=None):
+	"""
+	Runs query_for_bbox(tile) for every tile of bbox on a bounded worker pool
+	and returns the merged elements, each OSM element once.
+
+	Tiles Overpass aborts for running out of time or memory are split into
+	quadrants and fetched again, at most max_depth times. When a header dict
+	is given it receives the oldest osm_base timestamp of all tiles, so a
+	later diff covers changes made while the tiles were fetched.
+	"""
+	def fetch(tile):
+		tile_header = {}
+		return list(client.stream_elements(query_for_bbox(tile), tile_header)), tile_header
+
+	elements = {}
+	finished = 0
+	with ThreadPoolExecutor(max_workers=concurrency) as executor:
+		futures = {executor.submit(fetch, tile): (tile, 0) for tile in bbox_grid(bbox, tile_size)}
+		if feedback is not None:
+			feedback.pushInfo(f"Fetching {len(futures)} tile(s)")
+		try:
+			while futures:
+				# Wakes up regularly to report slot waits of the workers
+				done, _ = wait(futures, timeout=LOG_INTERVAL, return_when=FIRST_COMPLETED)
+				client.flush_log()
+				for future in done:
+					tile, depth = futures.pop(future)
+					try:
+						tile_elements, tile_header = future.result()
+					except OverpassRuntimeError as e:
+						if depth >= max_depth:
+							raise
+						if feedback is not None:
+							feedback.pushInfo(f"Tile {tile} was aborted ({e}), splitting it in four")
+						for quadrant in subdivide_bbox(tile):
+							futures[executor.submit(fetch, quadrant)] = (quadrant, depth + 1)
+						continue
+
+					finished += 1
+					if feedback is not None:
+						feedback.setProgress(100 * finished / (finished + len(futures)))
+					for element in tile_elements:
+						elements.setdefault((element['type'], element['id']), element)
+					if header is not None and 'timestamp_osm_base' in tile_header:
+						header['timestamp_osm_base'] = min(header.get('timestamp_osm_base', tile_header['timestamp_osm_base']), tile_header['timestamp_osm_base'])
+		except BaseException:
+			for future in futures:
+				future.cancel()
+			raise
+	return list(elements.values())
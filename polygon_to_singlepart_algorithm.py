@@ -41,7 +41,8 @@ from qgis.core import (
 	QgsVectorLayer,
 	QgsField,
 )
-from qgis.PyQt.QtGui import QColor
+
+from .color_profile import ColorEntry, ColorProfileError
 
 
 class PolygonToSinglePartLinesAlgorithm(QgsProcessingAlgorithm):
@@ -60,14 +61,11 @@ class PolygonToSinglePartLinesAlgorithm(QgsProcessingAlgorithm):
 		map_layer = QgsProcessingUtils.mapLayerFromString(
 			layer_source, context)
 		
-		color = None
-		ts_color = None
-		gr_color = None
-
-		if map_layer:
-			color = map_layer.customProperty('color', None)
-			ts_color = map_layer.customProperty('ts_color', None)
-			gr_color = map_layer.customProperty('gr_color', None)
+		try:
+			color_entry = ColorEntry.from_layer(map_layer) if map_layer else None
+		except ColorProfileError as e:
+			feedback.reportError(str(e))
+			return {}
 		
 		if layer is None:
 			feedback.reportError('Could not load input layer!')
@@ -125,14 +123,8 @@ class PolygonToSinglePartLinesAlgorithm(QgsProcessingAlgorithm):
 
 		output_layer = QgsProcessingUtils.mapLayerFromString(dest_id, context)
 
-		if output_layer and color:
-			output_layer.setCustomProperty('color', color)
-			output_layer.setCustomProperty('ts_color', ts_color)
-			output_layer.setCustomProperty('gr_color', gr_color)
-			color_comp = color.split(",")
-			color_ints = list(map(int, color_comp))
-			output_layer.renderer().symbol().setColor(
-				QColor().fromRgb(color_ints[0], color_ints[1], color_ints[2]))
+		if output_layer and color_entry:
+			color_entry.apply(output_layer)
 
 		feedback.pushInfo('Algorithm completed successfully.')
 		return {self.OUTPUT: dest_id}
@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+
+"""
+/***************************************************************************
+ AerodromeUtilities
+                                 A QGIS plugin
+ Fetches OSM Data and processes it for aerodroms with various algorithms
+ Generated by Plugin Builder: http://g-sherman.github.io/Qgis-Plugin-Builder/
+                              -------------------
+        begin                : 2024-09-08
+        copyright            : (C) 2024 by Aiden Omondi
+        email                : helpertech83@gmail.com
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+from qgis.PyQt.QtCore import QCoreApplication
+from qgis.core import (
+	QgsApplication,
+	QgsProcessingAlgorithm,
+	QgsProcessingContext,
+	QgsProcessingException,
+	QgsProcessingFeedback,
+	QgsProcessingParameterFile,
+	QgsProcessingParameterString,
+)
+
+from .batch_fetch_osm_data_algorithm import BatchFetchOSMDataAlgorithm
+from .fetch_osm_data_algorithm import FetchOSMDataAlgorithm
+from .overpass_client import OverpassClient, parse_servers
+from .overpass_slots import shared_scheduler
+from .prefetch_task import PrefetchTask
+
+
+class PrefetchOSMDataAlgorithm(QgsProcessingAlgorithm):
+
+	ICAO_CODES = 'ICAO_CODES'
+	ICAO_FILE = 'ICAO_FILE'
+
+	# Fetch options that decide which queries a fetch sends and where they
+	# are cached, so the prefetch sends the same ones
+	FORWARDED_PARAMETERS = [
+		FetchOSMDataAlgorithm.BATCHED_FETCH,
+		FetchOSMDataAlgorithm.AREA_QUERY,
+		FetchOSMDataAlgorithm.DOWNLOAD_CONCURRENCY,
+		FetchOSMDataAlgorithm.QUERY_TIMEOUT,
+		FetchOSMDataAlgorithm.TILE_SIZE,
+		FetchOSMDataAlgorithm.OVERPASS_SERVERS,
+		FetchOSMDataAlgorithm.WAIT_FOR_SLOTS,
+		FetchOSMDataAlgorithm.CACHE_DIR,
+		FetchOSMDataAlgorithm.CACHE_TTL,
+		FetchOSMDataAlgorithm.CACHE_MAX_SIZE,
+	]
+
+	def initAlgorithm(self, config=None):
+		self.addParameter(QgsProcessingParameterString(self.ICAO_CODES, 'ICAO Codes (comma or space separated)', optional=True))
+		self.addParameter(QgsProcessingParameterFile(self.ICAO_FILE, 'ICAO Code List (text file or QuickOSM step JSON)', optional=True))
+
+		self.fetch_algorithm = FetchOSMDataAlgorithm()
+		self.fetch_algorithm.initAlgorithm()
+		for name in self.FORWARDED_PARAMETERS:
+			self.addParameter(self.fetch_algorithm.parameterDefinition(name).clone())
+
+	def flags(self):
+		# Queues a task with the task manager, which must happen on the main thread
+		return super().flags() | QgsProcessingAlgorithm.FlagNoThreading
+
+	def processAlgorithm(self, parameters, context: QgsProcessingContext, feedback: QgsProcessingFeedback):
+		icao_codes = BatchFetchOSMDataAlgorithm().read_icao_codes(
+			self.parameterAsString(parameters, self.ICAO_CODES, context),
+			self.parameterAsString(parameters, self.ICAO_FILE, context)
+		)
+		if not icao_codes:
+			raise QgsProcessingException('No ICAO codes given.')
+
+		fetch_parameters = {name: parameters[name] for name in self.FORWARDED_PARAMETERS if name in parameters}
+		cache = self.fetch_algorithm.cache_from_parameters(fetch_parameters, context)
+		if cache is None:
+			raise QgsProcessingException('Prefetching needs the Overpass cache, set a cache lifetime above 0.')
+
+		client = OverpassClient(
+			servers=parse_servers(self.parameterAsString(parameters, FetchOSMDataAlgorithm.OVERPASS_SERVERS, context)),
+			cache=cache,
+			scheduler=shared_scheduler() if self.parameterAsBoolean(parameters, FetchOSMDataAlgorithm.WAIT_FOR_SLOTS, context) else None
+		)
+		task = PrefetchTask(
+			icao_codes,
+			client,
+			FetchOSMDataAlgorithm.FEATURE_TYPES,
+			batched_fetch=self.parameterAsBoolean(parameters, FetchOSMDataAlgorithm.BATCHED_FETCH, context),
+			area_query=self.parameterAsBoolean(parameters, FetchOSMDataAlgorithm.AREA_QUERY, context),
+			query_timeout=self.parameterAsInt(parameters, FetchOSMDataAlgorithm.QUERY_TIMEOUT, context),
+			tile_size=self.parameterAsInt(parameters, FetchOSMDataAlgorithm.TILE_SIZE, context),
+			concurrency=self.parameterAsInt(parameters, FetchOSMDataAlgorithm.DOWNLOAD_CONCURRENCY, context)
+		)
+		task.start(QgsApplication.taskManager())
+
+		feedback.pushInfo(f"Prefetching {len(icao_codes)} airport(s) in the background, see the task manager for progress")
+		return {'Queued airports': icao_codes}
+
+	def name(self):
+		return 'prefetchosmdata'
+
+	def displayName(self):
+		return 'Prefetch OSM Data'
+
+	def group(self):
+		return self.tr(self.groupId())
+
+	def groupId(self):
+		return ''
+
+	def tr(self, string):
+		return QCoreApplication.translate('Processing', string)
+
+	def createInstance(self):
+		return PrefetchOSMDataAlgorithm()
@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+
+"""
+/***************************************************************************
+ AerodromeUtilities
+                                 A QGIS plugin
+ Fetches OSM Data and processes it for aerodroms with various algorithms
+ Generated by Plugin Builder: http://g-sherman.github.io/Qgis-Plugin-Builder/
+                              -------------------
+        begin                : 2024-09-08
+        copyright            : (C) 2024 by Aiden Omondi
+        email                : helpertech83@gmail.com
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+from qgis.core import Qgis, QgsMessageLog, QgsTask
+
+from .osm_layer_builder import element_records, records_extent
+from .overpass_client import OverpassError, aerodrome_area_query, aerodrome_query, aeroway_bbox_query, aeroway_query
+from .overpass_tiles import fetch_tiled_elements
+
+# Python references to running tasks, the task manager only keeps the C++ side
+_running_tasks = set()
+
+
+class PrefetchTask(QgsTask):
+	"""
+	Warms the Overpass cache for a list of airports in the background.
+
+	For each airport it sends exactly the queries FetchOSMDataAlgorithm sends
+	with the same options, through a client writing to the same cache, so a
+	later fetch of that airport never waits for the network.
+	"""
+
+	def __init__(self, icao_codes, client, feature_types, batched_fetch=False, area_query=False, query_timeout=25, tile_size=0, concurrency=1):
+		super().__init__(f'Prefetch OSM data for {len(icao_codes)} airport(s)', QgsTask.CanCancel)
+		self.icao_codes = icao_codes
+		self.client = client
+		self.feature_types = feature_types
+		self.batched_fetch = batched_fetch or tile_size > 0
+		self.area_query = area_query
+		self.query_timeout = query_timeout
+		self.tile_size = tile_size
+		self.concurrency = concurrency
+		self.completed = []
+		self.failed = {}
+
+	def start(self, task_manager):
+		_running_tasks.add(self)
+		task_manager.addTask(self)
+
+	def run(self):
+		for index, icao_code in enumerate(self.icao_codes):
+			if self.isCanceled():
+				return False
+			try:
+				self.prefetch(icao_code)
+				self.completed.append(icao_code)
+			except (OverpassError, OSError) as e:
+				self.failed[icao_code] = str(e)
+			self.setProgress(100 * (index + 1) / len(self.icao_codes))
+		return True
+
+	def cancel(self):
+		self.client.cancel()
+		super().cancel()
+
+	def prefetch(self, icao_code):
+		self.client.label = icao_code
+		if self.area_query:
+			list(self.client.stream_elements(aerodrome_area_query(icao_code, self.query_timeout)))
+			return
+
+		ad_records = list(element_records(list(self.client.stream_elements(aerodrome_query(icao_code, self.query_timeout)))))
+		ad_extent = records_extent(ad_records)
+		if ad_extent is None:
+			raise OverpassError(f'No aerodrome area tagged icao={icao_code}')
+		ad_bbox = (ad_extent.xMinimum(), ad_extent.yMinimum(), ad_extent.xMaximum(), ad_extent.yMaximum())
+
+		if self.tile_size > 0:
+			fetch_tiled_elements(
+				self.client,
+				lambda tile: aeroway_bbox_query(tile, geometry=True, timeout=self.query_timeout),
+				ad_bbox,
+				self.tile_size,
+				self.concurrency
+			)
+			return
+
+		aeroways = {
+			element['tags']['aeroway']
+			for element in self.client.stream_elements(aeroway_bbox_query(ad_bbox, geometry=self.batched_fetch, timeout=self.query_timeout))
+			if 'aeroway' in element.get('tags', {})
+		}
+		if not self.batched_fetch:
+			for feature in self.feature_types:
+				if feature in aeroways and not self.isCanceled():
+					list(self.client.stream_elements(aeroway_query(feature, ad_bbox, self.query_timeout)))
+
+	def finished(self, result):
+		_running_tasks.discard(self)
+		message = f"Prefetched {len(self.completed)} airport(s)"
+		if self.failed:
+			message += ', failed: ' + ', '.join(f'{icao_code} ({error})' for icao_code, error in self.failed.items())
+		level = Qgis.Info if result and not self.failed else Qgis.Warning
+		QgsMessageLog.logMessage(message, 'Aerodrome Utilities', level)
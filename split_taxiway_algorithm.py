@@ -26,10 +26,9 @@ from qgis.PyQt.QtCore import QCoreApplication
 from qgis.core import (
 	QgsProcessingAlgorithm,
 	QgsProcessingParameterVectorLayer,
-	QgsVectorLayer,
-	QgsFeatureRequest,
 	QgsProject
 )
+from .osm_layer_builder import build_ref_layers, group_features_by_ref
 
 class SplitTaxiwayAlgorithm(QgsProcessingAlgorithm):
 	INPUT = 'INPUT'
@@ -40,36 +39,10 @@ class SplitTaxiwayAlgorithm(QgsProcessingAlgorithm):
 	def processAlgorithm(self, parameters, context, feedback):
 		layer = self.parameterAsVectorLayer(parameters, self.INPUT, context)
 
-		discovered_taxiway_ref_codes = []
-		ref_layers = []
-		taxiway = False
-		
-		for layer_feature in layer.getFeatures():
-			
-			aeroway = "N/A"
-			ref = "NULL"
-
-			if "aeroway" in layer_feature.fields().names():
-				aeroway = layer_feature["aeroway"]
-
-			if aeroway == "taxiway":
-				taxiway = True
-
-				if "ref" in layer_feature.fields().names():
-					ref = layer_feature["ref"]
-
-				if ref not in discovered_taxiway_ref_codes:
-					discovered_taxiway_ref_codes.append(ref)
-		
-		if taxiway:
-			for ref in discovered_taxiway_ref_codes:
-				layer.selectByExpression(f'"ref"=\'{ref}\'', QgsVectorLayer.SetSelection)
-				ref_layer = layer.materialize(QgsFeatureRequest().setFilterFids(layer.selectedFeatureIds()))
-				ref_layer.setName(f'TAXIWAY_{ref}')
-				ref_layers.append(ref_layer)
-
-				layer.removeSelection()						
-			QgsProject.instance().addMapLayers(ref_layers)
+		# One pass over the features, one layer per taxiway ref
+		ref_layers = build_ref_layers(layer, group_features_by_ref(layer, 'taxiway'))
+		if ref_layers:
+			QgsProject.instance().addMapLayers(list(ref_layers.values()))
 		return {}
 
 	def name(self):
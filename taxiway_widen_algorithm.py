@@ -30,22 +30,26 @@ __copyright__ = '(C) 2024 by Aiden Omondi'
 
 __revision__ = '$Format:%H$'
 
+import os
+
 from qgis.PyQt.QtCore import QCoreApplication
-from qgis import processing
 from qgis.core import (
+                       QgsFeature,
                        QgsFeatureSink,
                        QgsProcessingAlgorithm,
                        QgsProcessingParameterFeatureSink,
                        QgsProcessingParameterFeatureSource,
                        QgsProcessingParameterNumber,
                        QgsCoordinateReferenceSystem,
-                       QgsVectorLayer,
                        QgsProcessingParameterEnum,
                        QgsProcessingParameterBoolean,
-                       QgsProject,
-                       QgsProcessingUtils
+                       QgsProcessingParameterExpression,
+                       QgsProcessingUtils,
+                       QgsWkbTypes
                        )
-from qgis.PyQt.QtGui import QColor
+
+from .color_profile import ColorEntry, ColorProfileError
+from .widening_engine import CODE_LETTER_WIDTHS, METRIC_CRS_AEQD, FeatureWidth, WideningEngine, boundary_lines, local_metric_crs
 
 
 class TaxiwayWidenerAlgorithm(QgsProcessingAlgorithm):
@@ -72,6 +76,12 @@ class TaxiwayWidenerAlgorithm(QgsProcessingAlgorithm):
     BUFFER_CAP_STYLE = 'BUFFER_CAP_STYLE'
     DISSOLVE = 'DISSOLVE'
     AUTO_POLY_LINESTRING = 'AUTO_POLY_LINESTRING'
+    METRIC_CRS = 'METRIC_CRS'
+    WIDTH_EXPRESSION = 'WIDTH_EXPRESSION'
+    CODE_LETTER = 'CODE_LETTER'
+    THREADS = 'THREADS'
+    # Code letter choices after the first, which keeps the Buffer Distance
+    CODE_LETTERS = list(CODE_LETTER_WIDTHS)
 
 
 
@@ -82,6 +92,10 @@ class TaxiwayWidenerAlgorithm(QgsProcessingAlgorithm):
         self.addParameter(QgsProcessingParameterEnum(self.BUFFER_CAP_STYLE, 'Buffer Cap Style', options=['Round', 'Flat', 'Square'], defaultValue=0))
         self.addParameter(QgsProcessingParameterBoolean(self.AUTO_POLY_LINESTRING, 'Convert result to linestring'))
         self.addParameter(QgsProcessingParameterBoolean(self.DISSOLVE, 'Dissolve result'))
+        self.addParameter(QgsProcessingParameterExpression(self.WIDTH_EXPRESSION, 'Width Expression (metres, e.g. "width")', parentLayerParameterName=self.INPUT, optional=True))
+        self.addParameter(QgsProcessingParameterEnum(self.CODE_LETTER, 'Width without an expression value', options=['Buffer Distance'] + [f'Code letter {letter} ({width:g} m)' for letter, width in CODE_LETTER_WIDTHS.items()], defaultValue=0))
+        self.addParameter(QgsProcessingParameterNumber(self.THREADS, 'Buffering threads (0 uses every core)', defaultValue=1, minValue=0))
+        self.addParameter(QgsProcessingParameterEnum(self.METRIC_CRS, 'Buffer in', options=['Azimuthal equidistant projection centred on the layer', 'UTM zone of the layer', 'Web Mercator (EPSG:3857)'], defaultValue=METRIC_CRS_AEQD))
         self.addParameter(QgsProcessingParameterFeatureSink(self.OUTPUT, 'Output Layer'))
 
     def processAlgorithm(self, parameters, context, feedback):
@@ -94,105 +108,89 @@ class TaxiwayWidenerAlgorithm(QgsProcessingAlgorithm):
         
         feedback.pushInfo(f'Input layer loaded: {layer.sourceName()}')
 
-        # Calculate the centroid of the layer's extent
-
-        # Calculate the UTM zone
-        # utm_zone = int((longitude + 180) / 6) + 1
-
-
-        # Determine the hemisphere (Northern/Southern)
-        # hemisphere = '322' if centroid.y() >= 0 else '323'  # EPSG:326xx for Northern, EPSG:327xx for Southern
-        epsg_code = 3857
-
-        # feedback.pushInfo(f'Calculated UTM zone: {utm_zone}, EPSG: {epsg_code}')
-        layer_source = self.parameterAsString(parameters, self.INPUT, context)
-        map_layer = QgsProcessingUtils.mapLayerFromString(layer_source, context)
-        color = None
-        ts_color = None
-        gr_color = None
-
-        if map_layer:
-            color = map_layer.customProperty('color', None)
-            ts_color = map_layer.customProperty('ts_color', None)
-            gr_color = map_layer.customProperty('gr_color', None)
+        # Buffer in a projection local to the layer, so the distance is in
+        # true metres at any latitude
+        metric_crs = local_metric_crs(
+            layer.sourceExtent(),
+            layer.sourceCrs(),
+            context.transformContext(),
+            self.parameterAsEnum(parameters, self.METRIC_CRS, context)
+        )
+
+        # Works for layer objects as well as ids and paths, so callers do
+        # not need to register the input in the project first
+        map_layer = self.parameterAsVectorLayer(parameters, self.INPUT, context)
+        try:
+            color_entry = ColorEntry.from_layer(map_layer) if map_layer else None
+        except ColorProfileError as e:
+            feedback.reportError(str(e))
+            return {}
 
+        buffer_distance = self.parameterAsDouble(parameters, self.BUFFER_DISTANCE, context) / 2
 
-        # Reproject to the calculated UTM CRS
-        feedback.pushInfo('Reprojecting to calculated UTM CRS...')
-        reprojected_layer = processing.run("qgis:reprojectlayer", {
-            'INPUT': layer_source,
-            'TARGET_CRS': QgsCoordinateReferenceSystem(f'EPSG:{epsg_code}'),
-            'OUTPUT': 'memory:'
-        }, context=context, feedback=feedback)['OUTPUT']
-        
-        if reprojected_layer is None:
-            feedback.reportError('Reprojection failed!')
+        # Widths from the expression, then the code letter or Buffer Distance
+        code_letter = self.parameterAsEnum(parameters, self.CODE_LETTER, context)
+        default_width = CODE_LETTER_WIDTHS[self.CODE_LETTERS[code_letter - 1]] if code_letter > 0 else buffer_distance * 2
+        width = FeatureWidth(
+            self.parameterAsExpression(parameters, self.WIDTH_EXPRESSION, context),
+            default_width,
+            self.createExpressionContext(parameters, context, layer)
+        )
+        if width.error():
+            feedback.reportError(f'Invalid width expression: {width.error()}')
+            return {}
+        if width.expression is not None and default_width <= 0:
+            feedback.reportError('A width expression needs a Buffer Distance or Code Letter as its fallback width!')
             return {}
-        
-        # Buffer the reprojected layer
-        feedback.pushInfo('Buffering the reprojected layer...')
-        buffer_distance = self.parameterAsDouble(parameters, self.BUFFER_DISTANCE, context) / 2
         dissolve = self.parameterAsBoolean(parameters, self.DISSOLVE, context)
         cap_style = self.parameterAsInt(parameters, self.BUFFER_CAP_STYLE, context)
-
-        buffered_layer: QgsVectorLayer = processing.run("qgis:buffer", {
-            'INPUT': reprojected_layer,
-            'DISTANCE': buffer_distance,
-            'DISSOLVE': dissolve,
-            'END_CAP_STYLE': cap_style,
-            'OUTPUT': 'TEMPORARY_OUTPUT'
-        }, context=context, feedback=feedback)['OUTPUT']
-        
-        if buffered_layer is None:
-            feedback.reportError('Buffering failed!')
+        auto_poly_linestring = self.parameterAsBoolean(parameters, self.AUTO_POLY_LINESTRING, context)
+        threads = self.parameterAsInt(parameters, self.THREADS, context) or os.cpu_count() or 1
+
+        # Transform, buffer and transform back feature by feature, straight
+        # into the sink
+        feedback.pushInfo(f'Buffering in {metric_crs.authid() or metric_crs.toProj()}...')
+        engine = WideningEngine(
+            layer.sourceCrs(),
+            context.transformContext(),
+            buffer_distance,
+            cap_style,
+            metric_crs=metric_crs,
+            output_crs=QgsCoordinateReferenceSystem('EPSG:4326')
+        )
+
+        fields = layer.fields()
+        wkb_type = QgsWkbTypes.LineString if auto_poly_linestring else QgsWkbTypes.MultiPolygon
+        (sink, dest_id) = self.parameterAsSink(parameters, self.OUTPUT, context,
+                                               fields, wkb_type, engine.output_crs)
+        if sink is None:
+            feedback.reportError('Could not create the output layer!')
             return {}
-        
-        # Reproject back to the original CRS
-        feedback.pushInfo('Reprojecting back to the original CRS...')
-        
-        QgsProject.instance().addMapLayer(buffered_layer)
 
-        repr_layer = processing.run("qgis:reprojectlayer", {
-            'INPUT': buffered_layer.id(),
-            'TARGET_CRS': QgsCoordinateReferenceSystem('EPSG:4326'),
-            'OUTPUT': 'memory:'
-        }, context=context, feedback=feedback)['OUTPUT']
+        # Split ring lines get fresh fids, so GeoPackage outputs stay unique
+        fid_index = fields.indexFromName('fid')
+        line_count = 0
 
-        QgsProject.instance().removeMapLayer(buffered_layer)
+        for feature in engine.widen(layer.getFeatures(), dissolve, feedback, layer.featureCount(), lambda feature: width(feature) / 2, threads):
+            if not auto_poly_linestring or not feature.hasGeometry():
+                sink.addFeature(feature, QgsFeatureSink.FastInsert)
+                continue
 
-        auto_poly_linestring = self.parameterAsBoolean(parameters, self.AUTO_POLY_LINESTRING, context)
+            for line in boundary_lines(feature.geometry()):
+                line_count += 1
+                line_feature = QgsFeature(feature)
+                line_feature.setGeometry(line)
+                if fid_index >= 0:
+                    line_feature.setAttribute(fid_index, line_count)
+                sink.addFeature(line_feature, QgsFeatureSink.FastInsert)
 
-        if auto_poly_linestring: 
-            final_layer = processing.run("aerodromeutilities:polygontosinglepart", {
-                'INPUT': repr_layer,
-                'OUTPUT':'memory:'
-            })['OUTPUT']
-        else:
-            final_layer = repr_layer
-        
-
-
-        if final_layer is None:
-            feedback.reportError('Final reprojection failed!')
+        if feedback.isCanceled():
             return {}
 
-        # Output the final layer
-        (sink, dest_id) = self.parameterAsSink(parameters, self.OUTPUT, context,
-                                               layer.fields(), final_layer.wkbType(), final_layer.sourceCrs())
-        
-        for feature in final_layer.getFeatures():
-            sink.addFeature(feature, QgsFeatureSink.FastInsert)
-
-
         output_layer = QgsProcessingUtils.mapLayerFromString(dest_id, context)
 
-        if output_layer and color:
-            output_layer.setCustomProperty('color', color)
-            output_layer.setCustomProperty('ts_color', ts_color)
-            output_layer.setCustomProperty('gr_color', gr_color)
-            color_comp = color.split(",")
-            color_ints = list(map(int, color_comp))
-            output_layer.renderer().symbol().setColor(QColor().fromRgb(color_ints[0], color_ints[1], color_ints[2]))
+        if output_layer and color_entry:
+            color_entry.apply(output_layer)
 
         feedback.pushInfo('Algorithm completed successfully.')
         return {self.OUTPUT: dest_id}
@@ -0,0 +1,100 @@
+# coding=utf-8
+"""Tests for the batch OSM fetch algorithm."""
+
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from qgis.core import QgsProcessingContext, QgsProcessingException, QgsProcessingFeedback
+
+from .utilities import get_qgis_app
+from .. import batch_fetch_osm_data_algorithm
+from ..batch_fetch_osm_data_algorithm import BatchFetchOSMDataAlgorithm
+from ..fetch_osm_data_algorithm import FetchOSMDataAlgorithm
+
+QGIS_APP = get_qgis_app()
+
+
+class BatchFetchTest(unittest.TestCase):
+    """Test reading ICAO code lists and resuming batches."""
+
+    def setUp(self):
+        self.output_dir = tempfile.mkdtemp()
+        self.fetched = []
+        self.errors = {}
+
+    def tearDown(self):
+        shutil.rmtree(self.output_dir)
+
+    def write_file(self, name, text):
+        path = os.path.join(self.output_dir, name)
+        with open(path, 'w') as f:
+            f.write(text)
+        return path
+
+    def fake_fetch(self, algorithm_id, parameters, **kwargs):
+        icao_code = parameters[FetchOSMDataAlgorithm.ICAO_CODE]
+        self.fetched.append(icao_code)
+        if icao_code in self.errors:
+            raise QgsProcessingException(self.errors[icao_code])
+        return {'Output directory': parameters[FetchOSMDataAlgorithm.OUTPUT_DIR]}
+
+    def run_batch(self, icao_codes, parameters=None):
+        algorithm = BatchFetchOSMDataAlgorithm()
+        algorithm.initAlgorithm()
+        parameters = {
+            BatchFetchOSMDataAlgorithm.ICAO_CODES: icao_codes,
+            BatchFetchOSMDataAlgorithm.OUTPUT_DIR: self.output_dir,
+            BatchFetchOSMDataAlgorithm.MAX_ATTEMPTS: 1,
+            **(parameters or {}),
+        }
+        self.fetched = []
+        with mock.patch.object(batch_fetch_osm_data_algorithm.processing, 'run', self.fake_fetch):
+            algorithm.processAlgorithm(parameters, QgsProcessingContext(), QgsProcessingFeedback())
+        with open(os.path.join(self.output_dir, BatchFetchOSMDataAlgorithm.STATE_FILE)) as f:
+            return json.load(f)
+
+    def test_read_text_file(self):
+        """Comments, blank lines, duplicates and case are handled."""
+        path = self.write_file('codes.txt', '# Kenya\nhkjk, HKMO;hkjk\n\n  egll # Heathrow\nHKJK\n')
+        codes = BatchFetchOSMDataAlgorithm().read_icao_codes('EGLL omdb', path)
+        self.assertEqual(codes, ['EGLL', 'OMDB', 'HKJK', 'HKMO'])
+
+    def test_read_quickosm_steps(self):
+        """QuickOSM step files list the codes wrapped in quotes."""
+        path = self.write_file('steps.json', json.dumps([
+            {'PARAMETERS': {'VALUE': "'HKJK'"}},
+            {'PARAMETERS': {'VALUE': "'egll'"}},
+        ]))
+        self.assertEqual(BatchFetchOSMDataAlgorithm().read_icao_codes('', path), ['HKJK', 'EGLL'])
+
+    def test_resume(self):
+        """Completed airports are skipped, failed ones fetched again."""
+        self.errors = {'HKMO': 'Failed to fetch aerodrome: HTTP 400'}
+        state = self.run_batch('HKJK HKMO')
+        self.assertEqual(self.fetched, ['HKJK', 'HKMO'])
+        self.assertEqual(state['completed'], ['HKJK'])
+        self.assertEqual(state['failed'], {'HKMO': 'Failed to fetch aerodrome: HTTP 400'})
+
+        self.errors = {}
+        state = self.run_batch('HKJK HKMO')
+        self.assertEqual(self.fetched, ['HKMO'])
+        self.assertEqual(state['completed'], ['HKJK', 'HKMO'])
+        self.assertEqual(state['failed'], {})
+
+        self.run_batch('HKJK HKMO', {BatchFetchOSMDataAlgorithm.RESUME: False})
+        self.assertEqual(self.fetched, ['HKJK', 'HKMO'])
+
+    def test_refresh_ignores_completed(self):
+        """A refresh batch refreshes airports completed by an earlier run."""
+        self.run_batch('HKJK HKMO')
+        state = self.run_batch('HKJK HKMO', {FetchOSMDataAlgorithm.REFRESH: True})
+        self.assertEqual(self.fetched, ['HKJK', 'HKMO'])
+        self.assertEqual(state['completed'], ['HKJK', 'HKMO'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,59 @@
+# coding=utf-8
+"""Tests for colour profiles."""
+
+import json
+import os
+import tempfile
+import unittest
+
+from ..color_profile import ColorProfile, ColorProfileError, load_color_profile, parse_color
+
+
+class ColorProfileTest(unittest.TestCase):
+    """Test colour profile validation and caching."""
+
+    def write_profile(self, data):
+        fd, path = tempfile.mkstemp(suffix='.json')
+        with os.fdopen(fd, 'w') as f:
+            json.dump(data, f)
+        self.addCleanup(os.remove, path)
+        return path
+
+    def test_parse_color(self):
+        """Colours are r,g,b triples of bytes."""
+        self.assertEqual(parse_color('255, 0,16', 'taxiway'), (255, 0, 16))
+        for value in ('255,0', 'red', '0,0,256'):
+            with self.assertRaises(ColorProfileError):
+                parse_color(value, 'taxiway')
+
+    def test_compiled_entries(self):
+        """Entries keep their TopSky and GroundRadar colours."""
+        profile = ColorProfile.from_dict({'colors': {
+            'background': {'color': '10,20,30', 'ts_color': 'AD', 'gr_color': 'GROUND'},
+            'taxiway': {'color': '255,255,0'},
+        }})
+        self.assertEqual(profile.get('background').color, '10,20,30')
+        self.assertEqual(profile.get('background').ts_color, 'AD')
+        self.assertIsNone(profile.get('taxiway').gr_color)
+        self.assertIsNone(profile.get('apron'))
+
+    def test_invalid_profile(self):
+        """Invalid profiles fail when loaded, not when used."""
+        for data in ({}, {'colors': {'apron': {}}}, {'colors': {'apron': {'color': 'grey'}}}):
+            with self.assertRaises(ColorProfileError):
+                load_color_profile(self.write_profile(data))
+
+    def test_cached_until_modified(self):
+        """An unchanged file is compiled once."""
+        path = self.write_profile({'colors': {'apron': {'color': '1,2,3'}}})
+        profile = load_color_profile(path)
+        self.assertIs(load_color_profile(path), profile)
+
+        with open(path, 'w') as f:
+            json.dump({'colors': {'apron': {'color': '4,5,6'}}}, f)
+        os.utime(path, (0, os.path.getmtime(path) + 10))
+        self.assertEqual(load_color_profile(path).get('apron').color, '4,5,6')
+
+
+if __name__ == '__main__':
+    unittest.main()
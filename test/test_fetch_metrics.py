@@ -0,0 +1,74 @@
+# coding=utf-8
+"""Tests for the fetch phase metrics."""
+
+import json
+import os
+import tempfile
+import threading
+import time
+import unittest
+
+from ..fetch_metrics import FetchMetrics
+
+
+class RecordingFeedback:
+    """Collects the messages pushed to it."""
+
+    def __init__(self):
+        self.messages = []
+
+    def pushInfo(self, message):
+        self.messages.append(message)
+
+
+class FetchMetricsTest(unittest.TestCase):
+    """Test the phase timers and counters."""
+
+    def test_phases_add_up(self):
+        """Repeated phases accumulate time, calls and counters."""
+        metrics = FetchMetrics()
+        for _ in range(2):
+            with metrics.phase('sublayer load'):
+                time.sleep(0.01)
+                metrics.count('features', 3)
+        phase = metrics.as_dict()['phases']['sublayer load']
+        self.assertEqual(phase['calls'], 2)
+        self.assertEqual(phase['features'], 6)
+        self.assertGreaterEqual(phase['seconds'], 0.02)
+
+    def test_thread_counts(self):
+        """Counts go to the phase of their thread, or the creator's phase."""
+        metrics = FetchMetrics()
+
+        def download():
+            with metrics.phase('download taxiway'):
+                metrics.count('bytes', 10)
+
+        with metrics.phase('discovery query'):
+            for target in (download, lambda: metrics.count('bytes', 5)):
+                thread = threading.Thread(target=target)
+                thread.start()
+                thread.join()
+
+        phases = metrics.as_dict()['phases']
+        self.assertEqual(phases['download taxiway']['bytes'], 10)
+        self.assertEqual(phases['discovery query']['bytes'], 5)
+
+    def test_report_and_write(self):
+        """The breakdown is pushed to feedback and written as JSON."""
+        metrics = FetchMetrics()
+        with metrics.phase('widening'):
+            metrics.count('features', 1234)
+        feedback = RecordingFeedback()
+        metrics.report(feedback)
+        self.assertIn('1,234 features', feedback.messages[1])
+
+        with tempfile.TemporaryDirectory() as output_dir:
+            path = os.path.join(output_dir, 'fetch_metrics.json')
+            metrics.write(path)
+            with open(path) as f:
+                self.assertEqual(json.load(f)['phases']['widening']['features'], 1234)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,156 @@
+# coding=utf-8
+"""Tests for the OSM fetch and prefetch algorithms against a canned client."""
+
+import copy
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from qgis.core import QgsProcessingContext, QgsProcessingFeedback, QgsProject
+
+from .utilities import get_qgis_app
+from .. import fetch_osm_data_algorithm
+from ..fetch_osm_data_algorithm import FetchOSMDataAlgorithm
+from ..prefetch_task import PrefetchTask
+
+QGIS_APP = get_qgis_app()
+
+
+def way(way_id, coordinates, **tags):
+    return {'type': 'way', 'id': way_id, 'geometry': [{'lon': x, 'lat': y} for x, y in coordinates], 'tags': tags}
+
+
+def square(x, y, size):
+    return [(x, y), (x + size, y), (x + size, y + size), (x, y + size), (x, y)]
+
+
+ELEMENTS = [
+    way(1, square(0, 0, 0.01), aeroway='aerodrome', icao='TEST'),
+    way(2, square(0.02, 0, 0.01), aeroway='aerodrome', icao='OTHR'),
+    way(3, [(0.002, 0.005), (0.008, 0.005)], aeroway='taxiway', ref='A'),
+    way(4, [(0.008, 0.002), (0.015, 0.002)], aeroway='taxiway', ref='B'),
+    way(5, [(0.012, 0.008), (0.018, 0.008)], aeroway='taxiway', ref='C'),
+    way(6, square(0.001, 0.001, 0.002), aeroway='apron'),
+]
+
+
+class CannedClient:
+    """Stand-in OverpassClient answering every query with the same elements
+    and recording the queries it was sent."""
+
+    def __init__(self, elements=ELEMENTS):
+        self.elements = elements
+        self.queries = []
+        self.label = None
+
+    def stream_elements(self, query, header=None):
+        self.queries.append(query)
+        if header is not None:
+            header['timestamp_osm_base'] = '2024-09-08T00:00:00Z'
+        return iter(copy.deepcopy(self.elements))
+
+    def cancel(self):
+        pass
+
+    def flush_log(self):
+        pass
+
+
+class FetchTestCase(unittest.TestCase):
+    """Runs the fetch algorithm against a canned client."""
+
+    def setUp(self):
+        self.output_dir = tempfile.mkdtemp()
+        QgsProject.instance().clear()
+
+    def tearDown(self):
+        QgsProject.instance().clear()
+        shutil.rmtree(self.output_dir)
+
+    def run_fetch(self, client, parameters):
+        """Runs the fetch algorithm to memory layers with client."""
+        algorithm = FetchOSMDataAlgorithm()
+        algorithm.initAlgorithm()
+        parameters = {
+            FetchOSMDataAlgorithm.ICAO_CODE: 'TEST',
+            FetchOSMDataAlgorithm.OUTPUT_DIR: self.output_dir,
+            FetchOSMDataAlgorithm.SPLIT_TAXIWAYS_OUTPUT: self.output_dir,
+            FetchOSMDataAlgorithm.LAYER_OUTPUT: FetchOSMDataAlgorithm.LAYER_OUTPUT_MEMORY,
+            FetchOSMDataAlgorithm.CACHE_TTL: 0,
+            **parameters,
+        }
+        with mock.patch.object(fetch_osm_data_algorithm, 'OverpassClient', lambda **kwargs: client):
+            return algorithm.processAlgorithm(parameters, QgsProcessingContext(), QgsProcessingFeedback())
+
+
+class PrefetchQueriesTest(FetchTestCase):
+    """Test that a prefetch sends the exact queries of the later fetch, so
+    the fetch is answered from the cache."""
+
+    def test_same_queries(self):
+        """Area and bbox modes, batched or not, with and without tiles."""
+        for area_query in (False, True):
+            for batched_fetch in (False, True):
+                for tile_size in (0, 500):
+                    options = (area_query, batched_fetch, tile_size)
+                    fetch_client = CannedClient()
+                    self.run_fetch(fetch_client, {
+                        FetchOSMDataAlgorithm.AREA_QUERY: area_query,
+                        FetchOSMDataAlgorithm.BATCHED_FETCH: batched_fetch,
+                        FetchOSMDataAlgorithm.TILE_SIZE: tile_size,
+                        FetchOSMDataAlgorithm.QUERY_TIMEOUT: 30,
+                    })
+
+                    prefetch_client = CannedClient()
+                    task = PrefetchTask(
+                        ['TEST'],
+                        prefetch_client,
+                        FetchOSMDataAlgorithm.FEATURE_TYPES,
+                        batched_fetch=batched_fetch,
+                        area_query=area_query,
+                        query_timeout=30,
+                        tile_size=tile_size,
+                    )
+                    task.prefetch('TEST')
+
+                    self.assertTrue(fetch_client.queries, options)
+                    self.assertEqual(sorted(prefetch_client.queries), sorted(fetch_client.queries), options)
+                    if area_query:
+                        self.assertEqual(len(fetch_client.queries), 1, options)
+                    elif tile_size:
+                        self.assertGreater(len(fetch_client.queries), 2, options)
+
+
+class AreaQueryTest(FetchTestCase):
+    """Test fetching the aerodrome and its features in one area query."""
+
+    def full_ids(self):
+        return {
+            layer.name(): {feature['full_id'] for feature in layer.getFeatures()}
+            for layer in QgsProject.instance().mapLayers().values()
+        }
+
+    def test_area_query(self):
+        """The aerodrome with the ICAO code is picked, and only features
+        touching its boundary are kept."""
+        client = CannedClient()
+        self.run_fetch(client, {FetchOSMDataAlgorithm.AREA_QUERY: True})
+        self.assertEqual(len(client.queries), 1)
+
+        full_ids = self.full_ids()
+        self.assertEqual(full_ids['aerodrome_multipolygons'], {'w1'})
+        taxiway_ids = set().union(*(ids for name, ids in full_ids.items() if name.endswith('_taxiway_LINE')))
+        self.assertEqual(taxiway_ids, {'w3', 'w4'})
+        self.assertEqual(set().union(*full_ids.values()), {'w1', 'w3', 'w4', 'w6'})
+
+    def test_icao_case(self):
+        """Aerodromes tagged with a lower case ICAO code are found too."""
+        elements = copy.deepcopy(ELEMENTS)
+        elements[0]['tags']['icao'] = 'test'
+        self.run_fetch(CannedClient(elements), {FetchOSMDataAlgorithm.AREA_QUERY: True})
+        self.assertEqual(self.full_ids()['aerodrome_multipolygons'], {'w1'})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,82 @@
+# coding=utf-8
+"""Tests for the OSM extract reader."""
+
+import unittest
+
+from qgis.core import QgsFeature, QgsField, QgsFields, QgsGeometry, QgsPointXY
+from qgis.PyQt.QtCore import QVariant
+
+from .utilities import get_qgis_app
+from ..osm_extract_reader import _feature_record, feature_tags, parse_other_tags
+
+QGIS_APP = get_qgis_app()
+
+SQUARE = [QgsPointXY(0, 0), QgsPointXY(4, 0), QgsPointXY(4, 4), QgsPointXY(0, 4), QgsPointXY(0, 0)]
+
+
+def polygon_feature(**attributes):
+    fields = QgsFields()
+    for name in ['osm_id', 'osm_way_id', 'aeroway', 'other_tags']:
+        fields.append(QgsField(name, QVariant.String))
+    feature = QgsFeature(fields)
+    for name in fields.names():
+        feature[name] = attributes.get(name)
+    feature.setGeometry(QgsGeometry.fromMultiPolygonXY([[SQUARE]]))
+    return feature
+
+
+class ParseOtherTagsTest(unittest.TestCase):
+    """Test parsing GDAL's hstore encoded other_tags field."""
+
+    def test_empty(self):
+        """Empty and missing values give no tags."""
+        self.assertEqual(parse_other_tags(None), {})
+        self.assertEqual(parse_other_tags(''), {})
+
+    def test_pairs(self):
+        """Every key and value pair is parsed."""
+        self.assertEqual(
+            parse_other_tags('"icao"=>"EGLL","ref"=>"A1;A2","name"=>"Heathrow, London"'),
+            {'icao': 'EGLL', 'ref': 'A1;A2', 'name': 'Heathrow, London'},
+        )
+
+    def test_escapes(self):
+        """Escaped quotes and backslashes are unescaped."""
+        self.assertEqual(
+            parse_other_tags(r'"name"=>"The \"Big\" Apron","note"=>"C:\\temp\\x","k\"ey"=>"=>"'),
+            {'name': 'The "Big" Apron', 'note': 'C:\\temp\\x', 'k"ey': '=>'},
+        )
+
+    def test_feature_tags(self):
+        """Fields and other_tags are merged and bookkeeping fields skipped."""
+        feature = {'osm_id': '1', 'aeroway': 'taxiway', 'ref': '', 'other_tags': '"width"=>"23"'}
+        self.assertEqual(feature_tags(feature, list(feature)), {'aeroway': 'taxiway', 'width': '23'})
+
+
+class FeatureRecordTest(unittest.TestCase):
+    """Test the area rule applied to closed ways of an extract."""
+
+    def test_area_rule(self):
+        """Closed ways follow the same area rule as the Overpass backend."""
+        cases = [
+            ('apron', None, 'multipolygons'),
+            ('apron', '"area"=>"no"', 'lines'),
+            ('taxiway', None, 'lines'),
+            ('taxiway', '"area"=>"yes"', 'multipolygons'),
+        ]
+        for aeroway, other_tags, sublayer in cases:
+            feature = polygon_feature(osm_way_id='7', aeroway=aeroway, other_tags=other_tags)
+            record = _feature_record('multipolygons', feature, feature.fields().names())
+            self.assertEqual(record[0], sublayer, (aeroway, other_tags))
+            self.assertEqual(record[2:4], ('way', '7'))
+
+    def test_relation(self):
+        """Multipolygons built from relations stay polygons."""
+        feature = polygon_feature(osm_id='9', aeroway='taxiway', other_tags='"type"=>"multipolygon"')
+        record = _feature_record('multipolygons', feature, feature.fields().names())
+        self.assertEqual(record[0], 'multipolygons')
+        self.assertEqual(record[2:4], ('relation', '9'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,173 @@
+# coding=utf-8
+"""Tests for the OSM layer helpers."""
+
+import unittest
+
+from qgis.core import QgsFeature, QgsGeometry, QgsPointXY, QgsRectangle, QgsVectorLayer, QgsWkbTypes
+
+from .utilities import get_qgis_app
+from ..osm_layer_builder import OsmGeometryBuilder, _is_area, build_ref_layers, element_records, group_features_by_ref, records_extent, records_within, stitch_rings
+
+QGIS_APP = get_qgis_app()
+
+SQUARE = [(0, 0), (4, 0), (4, 4), (0, 4), (0, 0)]
+
+
+def way(way_id, coordinates, **tags):
+    return {'type': 'way', 'id': way_id, 'geometry': [{'lon': x, 'lat': y} for x, y in coordinates], 'tags': tags}
+
+
+def member(role, coordinates):
+    return {'type': 'way', 'ref': 0, 'role': role, 'geometry': [{'lon': x, 'lat': y} for x, y in coordinates]}
+
+
+class StitchRingsTest(unittest.TestCase):
+    """Test joining multipolygon member ways into rings."""
+
+    def test_closed_way(self):
+        """A closed way is a ring on its own."""
+        self.assertEqual(stitch_rings([SQUARE]), [SQUARE])
+
+    def test_reversed_segments(self):
+        """Segments are joined whichever way they point."""
+        segments = [
+            [(0, 0), (4, 0)],
+            [(4, 4), (4, 0)],
+            [(0, 4), (4, 4)],
+            [(0, 0), (0, 4)],
+        ]
+        rings = stitch_rings(segments)
+        self.assertEqual(len(rings), 1)
+        self.assertEqual(rings[0][0], rings[0][-1])
+        self.assertEqual(set(rings[0]), set(SQUARE))
+
+    def test_open_ring_dropped(self):
+        """Segments that never close are dropped."""
+        self.assertEqual(stitch_rings([[(0, 0), (4, 0)], [(4, 0), (4, 4)]]), [])
+
+
+class OsmGeometryBuilderTest(unittest.TestCase):
+    """Test building geometries from Overpass elements."""
+
+    def test_is_area(self):
+        """Closed aeroway ways are areas unless tagged area=no."""
+        self.assertTrue(_is_area({'aeroway': 'apron'}, SQUARE))
+        self.assertFalse(_is_area({'aeroway': 'apron', 'area': 'no'}, SQUARE))
+        self.assertFalse(_is_area({'aeroway': 'taxiway'}, SQUARE))
+        self.assertTrue(_is_area({'aeroway': 'taxiway', 'area': 'yes'}, SQUARE))
+        self.assertFalse(_is_area({'aeroway': 'apron'}, SQUARE[:-1]))
+
+    def test_ways(self):
+        """Ways become lines or polygons by the area rule."""
+        builder = OsmGeometryBuilder([])
+        sublayer, geometry = builder.geometry(way(1, SQUARE, aeroway='apron'))
+        self.assertEqual(sublayer, 'multipolygons')
+        self.assertEqual(geometry.area(), 16)
+
+        sublayer, geometry = builder.geometry(way(2, SQUARE, aeroway='taxiway'))
+        self.assertEqual(sublayer, 'lines')
+        self.assertEqual(geometry.length(), 16)
+
+        self.assertEqual(builder.geometry(way(3, [(0, 0)], aeroway='taxiway')), (None, None))
+
+    def test_multipolygon(self):
+        """Inner rings become holes of the outer ring containing them."""
+        relation = {
+            'type': 'relation',
+            'id': 10,
+            'tags': {'type': 'multipolygon', 'aeroway': 'apron'},
+            'members': [
+                member('outer', [(0, 0), (4, 0), (4, 4)]),
+                member('outer', [(4, 4), (0, 4), (0, 0)]),
+                member('outer', [(10, 0), (12, 0), (12, 2), (10, 2), (10, 0)]),
+                member('inner', [(1, 1), (2, 1), (2, 2), (1, 2), (1, 1)]),
+            ],
+        }
+        sublayer, geometry = OsmGeometryBuilder([]).geometry(relation)
+        self.assertEqual(sublayer, 'multipolygons')
+        self.assertEqual(geometry.wkbType(), QgsWkbTypes.MultiPolygon)
+        polygons = geometry.asMultiPolygon()
+        self.assertEqual(len(polygons), 2)
+        self.assertEqual(sorted(len(polygon) for polygon in polygons), [1, 2])
+        self.assertEqual(geometry.area(), 16 - 1 + 4)
+
+    def test_skeleton_response(self):
+        """out skel responses resolve node and way ids, untagged ones are skipped."""
+        elements = [
+            {'type': 'node', 'id': 1, 'lon': 0, 'lat': 0},
+            {'type': 'node', 'id': 2, 'lon': 4, 'lat': 0},
+            {'type': 'node', 'id': 3, 'lon': 4, 'lat': 4},
+            {'type': 'node', 'id': 4, 'lon': 0, 'lat': 4, 'tags': {'aeroway': 'windsock'}},
+            {'type': 'way', 'id': 5, 'nodes': [1, 2, 3], 'tags': {'aeroway': 'taxiway', 'ref': 'A'}},
+            {'type': 'way', 'id': 6, 'nodes': [3, 4, 1]},
+            {'type': 'relation', 'id': 7, 'tags': {'type': 'multipolygon', 'aeroway': 'apron'}, 'members': [
+                {'type': 'way', 'ref': 5, 'role': 'outer'},
+                {'type': 'way', 'ref': 6, 'role': 'outer'},
+            ]},
+        ]
+        records = {record[3]: record for record in element_records(elements)}
+        self.assertEqual(set(records), {4, 5, 7})
+        self.assertEqual(records[4][0], 'points')
+        self.assertEqual(records[5][0], 'lines')
+        self.assertEqual(records[5][1].asPolyline(), [QgsPointXY(0, 0), QgsPointXY(4, 0), QgsPointXY(4, 4)])
+        self.assertEqual(records[7][0], 'multipolygons')
+        self.assertEqual(records[7][1].area(), 16)
+        self.assertEqual(records[7][4], {'type': 'multipolygon', 'aeroway': 'apron'})
+
+    def test_records_extent_and_within(self):
+        """Extents cover one sublayer, and records are kept by intersection."""
+        records = list(element_records([
+            way(1, SQUARE, aeroway='aerodrome'),
+            way(2, [(10, 10), (11, 10)], aeroway='taxiway'),
+            way(3, [(3, 3), (5, 3)], aeroway='taxiway'),
+        ]))
+        self.assertEqual(records_extent(records), QgsRectangle(0, 0, 4, 4))
+        self.assertEqual(records_extent(records, 'lines'), QgsRectangle(3, 3, 11, 10))
+        self.assertIsNone(records_extent(records, 'points'))
+
+        boundary = records[0][1]
+        self.assertEqual([record[3] for record in records_within(records, boundary)], [1, 3])
+
+
+class SplitByRefTest(unittest.TestCase):
+    """Test grouping taxiways by ref."""
+
+    def make_layer(self, rows):
+        layer = QgsVectorLayer('LineString?crs=EPSG:4326&field=aeroway:string&field=ref:string', 'taxiways', 'memory')
+        features = []
+        for index, (aeroway, ref) in enumerate(rows):
+            feature = QgsFeature(layer.fields())
+            feature.setGeometry(QgsGeometry.fromPolylineXY([QgsPointXY(index, 0), QgsPointXY(index, 1)]))
+            feature.setAttributes([aeroway, ref])
+            features.append(feature)
+        layer.dataProvider().addFeatures(features)
+        return layer
+
+    def test_group_by_ref(self):
+        """Taxiways are grouped by ref in order, without a ref under NULL."""
+        layer = self.make_layer([('taxiway', 'B'), ('taxiway', 'A'), ('apron', 'A'), ('taxiway', 'B'), ('taxiway', None)])
+        groups = group_features_by_ref(layer)
+        self.assertEqual(list(groups), ['B', 'A', 'NULL'])
+        self.assertEqual([len(features) for features in groups.values()], [2, 1, 1])
+
+    def test_ref_layers(self):
+        """Every ref becomes a layer holding its features."""
+        layer = self.make_layer([('taxiway', 'A'), ('taxiway', 'B'), ('taxiway', 'A')])
+        ref_layers = build_ref_layers(layer, group_features_by_ref(layer))
+        self.assertEqual(ref_layers['A'].name(), 'TAXIWAY_A')
+        self.assertEqual(ref_layers['A'].featureCount(), 2)
+        self.assertEqual(ref_layers['B'].crs(), layer.crs())
+        self.assertEqual(ref_layers['B'].fields().names(), layer.fields().names())
+
+    def test_ref_layer_names(self):
+        """Refs are made safe for file names and every name is unique."""
+        layer = self.make_layer([('taxiway', 'A/B'), ('taxiway', 'A;B'), ('taxiway', 'C')])
+        ref_layers = build_ref_layers(layer, group_features_by_ref(layer), '003_aeroway_LINE_TAXIWAY_')
+        self.assertEqual(
+            {ref: ref_layer.name() for ref, ref_layer in ref_layers.items()},
+            {'A/B': '003_aeroway_LINE_TAXIWAY_A_B', 'A;B': '003_aeroway_LINE_TAXIWAY_A_B_2', 'C': '003_aeroway_LINE_TAXIWAY_C'},
+        )
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,201 @@
+# coding=utf-8
+"""Tests for the Overpass response cache."""
+
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+from ..overpass_cache import OverpassCache
+from ..overpass_client import OverpassClient, OverpassError
+
+
+class FakeOverpassHandler(BaseHTTPRequestHandler):
+    """Stand-in Overpass server that counts the requests it answers."""
+
+    hits = 0
+
+    def do_GET(self):
+        FakeOverpassHandler.hits += 1
+        body = b'{"elements": [{"type": "node", "id": 1, "lat": 0, "lon": 0}]}'
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class BodySession:
+    """Fake requests session answering every query with the same body."""
+
+    def __init__(self, body):
+        self.body = body
+        self.hits = 0
+
+    def get(self, url, params=None, stream=False, timeout=None):
+        self.hits += 1
+        return BodyResponse(self.body)
+
+
+class BodyResponse:
+    status_code = 200
+    headers = {}
+
+    def __init__(self, body):
+        self.body = body
+
+    def iter_content(self, size):
+        return (self.body[i:i + 7] for i in range(0, len(self.body), 7))
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class OverpassCacheTest(unittest.TestCase):
+    """Test the Overpass response cache."""
+
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_dir)
+
+    def test_key_ignores_whitespace(self):
+        """Queries differing only in whitespace share an entry."""
+        self.assertEqual(
+            OverpassCache.key('[out:json];\n  node(1);\nout;', 'http://a'),
+            OverpassCache.key('[out:json]; node(1); out;', 'http://a'))
+        self.assertNotEqual(
+            OverpassCache.key('node(1);', 'http://a'),
+            OverpassCache.key('node(1);', 'http://b'))
+
+    def test_ttl_expiry(self):
+        """Entries older than the TTL are misses."""
+        cache = OverpassCache(self.cache_dir, ttl=60)
+        cache.put('q', 'http://a', b'body')
+        self.assertEqual(cache.get('q', 'http://a'), b'body')
+
+        old = time.time() - 120
+        os.utime(cache.path('q', 'http://a'), (old, old))
+        self.assertIsNone(cache.get('q', 'http://a'))
+
+    def test_lru_eviction(self):
+        """The least recently read entry is evicted first."""
+        cache = OverpassCache(self.cache_dir)
+        cache.put('a', 'http://a', b'aaaa')
+        cache.put('b', 'http://a', b'bbbb')
+        # Room for two compressed entries
+        cache.max_size = 2.5 * os.path.getsize(cache.path('a', 'http://a'))
+        os.utime(cache.path('a', 'http://a'), (time.time() - 30, time.time()))
+        os.utime(cache.path('b', 'http://a'), (time.time() - 60, time.time()))
+        cache.get('b', 'http://a')
+
+        cache.put('c', 'http://a', b'cccc')
+        self.assertIsNone(cache.get('a', 'http://a'))
+        self.assertEqual(cache.get('b', 'http://a'), b'bbbb')
+        self.assertEqual(cache.get('c', 'http://a'), b'cccc')
+        self.assertEqual(set(cache.index()), {cache.key('b', 'http://a'), cache.key('c', 'http://a')})
+
+    def test_other_files_kept(self):
+        """Eviction and clear only remove cache entries."""
+        others = ['fetch_state.json', 'batch_state.json', 'profile.json', 'notes.json.gz']
+        for name in others:
+            with open(os.path.join(self.cache_dir, name), 'w') as f:
+                f.write('{}')
+        legacy = os.path.join(self.cache_dir, OverpassCache.key('old', 'http://a') + '.json')
+        with open(legacy, 'w') as f:
+            f.write('{}')
+
+        cache = OverpassCache(self.cache_dir)
+        cache.put('q', 'http://a', b'body')
+        self.assertFalse(os.path.exists(legacy))
+        cache.clear()
+        self.assertIsNone(cache.get('q', 'http://a'))
+        for name in others + [OverpassCache.INDEX_FILE]:
+            self.assertTrue(os.path.exists(os.path.join(self.cache_dir, name)), name)
+
+    def test_compressed_storage(self):
+        """Entries are stored compressed and indexed with their label."""
+        cache = OverpassCache(self.cache_dir)
+        body = b'{"elements": [' + b', '.join([b'{"type": "node", "id": 1, "lat": 0, "lon": 0}'] * 1000) + b']}'
+        cache.put('q', 'http://a', body, label='HKJK')
+
+        self.assertLess(os.path.getsize(cache.path('q', 'http://a')), len(body) / 10)
+        with cache.open('q', 'http://a') as f:
+            self.assertEqual(f.read(100), body[:100])
+        self.assertEqual(cache.get('q', 'http://a'), body)
+
+        entry = cache.index()[cache.key('q', 'http://a')]
+        self.assertEqual(entry['label'], 'HKJK')
+        self.assertEqual(entry['raw_size'], len(body))
+        self.assertEqual(entry['size'], os.path.getsize(cache.path('q', 'http://a')))
+
+    def test_bad_responses_not_cached(self):
+        """Truncated and failed responses are fetched again, not replayed."""
+        cache = OverpassCache(self.cache_dir)
+        for body in (
+            b'{"elements": [{"type": "node", "id": 1}, {"type": "no',
+            b'{"elements": [], "remark": "static error: Unknown type \\"nod\\""}',
+        ):
+            session = BodySession(body)
+            client = OverpassClient(servers=['http://a'], cache=cache, session=session)
+            for _ in range(2):
+                with self.assertRaises(OverpassError):
+                    list(client.stream_elements('node(1); out;'))
+            self.assertEqual(session.hits, 2)
+            self.assertIsNone(cache.open('node(1); out;', 'http://a'))
+
+    def test_trailer_cached(self):
+        """The whole body, with the trailer after the elements, is cached."""
+        body = b'{"elements": [{"type": "node", "id": 1}], "remark": "finished"}'
+        session = BodySession(body)
+        client = OverpassClient(servers=['http://a'], cache=OverpassCache(self.cache_dir), session=session)
+        first = list(client.stream_elements('node(1); out;'))
+        second = list(client.stream_elements('node(1); out;'))
+        self.assertEqual(first, second)
+        self.assertEqual(session.hits, 1)
+        self.assertEqual(client.cache.get('node(1); out;', 'http://a'), body)
+
+    def test_client_uses_cache(self):
+        """A repeated query is served without touching the server."""
+        server = HTTPServer(('127.0.0.1', 0), FakeOverpassHandler)
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        url = f'http://127.0.0.1:{server.server_port}/api/interpreter'
+        FakeOverpassHandler.hits = 0
+
+        try:
+            cache = OverpassCache(self.cache_dir)
+            client = OverpassClient(servers=[url], cache=cache)
+            first = client.query('node(1); out;')
+            second = client.query('node(1);  out;')
+            self.assertEqual(first, second)
+            self.assertEqual(FakeOverpassHandler.hits, 1)
+
+            OverpassClient(servers=[url], cache=cache, force_refresh=True).query('node(1); out;')
+            self.assertEqual(FakeOverpassHandler.hits, 2)
+
+            # Streamed element queries are cached once fully parsed
+            first = list(client.stream_elements('way(2); out;'))
+            second = list(client.stream_elements('way(2); out;'))
+            self.assertEqual(first, second)
+            self.assertEqual(FakeOverpassHandler.hits, 3)
+        finally:
+            server.shutdown()
+            server.server_close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,174 @@
+# coding=utf-8
+"""Tests for the Overpass client."""
+
+import json
+import threading
+import time
+import unittest
+from http.server import BaseHTTPRequestHandler, HTTPServer, ThreadingHTTPServer
+
+from ..overpass_client import OverpassCanceled, OverpassClient, OverpassError, OverpassRuntimeError, iter_elements, parse_servers
+
+RESPONSE = json.dumps({
+    'version': 0.6,
+    'generator': 'Overpass API',
+    'osm3s': {'timestamp_osm_base': '2024-09-08T00:00:00Z'},
+    'elements': [
+        {'type': 'node', 'id': 1, 'lat': -1.3, 'lon': 36.9, 'tags': {'aeroway': 'windsock', 'name': 'Sock "Ñ" [1]'}},
+        {'type': 'way', 'id': 2, 'nodes': [1, 3], 'tags': {'aeroway': 'taxiway', 'ref': 'A'}},
+        {'type': 'relation', 'id': 4, 'members': [{'type': 'way', 'ref': 2, 'role': 'outer'}], 'tags': {}},
+    ],
+}, ensure_ascii=False, indent=1).encode('utf-8')
+
+
+def chunked(body, size):
+    return (body[i:i + size] for i in range(0, len(body), size))
+
+
+class IterElementsTest(unittest.TestCase):
+    """Test the incremental Overpass JSON parser."""
+
+    def test_whole_body(self):
+        """A single chunk yields every element."""
+        expected = json.loads(RESPONSE)['elements']
+        self.assertEqual(list(iter_elements([RESPONSE])), expected)
+
+    def test_every_chunk_size(self):
+        """Elements, keys and multi-byte characters may be split anywhere."""
+        expected = json.loads(RESPONSE)['elements']
+        for size in range(1, 40):
+            self.assertEqual(list(iter_elements(chunked(RESPONSE, size))), expected, size)
+
+    def test_header(self):
+        """The osm3s timestamp is captured even when split across chunks."""
+        for size in (1, 7, len(RESPONSE)):
+            header = {}
+            list(iter_elements(chunked(RESPONSE, size), header))
+            self.assertEqual(header, {'timestamp_osm_base': '2024-09-08T00:00:00Z'})
+
+    def test_truncated_body(self):
+        """A response cut off mid-array is an error, not a short result."""
+        with self.assertRaises(OverpassError):
+            list(iter_elements([RESPONSE[:len(RESPONSE) // 2]]))
+
+    def test_runtime_error(self):
+        """A query Overpass aborted after the elements is an error."""
+        body = b'{"elements": [{"type": "node", "id": 1}], "remark": "runtime error: Query timed out in \\"query\\" at line 3"}'
+        for size in (1, len(body)):
+            with self.assertRaises(OverpassRuntimeError):
+                list(iter_elements(chunked(body, size)))
+
+
+class ScriptedOverpassHandler(BaseHTTPRequestHandler):
+    """Stand-in Overpass server answering with the statuses in its script."""
+
+    def do_GET(self):
+        self.server.requests.append(time.monotonic())
+        status, headers = self.server.script.pop(0) if self.server.script else (200, {})
+        body = RESPONSE if status == 200 else b'busy'
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class StallingOverpassHandler(BaseHTTPRequestHandler):
+    """Stand-in Overpass server that stalls before or during the response."""
+
+    def do_GET(self):
+        if 'headers' in self.path:
+            time.sleep(5)
+        self.send_response(200)
+        self.end_headers()
+        self.wfile.write(RESPONSE[:100])
+        self.wfile.flush()
+        time.sleep(5)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class OverpassClientTest(unittest.TestCase):
+    """Test retries and failover against local fake Overpass servers."""
+
+    def start_server(self, script):
+        server = HTTPServer(('127.0.0.1', 0), ScriptedOverpassHandler)
+        server.script = list(script)
+        server.requests = []
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        return server, f'http://127.0.0.1:{server.server_port}/api/interpreter'
+
+    def test_backoff_on_overload(self):
+        """429 and 504 responses are retried after a growing pause."""
+        server, url = self.start_server([(429, {}), (504, {})])
+        client = OverpassClient(servers=[url], backoff=0.05)
+        self.assertEqual(client.query_bytes('node(1); out;'), RESPONSE)
+        self.assertEqual(len(server.requests), 3)
+        first_wait = server.requests[1] - server.requests[0]
+        second_wait = server.requests[2] - server.requests[1]
+        self.assertGreaterEqual(first_wait, 0.05)
+        self.assertGreaterEqual(second_wait, 0.1)
+
+    def test_retry_after(self):
+        """A Retry-After header longer than the backoff is honoured."""
+        server, url = self.start_server([(429, {'Retry-After': '1'})])
+        client = OverpassClient(servers=[url], backoff=0.01)
+        client.query_bytes('node(1); out;')
+        self.assertGreaterEqual(server.requests[1] - server.requests[0], 1)
+
+    def test_failover(self):
+        """An overloaded server hands over to the next one without waiting."""
+        busy_server, busy_url = self.start_server([(504, {})] * 10)
+        server, url = self.start_server([])
+        client = OverpassClient(servers=[busy_url, url], backoff=10)
+        self.assertEqual(client.query_bytes('node(1); out;'), RESPONSE)
+        self.assertEqual(client.server, url)
+        self.assertEqual(len(busy_server.requests), 1)
+
+    def test_gives_up(self):
+        """After max_attempts rounds the last error is raised."""
+        server, url = self.start_server([(504, {})] * 10)
+        client = OverpassClient(servers=[url], max_attempts=2, backoff=0.01)
+        with self.assertRaises(OverpassError):
+            client.query_bytes('node(1); out;')
+        self.assertEqual(len(server.requests), 2)
+
+    def test_query_error_not_retried(self):
+        """A bad query is reported straight away."""
+        server, url = self.start_server([(400, {})])
+        client = OverpassClient(servers=[url], backoff=0.01)
+        with self.assertRaises(OverpassError):
+            client.query_bytes('node(1); out;')
+        self.assertEqual(len(server.requests), 1)
+
+    def test_cancel(self):
+        """A cancel from another thread aborts a stalled request at once."""
+        server = ThreadingHTTPServer(('127.0.0.1', 0), StallingOverpassHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+
+        for stage in ('headers', 'body'):
+            client = OverpassClient(servers=[f'http://127.0.0.1:{server.server_port}/{stage}'])
+            timer = threading.Timer(0.2, client.cancel)
+            timer.start()
+            started = time.monotonic()
+            with self.assertRaises(OverpassCanceled):
+                list(client.stream_elements('node(1); out;'))
+            self.assertLess(time.monotonic() - started, 1, stage)
+
+    def test_parse_servers(self):
+        """Server lists split on commas and whitespace, empty means default."""
+        self.assertEqual(parse_servers('http://a, http://b\nhttp://c'), ['http://a', 'http://b', 'http://c'])
+        self.assertTrue(parse_servers(''))
+
+
+if __name__ == '__main__':
+    unittest.main()
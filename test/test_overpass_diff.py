@@ -0,0 +1,86 @@
+# coding=utf-8
+"""Tests for the Overpass augmented diff parser."""
+
+import unittest
+
+from ..overpass_client import OverpassError, OverpassRuntimeError
+from ..overpass_diff import iter_adiff_actions
+
+RESPONSE = '''<?xml version="1.0" encoding="UTF-8"?>
+<osm version="0.6" generator="Overpass API">
+<meta osm_base="2024-10-01T00:00:00Z"/>
+<action type="create">
+  <node id="1" lat="-1.3" lon="36.9"><tag k="aeroway" v="windsock"/></node>
+</action>
+<action type="modify">
+  <old>
+    <way id="2"><nd ref="3" lat="-1.0" lon="36.0"/><nd ref="4" lat="-1.1" lon="36.1"/><tag k="aeroway" v="taxiway"/></way>
+  </old>
+  <new>
+    <way id="2"><nd ref="3" lat="-1.0" lon="36.0"/><nd ref="4" lat="-1.2" lon="36.2"/><tag k="aeroway" v="taxiway"/><tag k="ref" v="Ñ"/></way>
+  </new>
+</action>
+<action type="delete">
+  <old>
+    <relation id="5"><member type="way" ref="2" role="outer"/><tag k="type" v="multipolygon"/></relation>
+  </old>
+  <new>
+    <relation id="5" visible="false"/>
+  </new>
+</action>
+</osm>
+'''.encode('utf-8')
+
+
+def chunked(body, size):
+    return (body[i:i + size] for i in range(0, len(body), size))
+
+
+class IterAdiffActionsTest(unittest.TestCase):
+    """Test the incremental augmented diff parser."""
+
+    def test_actions(self):
+        """Each action yields its old and new element as Overpass JSON dicts."""
+        header = {}
+        actions = list(iter_adiff_actions([RESPONSE], header))
+        self.assertEqual(header, {'timestamp_osm_base': '2024-10-01T00:00:00Z'})
+        self.assertEqual([action[0] for action in actions], ['create', 'modify', 'delete'])
+
+        _, old, new = actions[0]
+        self.assertIsNone(old)
+        self.assertEqual(new, {'type': 'node', 'id': 1, 'lat': -1.3, 'lon': 36.9, 'tags': {'aeroway': 'windsock'}})
+
+        _, old, new = actions[1]
+        self.assertEqual(old['geometry'][1], {'lat': -1.1, 'lon': 36.1})
+        self.assertEqual(new['geometry'][1], {'lat': -1.2, 'lon': 36.2})
+        self.assertEqual(new['tags'], {'aeroway': 'taxiway', 'ref': 'Ñ'})
+
+        _, old, new = actions[2]
+        self.assertEqual(old['members'], [{'type': 'way', 'ref': 2, 'role': 'outer', 'geometry': []}])
+        self.assertEqual(new['tags'], {})
+
+    def test_every_chunk_size(self):
+        """The diff may be split anywhere."""
+        expected = list(iter_adiff_actions([RESPONSE]))
+        for size in range(1, 40):
+            self.assertEqual(list(iter_adiff_actions(chunked(RESPONSE, size))), expected, size)
+
+    def test_truncated_body(self):
+        """A diff cut off before the closing tag is an error."""
+        with self.assertRaises(OverpassError):
+            list(iter_adiff_actions([RESPONSE[:len(RESPONSE) // 2]]))
+
+    def test_error_remarks(self):
+        """Any error remark fails the diff, runtime errors distinguishably."""
+        body = RESPONSE.replace(b'</osm>', b'<remark>runtime error: Query timed out</remark>\n</osm>')
+        with self.assertRaises(OverpassRuntimeError):
+            list(iter_adiff_actions([body]))
+
+        body = RESPONSE.replace(b'</osm>', b'<remark>static error: Unknown type "nod"</remark>\n</osm>')
+        with self.assertRaises(OverpassError) as raised:
+            list(iter_adiff_actions([body]))
+        self.assertNotIsInstance(raised.exception, OverpassRuntimeError)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,181 @@
+# coding=utf-8
+"""Tests for the Overpass slot scheduler."""
+
+import threading
+import time
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from ..overpass_client import OverpassCanceled, OverpassClient
+from ..overpass_slots import SlotScheduler, parse_status, status_url
+
+BUSY_STATUS = '''Connected as: 1234
+Current time: 2024-09-08T12:00:00Z
+Rate limit: 2
+Slot available after: 2024-09-08T12:00:05Z, in 5 seconds.
+Slot available after: 2024-09-08T12:00:03Z, in 3 seconds.
+Currently running queries (pid, space limit, time limit, start time):
+'''
+
+FREE_STATUS = '''Connected as: 1234
+Current time: 2024-09-08T12:00:00Z
+Rate limit: 2
+1 slots available now.
+Slot available after: 2024-09-08T12:00:03Z, in 3 seconds.
+'''
+
+
+class SlotLimitedHandler(BaseHTTPRequestHandler):
+    """Stand-in Overpass server with one slot that blocks for a second
+    after each query, answering 429 when it is used too early."""
+
+    def do_GET(self):
+        server = self.server
+        if self.path.startswith('/api/status'):
+            with server.lock:
+                if server.running:
+                    body = 'Rate limit: 1\n'
+                elif time.monotonic() < server.free_at:
+                    body = 'Rate limit: 1\nSlot available after: 2024-09-08T12:00:01Z, in 1 seconds.\n'
+                else:
+                    body = 'Rate limit: 1\n1 slots available now.\n'
+            self.reply(200, body.encode())
+            return
+
+        with server.lock:
+            if server.running or time.monotonic() < server.free_at:
+                server.rejected += 1
+                self.reply(429, b'rate limited')
+                return
+            server.running = True
+        time.sleep(0.1)
+        with server.lock:
+            server.running = False
+            server.free_at = time.monotonic() + 1
+            server.answered += 1
+        self.reply(200, b'{"elements": []}')
+
+    def reply(self, status, body):
+        self.send_response(status)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class RecordingFeedback:
+    def __init__(self):
+        self.messages = []
+        self.threads = set()
+
+    def pushInfo(self, message):
+        self.threads.add(threading.current_thread())
+        self.messages.append(message)
+
+
+class LaggingStatusSession:
+    """Session whose status page is slow and always shows one free slot,
+    like a server that has not seen the requests granted meanwhile."""
+
+    def get(self, url, timeout=None):
+        time.sleep(0.2)
+        return StatusResponse('Rate limit: 2\n1 slots available now.\nSlot available after: 2024-09-08T12:00:01Z, in 1 seconds.\n')
+
+
+class StatusResponse:
+    status_code = 200
+
+    def __init__(self, text):
+        self.text = text
+
+
+class SlotSchedulerTest(unittest.TestCase):
+    """Test status parsing and slot aware scheduling."""
+
+    def test_parse_status(self):
+        """Rate limit, free slots and the soonest free slot are read."""
+        self.assertEqual(parse_status(BUSY_STATUS), (2, 0, 3))
+        self.assertEqual(parse_status(FREE_STATUS), (2, 1, 3))
+        self.assertEqual(parse_status('<html>Not found</html>'), (None, 0, None))
+
+    def test_status_url(self):
+        self.assertEqual(status_url('https://overpass-api.de/api/interpreter'), 'https://overpass-api.de/api/status')
+
+    def test_requests_wait_for_slots(self):
+        """Concurrent requests are spaced out so none is rate limited."""
+        server = ThreadingHTTPServer(('127.0.0.1', 0), SlotLimitedHandler)
+        server.lock = threading.Lock()
+        server.running = False
+        server.free_at = 0
+        server.rejected = 0
+        server.answered = 0
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        url = f'http://127.0.0.1:{server.server_port}/api/interpreter'
+
+        scheduler = SlotScheduler()
+        feedback = RecordingFeedback()
+        client = OverpassClient(servers=[url], max_attempts=1, scheduler=scheduler, feedback=feedback)
+        threads = [threading.Thread(target=client.query, args=(f'node({i}); out;',)) for i in range(3)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(server.answered, 3)
+        self.assertEqual(server.rejected, 0)
+        self.assertEqual(scheduler.in_flight[url], 0)
+
+        # Waits on worker threads are only reported from the client's thread
+        self.assertEqual(feedback.messages, [])
+        client.flush_log()
+        self.assertTrue(any('queued' in message for message in feedback.messages))
+        self.assertEqual(feedback.threads, {threading.current_thread()})
+
+    def test_grants_count_against_free_slots(self):
+        """Two requests polling at once do not both take the one free slot,
+        and releases are not held up by a status poll."""
+        scheduler = SlotScheduler(session=LaggingStatusSession())
+        url = 'http://127.0.0.1/api/interpreter'
+        scheduler.in_flight[url] = 1
+        granted = []
+
+        def acquire():
+            scheduler.acquire(url)
+            granted.append(time.monotonic())
+
+        started = time.monotonic()
+        threads = [threading.Thread(target=acquire) for _ in range(2)]
+        for thread in threads:
+            thread.start()
+        time.sleep(0.05)
+        scheduler.release(url)
+        self.assertLess(time.monotonic() - started, 0.15)
+        for thread in threads:
+            thread.join()
+
+        granted.sort()
+        self.assertLess(granted[0] - started, 0.5)
+        self.assertGreaterEqual(granted[1] - started, 1)
+
+    def test_cancel_while_queued(self):
+        """Canceling the client stops its wait for a slot at once."""
+        scheduler = SlotScheduler(session=LaggingStatusSession())
+        url = 'http://127.0.0.1/api/interpreter'
+        scheduler.rate_limits[url] = 1
+        scheduler.in_flight[url] = 1
+        client = OverpassClient(servers=[url], scheduler=scheduler)
+
+        threading.Timer(0.2, client.cancel).start()
+        started = time.monotonic()
+        with self.assertRaises(OverpassCanceled):
+            client.query('node(1); out;')
+        self.assertLess(time.monotonic() - started, 1)
+        self.assertEqual(scheduler.queued, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
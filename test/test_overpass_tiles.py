@@ -0,0 +1,71 @@
+# coding=utf-8
+"""Tests for tiled Overpass fetches."""
+
+import unittest
+
+from ..overpass_client import OverpassRuntimeError
+from ..overpass_tiles import bbox_grid, fetch_tiled_elements, subdivide_bbox
+
+
+def tile_query(tile):
+    return ','.join(str(value) for value in tile)
+
+
+class TileClient:
+    """Answers tile queries with one shared element and one per tile, and
+    aborts tiles wider than max_width."""
+
+    def __init__(self, max_width):
+        self.max_width = max_width
+        self.queries = []
+
+    def stream_elements(self, query, header=None):
+        self.queries.append(query)
+        xmin, ymin, xmax, ymax = map(float, query.split(','))
+        if xmax - xmin > self.max_width:
+            raise OverpassRuntimeError('runtime error: Query timed out')
+        header['timestamp_osm_base'] = f'2024-01-{len(self.queries):02d}T00:00:00Z'
+        return iter([
+            {'type': 'way', 'id': 1, 'tags': {'aeroway': 'runway'}},
+            {'type': 'node', 'id': hash(query), 'lat': ymin, 'lon': xmin},
+        ])
+
+    def flush_log(self):
+        pass
+
+
+class OverpassTilesTest(unittest.TestCase):
+    """Test the tile grid and the tiled fetch."""
+
+    def test_grid_covers_bbox(self):
+        """Tiles are at most tile_size metres and cover the bbox exactly."""
+        bbox = (36.9, -1.35, 36.95, -1.3)
+        tiles = bbox_grid(bbox, 2000)
+        self.assertEqual(len(tiles), 9)
+        self.assertEqual(min(tile[0] for tile in tiles), bbox[0])
+        self.assertEqual(max(tile[3] for tile in tiles), bbox[3])
+        self.assertEqual(bbox_grid(bbox, 100000), [bbox])
+
+    def test_subdivide(self):
+        """Quadrants share the centre point."""
+        self.assertEqual(subdivide_bbox((0, 0, 2, 2)), [(0, 0, 1, 1), (1, 0, 2, 1), (0, 1, 1, 2), (1, 1, 2, 2)])
+
+    def test_merge_and_subdivide(self):
+        """Aborted tiles are split and shared elements are kept once."""
+        client = TileClient(max_width=0.5)
+        header = {}
+        elements = fetch_tiled_elements(client, tile_query, (0, 0, 1, 1), 10 ** 6, concurrency=2, header=header)
+        self.assertEqual(len(client.queries), 5)
+        self.assertEqual(len(elements), 5)
+        self.assertEqual(sum(element['type'] == 'way' for element in elements), 1)
+        self.assertEqual(header, {'timestamp_osm_base': '2024-01-02T00:00:00Z'})
+
+    def test_gives_up(self):
+        """Tiles still aborted at max_depth raise."""
+        client = TileClient(max_width=0.1)
+        with self.assertRaises(OverpassRuntimeError):
+            fetch_tiled_elements(client, tile_query, (0, 0, 1, 1), 10 ** 6, max_depth=1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,146 @@
+# coding=utf-8
+"""Tests for the widening engine."""
+
+import unittest
+
+from qgis.core import QgsCoordinateReferenceSystem, QgsCoordinateTransformContext, QgsDistanceArea, QgsFeature, QgsField, QgsFields, QgsGeometry, QgsRectangle, QgsWkbTypes
+from qgis.PyQt.QtCore import QVariant
+
+from .utilities import get_qgis_app
+from ..widening_engine import METRIC_CRS_AEQD, METRIC_CRS_UTM, FeatureWidth, WideningEngine, boundary_lines, connected_components, local_metric_crs, parse_width, utm_epsg
+
+QGIS_APP = get_qgis_app()
+
+
+class WideningEngineTest(unittest.TestCase):
+    """Test buffering in a metric CRS."""
+
+    def make_engine(self, distance):
+        return WideningEngine(QgsCoordinateReferenceSystem('EPSG:4326'), QgsCoordinateTransformContext(), distance, cap_style=1)
+
+    def make_feature(self, wkt):
+        feature = QgsFeature()
+        feature.setGeometry(QgsGeometry.fromWkt(wkt))
+        feature.setAttributes([wkt])
+        return feature
+
+    def test_buffer_in_metres(self):
+        """Buffers are measured in metres and returned in the output CRS."""
+        engine = self.make_engine(10)
+        buffered = engine.buffer(QgsGeometry.fromWkt('LineString (0 0, 0.01 0)'))
+        # A flat capped 20 m wide strip along a ~1113 m line
+        self.assertAlmostEqual(buffered.area() / buffered.length() * 2, 20, delta=1)
+
+        output = engine.to_output(buffered)
+        self.assertEqual(output.wkbType(), QgsWkbTypes.MultiPolygon)
+        self.assertAlmostEqual(output.boundingBox().xMaximum(), 0.01, places=6)
+
+    def test_widen_keeps_attributes(self):
+        """Every feature is widened with its attributes, or dissolved into one."""
+        engine = self.make_engine(10)
+        features = [self.make_feature('LineString (0 0, 0.01 0)'), self.make_feature('LineString (0.01 0, 0.01 0.01)')]
+
+        widened = list(engine.widen(features))
+        self.assertEqual([feature.attributes() for feature in widened], [feature.attributes() for feature in features])
+
+        dissolved = list(engine.widen(features, dissolve=True))
+        self.assertEqual(len(dissolved), 1)
+        self.assertEqual(dissolved[0].attributes(), features[0].attributes())
+        self.assertEqual(len(boundary_lines(dissolved[0].geometry())), 1)
+
+    def test_dissolve_components(self):
+        """Only buffers that touch, directly or through others, are merged."""
+        engine = self.make_engine(10)
+        features = [
+            self.make_feature('LineString (0 0, 0.01 0)'),
+            self.make_feature('LineString (1 1, 1.01 1)'),
+            self.make_feature('LineString (0.01 0.01, 0.01 0)'),
+            self.make_feature('LineString (0.01 0.01, 0.02 0.01)'),
+        ]
+        for threads in (1, 2):
+            dissolved = list(engine.widen(features, dissolve=True, threads=threads))
+            self.assertEqual([feature.attributes() for feature in dissolved], [features[0].attributes(), features[1].attributes()])
+            self.assertEqual(dissolved[0].geometry().wkbType(), QgsWkbTypes.MultiPolygon)
+            self.assertEqual(len(dissolved[0].geometry().asGeometryCollection()), 1)
+
+    def test_features_without_geometry(self):
+        """Features without a geometry are passed through, also when dissolving."""
+        engine = self.make_engine(10)
+        empty = QgsFeature()
+        empty.setAttributes(['empty'])
+        features = [self.make_feature('LineString (0 0, 0.01 0)'), empty]
+        for dissolve in (False, True):
+            widened = list(engine.widen(features, dissolve=dissolve))
+            self.assertEqual(sorted(feature.attributes() for feature in widened), sorted([features[0].attributes(), ['empty']]))
+            self.assertFalse([feature for feature in widened if feature.attributes() == ['empty']][0].hasGeometry())
+
+    def test_connected_components(self):
+        """Components are found through chains of touching geometries."""
+        geometries = [QgsGeometry.fromWkt(wkt) for wkt in (
+            'Polygon ((0 0, 1 0, 1 1, 0 1, 0 0))',
+            'Polygon ((5 5, 6 5, 6 6, 5 6, 5 5))',
+            'Polygon ((2 0, 3 0, 3 1, 2 1, 2 0))',
+            'Polygon ((1 0, 2 0, 2 1, 1 1, 1 0))',
+            'Polygon ((0.5 1.5, 0.6 1.5, 0.6 1.6, 0.5 1.5))',
+        )]
+        self.assertEqual(connected_components(geometries), [[0, 2, 3], [1], [4]])
+
+    def test_threads_keep_order(self):
+        """Buffering on a pool gives the same features in the same order."""
+        engine = self.make_engine(10)
+        features = [self.make_feature(f'LineString ({i / 1000} 0, {i / 1000} 0.001)') for i in range(1000)]
+        sequential = list(engine.widen(features))
+        parallel = list(engine.widen(features, threads=4))
+        self.assertEqual([feature.attributes() for feature in parallel], [feature.attributes() for feature in sequential])
+        self.assertTrue(all(a.geometry().equals(b.geometry()) for a, b in zip(parallel, sequential)))
+
+    def test_utm_epsg(self):
+        """UTM zones follow the longitude, the hemisphere the latitude."""
+        self.assertEqual(utm_epsg(36.9, -1.3), 32737)
+        self.assertEqual(utm_epsg(-22.6, 63.98), 32627)
+        self.assertEqual(utm_epsg(180, 0), 32660)
+
+    def test_true_width_at_high_latitude(self):
+        """A local projection buffers by true metres far from the equator."""
+        wgs84 = QgsCoordinateReferenceSystem('EPSG:4326')
+        context = QgsCoordinateTransformContext()
+        line = QgsGeometry.fromWkt('LineString (-22.62 63.98, -22.58 63.98)')
+        ellipsoid = QgsDistanceArea()
+        ellipsoid.setSourceCrs(wgs84, context)
+        ellipsoid.setEllipsoid('WGS84')
+
+        for mode in (METRIC_CRS_AEQD, METRIC_CRS_UTM):
+            metric_crs = local_metric_crs(QgsRectangle(-22.62, 63.97, -22.58, 63.99), wgs84, context, mode)
+            engine = WideningEngine(wgs84, context, 10, cap_style=1, metric_crs=metric_crs)
+            widened = engine.to_output(engine.buffer(line))
+            width = ellipsoid.measureArea(widened) / ellipsoid.measureLength(line)
+            self.assertAlmostEqual(width, 20, delta=0.5)
+
+    def test_parse_width(self):
+        """OSM width values are read in metres."""
+        self.assertEqual(parse_width('23'), 23)
+        self.assertEqual(parse_width('22.5 m'), 22.5)
+        self.assertAlmostEqual(parse_width("75'"), 22.86)
+        self.assertAlmostEqual(parse_width('75 ft'), 22.86)
+        self.assertEqual(parse_width(18), 18)
+        for value in (None, '', 'wide', '20;23'):
+            self.assertIsNone(parse_width(value))
+
+    def test_feature_width(self):
+        """Widths come from the expression, or the default without a value."""
+        fields = QgsFields()
+        fields.append(QgsField('width', QVariant.String))
+        width = FeatureWidth('"width"', 15)
+        self.assertIsNone(width.error())
+
+        for value, expected in (('23 m', 23), (None, 15), ('wide', 15), ('0', 15)):
+            feature = QgsFeature(fields)
+            feature.setAttributes([value])
+            self.assertEqual(width(feature), expected, value)
+
+        self.assertIsNotNone(FeatureWidth('"width" +', 15).error())
+        self.assertEqual(FeatureWidth('', 15)(QgsFeature(fields)), 15)
+
+
+if __name__ == '__main__':
+    unittest.main()
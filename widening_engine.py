@@ -0,0 +1,359 @@
+# -*- coding: utf-8 -*-
+
+"""
+/***************************************************************************
+ AerodromeUtilities
+                                 A QGIS plugin
+ Fetches OSM Data and processes it for aerodroms with various algorithms
+ Generated by Plugin Builder: http://g-sherman.github.io/Qgis-Plugin-Builder/
+                              -------------------
+        begin                : 2024-09-08
+        copyright            : (C) 2024 by Aiden Omondi
+        email                : helpertech83@gmail.com
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+import re
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+
+from qgis.core import (
+	QgsCoordinateReferenceSystem,
+	QgsCoordinateTransform,
+	QgsExpression,
+	QgsExpressionContext,
+	QgsFeature,
+	QgsGeometry,
+	QgsSpatialIndex,
+)
+
+# End cap styles in the order of the Buffer Cap Style parameter
+CAP_STYLES = [QgsGeometry.CapRound, QgsGeometry.CapFlat, QgsGeometry.CapSquare]
+
+# Same as the qgis:buffer defaults
+BUFFER_SEGMENTS = 5
+MITER_LIMIT = 2.0
+
+# Features per job of the buffering thread pool
+CHUNK_SIZE = 256
+
+# Metric CRS choices, in the order of the Metric CRS parameter
+METRIC_CRS_AEQD = 0
+METRIC_CRS_UTM = 1
+METRIC_CRS_WEB_MERCATOR = 2
+
+# Extent centres are rounded to this many decimals of a degree (about a
+# kilometre), so every layer of an aerodrome gets the same projection
+CENTRE_DECIMALS = 2
+
+# Transform pairs by (source, metric, output) CRS, reused across runs
+_transforms = {}
+_transforms_lock = threading.Lock()
+
+# Minimum taxiway widths of ICAO Annex 14 by aerodrome reference code
+# letter, in metres
+CODE_LETTER_WIDTHS = {
+	'A': 7.5,
+	'B': 10.5,
+	'C': 15,
+	'D': 18,
+	'E': 23,
+	'F': 25,
+}
+
+# Widths as OSM width tags hold them: metres, optionally with a unit, or feet
+WIDTH_PATTERN = re.compile(r"^\s*(\d+(?:\.\d+)?)\s*(m|ft|')?\s*$")
+FEET = 0.3048
+
+
+def utm_epsg(longitude, latitude):
+	""" EPSG code of the WGS 84 UTM zone containing a point """
+	zone = min(int((longitude + 180) / 6) + 1, 60)
+	return (32600 if latitude >= 0 else 32700) + zone
+
+
+@lru_cache(maxsize=64)
+def _aeqd_crs(longitude, latitude):
+	return QgsCoordinateReferenceSystem.fromProj(
+		f'+proj=aeqd +lat_0={latitude} +lon_0={longitude} +x_0=0 +y_0=0 +datum=WGS84 +units=m +no_defs'
+	)
+
+
+def local_metric_crs(extent, source_crs, transform_context, mode=METRIC_CRS_AEQD):
+	"""
+	Returns a metric CRS for buffering the features inside an extent of the
+	source CRS: an azimuthal equidistant projection centred on it, the UTM
+	zone of its centre, or Web Mercator.
+	"""
+	if mode == METRIC_CRS_WEB_MERCATOR:
+		return QgsCoordinateReferenceSystem('EPSG:3857')
+
+	wgs84 = QgsCoordinateReferenceSystem('EPSG:4326')
+	centre = extent.center()
+	if source_crs != wgs84:
+		centre = QgsCoordinateTransform(source_crs, wgs84, transform_context).transform(centre)
+	longitude = round(centre.x(), CENTRE_DECIMALS)
+	latitude = round(centre.y(), CENTRE_DECIMALS)
+
+	if mode == METRIC_CRS_UTM:
+		return QgsCoordinateReferenceSystem(f'EPSG:{utm_epsg(longitude, latitude)}')
+	return _aeqd_crs(longitude, latitude)
+
+
+def metric_transforms(source_crs, metric_crs, output_crs, transform_context):
+	"""
+	Returns the (source to metric, metric to output) transform pair, cached
+	per CRS triple so the layers and later runs for an aerodrome reuse it.
+	The pair is built with the transform context of its first use.
+	"""
+	key = (source_crs.toWkt(), metric_crs.toWkt(), output_crs.toWkt())
+	with _transforms_lock:
+		if key not in _transforms:
+			_transforms[key] = (
+				QgsCoordinateTransform(source_crs, metric_crs, transform_context),
+				QgsCoordinateTransform(metric_crs, output_crs, transform_context),
+			)
+		to_metric, from_metric = _transforms[key]
+	return QgsCoordinateTransform(to_metric), QgsCoordinateTransform(from_metric)
+
+
+def parse_width(value):
+	"""
+	Parses a width in metres from a number or a string like '23', '23 m',
+	'75 ft' or "75'". Returns None for missing or unparsable values.
+	"""
+	if isinstance(value, (int, float)):
+		return float(value)
+	match = WIDTH_PATTERN.match(str(value).replace(',', '.')) if value is not None else None
+	if match is None:
+		return None
+	width = float(match.group(1))
+	return width * FEET if match.group(2) in ('ft', "'") else width
+
+
+class FeatureWidth:
+	"""
+	Total width of each feature: the value of a width expression, such as
+	"width" for the OSM tag, where it parses as a positive width, otherwise
+	default_width.
+	"""
+
+	def __init__(self, expression, default_width, expression_context=None):
+		self.expression = QgsExpression(expression) if expression else None
+		self.context = expression_context or QgsExpressionContext()
+		self.default_width = default_width
+		if self.expression is not None:
+			self.expression.prepare(self.context)
+
+	def error(self):
+		""" Returns the parser error of the expression, or None """
+		if self.expression is not None and self.expression.hasParserError():
+			return self.expression.parserErrorString()
+		return None
+
+	def __call__(self, feature):
+		if self.expression is None:
+			return self.default_width
+		self.context.setFeature(feature)
+		width = parse_width(self.expression.evaluate(self.context))
+		return width if width is not None and width > 0 else self.default_width
+
+
+def connected_components(geometries):
+	"""
+	Groups geometries that touch or overlap, directly or through others.
+
+	Candidates come from a spatial index of the bounding boxes and are
+	merged with a union-find. Returns lists of geometry indexes, each in
+	ascending order, ordered by their first index.
+	"""
+	spatial_index = QgsSpatialIndex()
+	for index, geometry in enumerate(geometries):
+		spatial_index.addFeature(index, geometry.boundingBox())
+
+	parent = list(range(len(geometries)))
+
+	def find(index):
+		while parent[index] != index:
+			parent[index] = parent[parent[index]]
+			index = parent[index]
+		return index
+
+	for index, geometry in enumerate(geometries):
+		engine = None
+		for other in spatial_index.intersects(geometry.boundingBox()):
+			if other <= index or find(index) == find(other):
+				continue
+			if engine is None:
+				engine = QgsGeometry.createGeometryEngine(geometry.constGet())
+				engine.prepareGeometry()
+			if engine.intersects(geometries[other].constGet()):
+				parent[find(other)] = find(index)
+
+	components = {}
+	for index in range(len(geometries)):
+		components.setdefault(find(index), []).append(index)
+	return list(components.values())
+
+
+class WideningEngine:
+	"""
+	Buffers features by a distance in metres in a single streaming pass.
+
+	Each geometry is transformed from the source CRS to a metric CRS,
+	buffered there and transformed to the output CRS, without the
+	intermediate layers of a reproject, buffer, reproject processing chain.
+
+	With several threads, chunks of features are buffered on a thread pool,
+	where the GEOS work of the geometry calls runs without holding the GIL.
+	Results keep the input order.
+	"""
+
+	def __init__(self, source_crs, transform_context, distance, cap_style=0, metric_crs=None, output_crs=None, segments=BUFFER_SEGMENTS):
+		self.metric_crs = metric_crs or QgsCoordinateReferenceSystem('EPSG:3857')
+		self.output_crs = output_crs or QgsCoordinateReferenceSystem('EPSG:4326')
+		self.to_metric, self.from_metric = metric_transforms(source_crs, self.metric_crs, self.output_crs, transform_context)
+		self.distance = distance
+		self.cap_style = CAP_STYLES[cap_style]
+		self.segments = segments
+		self.local = threading.local()
+
+	def transforms(self):
+		""" Returns the transform pair of the calling thread """
+		if not hasattr(self.local, 'to_metric'):
+			self.local.to_metric = QgsCoordinateTransform(self.to_metric)
+			self.local.from_metric = QgsCoordinateTransform(self.from_metric)
+		return self.local.to_metric, self.local.from_metric
+
+	def buffer(self, geometry, distance=None):
+		""" Returns the buffer of a source CRS geometry, in the metric CRS """
+		geometry = QgsGeometry(geometry)
+		geometry.transform(self.transforms()[0])
+		return geometry.buffer(self.distance if distance is None else distance, self.segments, self.cap_style, QgsGeometry.JoinStyleRound, MITER_LIMIT)
+
+	def to_output(self, geometry):
+		""" Transforms a metric CRS buffer to the output CRS as a multipolygon """
+		geometry.transform(self.transforms()[1])
+		geometry.convertToMultiType()
+		return geometry
+
+	def _buffer_chunk(self, chunk, output):
+		buffers = []
+		for feature, distance in chunk:
+			if not feature.hasGeometry():
+				buffers.append(None)
+				continue
+			buffered = self.buffer(feature.geometry(), distance)
+			buffers.append(self.to_output(buffered) if output else buffered)
+		return buffers
+
+	def _chunks(self, features, feedback, total, distance):
+		# Features and their distances are read on the calling thread, as
+		# feature iterators and expression contexts are not thread safe
+		chunk = []
+		for index, feature in enumerate(features):
+			if feedback is not None:
+				if feedback.isCanceled():
+					return
+				if total:
+					feedback.setProgress(100 * index / total)
+			chunk.append((feature, distance(feature) if distance and feature.hasGeometry() else None))
+			if len(chunk) == CHUNK_SIZE:
+				yield chunk
+				chunk = []
+		if chunk:
+			yield chunk
+
+	def buffered(self, features, output=True, feedback=None, total=0, distance=None, threads=1):
+		"""
+		Yields (feature, buffer) pairs in input order, with the buffer in the
+		output CRS, or the metric CRS when output is False, and None for
+		features without a geometry. At most two chunks per thread are in
+		flight, so memory stays bounded on large layers.
+		"""
+		chunks = self._chunks(features, feedback, total, distance)
+		if threads <= 1:
+			for chunk in chunks:
+				yield from zip((feature for feature, _ in chunk), self._buffer_chunk(chunk, output))
+			return
+
+		with ThreadPoolExecutor(max_workers=threads) as executor:
+			pending = deque()
+			for chunk in chunks:
+				pending.append((chunk, executor.submit(self._buffer_chunk, chunk, output)))
+				if len(pending) < 2 * threads:
+					continue
+				chunk, future = pending.popleft()
+				yield from zip((feature for feature, _ in chunk), future.result())
+			for chunk, future in pending:
+				yield from zip((feature for feature, _ in chunk), future.result())
+
+	def widen(self, features, dissolve=False, feedback=None, total=0, distance=None, threads=1):
+		"""
+		Yields the features with their geometry buffered, in the output CRS.
+
+		distance optionally gives the buffer distance of each feature, e.g.
+		half its FeatureWidth, and threads the size of the buffering pool.
+		With dissolve, buffers that touch are merged, and each connected
+		group becomes one feature carrying the attributes of its first.
+		Features without a geometry are passed through unchanged, in input
+		order, or ahead of the dissolved features with dissolve.
+		"""
+		dissolved_features = []
+		buffers = []
+		for feature, buffered in self.buffered(features, not dissolve, feedback, total, distance, threads):
+			if buffered is None:
+				yield feature
+				continue
+
+			if dissolve:
+				dissolved_features.append(feature)
+				buffers.append(buffered)
+				continue
+
+			output = QgsFeature(feature)
+			output.setGeometry(buffered)
+			yield output
+
+		if not buffers or (feedback is not None and feedback.isCanceled()):
+			return
+
+		components = connected_components(buffers)
+		for component, dissolved in zip(components, self.dissolved(buffers, components, threads)):
+			output = QgsFeature(dissolved_features[component[0]])
+			output.setGeometry(dissolved)
+			yield output
+
+	def dissolved(self, buffers, components, threads=1):
+		"""
+		Yields the cascaded union of every component of metric CRS buffers,
+		in the output CRS, computing them on a pool with several threads.
+		"""
+		def union(component):
+			if len(component) == 1:
+				return self.to_output(QgsGeometry(buffers[component[0]]))
+			return self.to_output(QgsGeometry.unaryUnion([buffers[index] for index in component]))
+
+		if threads <= 1:
+			yield from map(union, components)
+			return
+		with ThreadPoolExecutor(max_workers=threads) as executor:
+			yield from executor.map(union, components)
+
+
+def boundary_lines(geometry):
+	"""
+	Returns the rings of a (multi)polygon as a list of single part lines.
+	"""
+	return QgsGeometry(geometry.constGet().boundary()).asGeometryCollection()